@@ -1,34 +1,142 @@
-import os, pickle
+import os, sys, pickle
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
+from utils.engagement_map_format import is_binary_engagement_map, load_engagement_map
+from utils.engagement_grid import EngagementGrid
+from utils.helper import count_rows_at_most
 
 
 class EngagementMap(object):
     def __init__(self, engagement_path):
         self.engagement_map = None
+        self.watch_time_map = None
+        self.segment_maps = None
         self.duration_axis = None
         self.bin_size = None
+        # numpy duration axis and percentile matrix of each queried (segment, metric), built at the first batch query
+        self._arrays = {}
         self.load_engagement_map(engagement_path)
 
     def load_engagement_map(self, engagement_filepath):
-        """ Load engagement map.
+        """ Load engagement map, either pickled or in binary format, with its watch time map if it has one.
+        A binary engagement map is memory-mapped, the i-th row of its percentile matrix is the i-th bin, no copy.
         """
         if not os.path.exists(engagement_filepath):
             raise Exception('no engagement file is found!')
 
-        self.engagement_map = pickle.load(open(engagement_filepath, 'rb'))
-        self.duration_axis = self.engagement_map['duration']
-        self.bin_size = len(self.engagement_map[self.engagement_map['duration'][0]])
+        if is_binary_engagement_map(engagement_filepath):
+            self.duration_axis, self.engagement_map, self.watch_time_map = load_engagement_map(engagement_filepath)
+            # all bins hold the same number of percentiles
+            self.bin_size = self.engagement_map.shape[1]
+        else:
+            self.engagement_map = pickle.load(open(engagement_filepath, 'rb'))
+            self.watch_time_map = self.engagement_map.get('watch_time')
+            self.segment_maps = self.engagement_map.get('segments')
+            self.duration_axis = self.engagement_map['duration']
+            self.bin_size = len(self.engagement_map[self.engagement_map['duration'][0]])
 
-    def query_engagement_map(self, duration, watch_percentage):
+    def query_engagement_map(self, duration, watch_percentage, segment=None):
         """ Query the engagement map for relative engagement given video length and watch percentage.
+        If segment is given, e.g., a category id, query the map of that segment in a map built with --group-by.
+        """
+        duration_axis, engagement_map, _, bin_size = self._get_segment(segment)
+        return self._query(duration_axis, engagement_map, bin_size, duration, watch_percentage)
+
+    def query_watch_time_map(self, duration, watch_time, segment=None):
+        """ Query the watch time map for relative engagement given video length and average watch time in seconds.
+        """
+        duration_axis, _, watch_time_map, bin_size = self._get_segment(segment)
+        if watch_time_map is None:
+            raise Exception('engagement map has no watch time map!')
+        return self._query(duration_axis, watch_time_map, bin_size, duration, np.log10(watch_time))
+
+    def query_batch(self, durations, watch_percentages, segment=None):
+        """ Query the engagement map for relative engagement of many videos at once, same results as
+        query_engagement_map on each video.
+        :param durations: numpy array of video lengths
+        :param watch_percentages: numpy array of watch percentages aligned with durations
+        :param segment: segment value of a map built with --group-by, default all videos
+        :return: numpy float64 array of relative engagement
+        """
+        return self._query_batch(segment, 'wp', durations, watch_percentages)
+
+    def query_watch_time_batch(self, durations, watch_times, segment=None):
+        """ Query the watch time map for relative engagement of many videos at once, same results as
+        query_watch_time_map on each video.
+        :param durations: numpy array of video lengths
+        :param watch_times: numpy array of average watch times in seconds aligned with durations
+        :param segment: segment value of a map built with --group-by, default all videos
+        :return: numpy float64 array of relative engagement
         """
+        return self._query_batch(segment, 'wt', durations, np.log10(watch_times))
+
+    def compile_grid(self, step_bits=14, segment=None):
+        """ Compile the engagement map into a dense grid for real-time scoring, see utils/engagement_grid.py.
+        :param step_bits: watch percentage cells are 2^-step_bits wide, 14 for cells of 6.1e-5
+        :param segment: segment value of a map built with --group-by, default all videos
+        :return: an EngagementGrid object, whose query is at most its max_error below query_engagement_map
+        """
+        duration_axis, percentile_matrix, _ = self._get_arrays(segment, 'wp')
+        return EngagementGrid.compile(duration_axis, percentile_matrix, step_bits=step_bits)
+
+    def _get_arrays(self, segment, metric):
+        """ Duration axis as numpy array, percentile matrix with one row per bin, and bin size.
+        """
+        if (segment, metric) not in self._arrays:
+            duration_axis, engagement_map, watch_time_map, bin_size = self._get_segment(segment)
+            percentile_map = engagement_map if metric == 'wp' else watch_time_map
+            if percentile_map is None:
+                raise Exception('engagement map has no watch time map!')
+            if isinstance(percentile_map, np.ndarray):
+                percentile_matrix = percentile_map
+            elif isinstance(percentile_map, dict):
+                percentile_matrix = np.array([percentile_map[idx] for idx in range(len(duration_axis) + 1)])
+            else:
+                percentile_matrix = np.array(percentile_map)
+            if not np.all(np.diff(percentile_matrix, axis=1) >= 0):
+                # the first percentile > value only depends on the running max of a row, which is increasing
+                percentile_matrix = np.fmax.accumulate(percentile_matrix, axis=1)
+            self._arrays[(segment, metric)] = (np.asarray(duration_axis), percentile_matrix, bin_size)
+        return self._arrays[(segment, metric)]
+
+    def _query_batch(self, segment, metric, durations, values):
+        duration_axis, percentile_matrix, bin_size = self._get_arrays(segment, metric)
+        # first bin whose split is >= duration, videos longer than all splits fall in the second last bin, and all
+        # videos in bin 0 of a map without splits, e.g., of a segment too small for two bins
+        bin_x_idx = np.minimum(np.searchsorted(duration_axis, np.asarray(durations), side='left'),
+                               max(len(duration_axis) - 1, 0))
+        # index of the first percentile > value in its bin, i.e., number of percentiles <= value as rows are increasing
+        values = np.asarray(values)
+        lower = count_rows_at_most(percentile_matrix, bin_x_idx, values, is_increasing=True)
+        # no percentile is > NaN, as in _query
+        return np.where((lower == percentile_matrix.shape[1]) | np.isnan(values), 1, lower / bin_size)
+
+    def _get_segment(self, segment):
+        """ Duration axis, engagement map, watch time map and bin size of all videos or of one segment.
+        """
+        if segment is None:
+            return self.duration_axis, self.engagement_map, self.watch_time_map, self.bin_size
+        if self.segment_maps is None or segment not in self.segment_maps:
+            raise Exception('no engagement map of segment {0} is found!'.format(segment))
+        segment_map = self.segment_maps[segment]
+        return segment_map['duration'], segment_map, segment_map.get('watch_time'), len(segment_map[0])
+
+    @staticmethod
+    def _query(duration_axis, percentile_map, bin_size, duration, value):
         try:
-            bin_x_idx = next(idx for idx, length in enumerate(self.duration_axis) if length >= duration)
+            bin_x_idx = next(idx for idx, length in enumerate(duration_axis) if length >= duration)
         except StopIteration:
-            bin_x_idx = len(self.duration_axis) - 1
+            # videos longer than all splits fall in the second last bin, all videos in bin 0 of a map without splits,
+            # e.g., of a segment too small for two bins
+            bin_x_idx = max(len(duration_axis) - 1, 0)
 
-        correspond_watch_percentage = self.engagement_map[bin_x_idx]
+        correspond_watch_percentage = percentile_map[bin_x_idx]
+        if isinstance(correspond_watch_percentage, np.ndarray):
+            # compare in the dtype of the map, float32 for a float32 binary map, as _query_batch does
+            value = correspond_watch_percentage.dtype.type(value)
         try:
-            relative_engagement = next(y for y, val in enumerate(correspond_watch_percentage) if val > watch_percentage) / self.bin_size
+            relative_engagement = next(y for y, val in enumerate(correspond_watch_percentage) if val > value) / bin_size
         except StopIteration:
             relative_engagement = 1
         return relative_engagement
@@ -1,4 +1,5 @@
 import random
+import numpy as np
 from engagement_map import EngagementMap
 
 engagement_path = '../data/engagement_map.p'
@@ -8,3 +9,13 @@ for _ in range(10):
     length = 10 ** (5 * random.random())
     wp30 = random.random()
     print('relative engagement for video with length {0:.0f} seconds and {1:.2f} watch percentage is {2:.2f}'.format(length, wp30, engagement_map.query_engagement_map(length, wp30)))
+
+# query many videos in one call
+lengths = [10 ** (5 * random.random()) for _ in range(100000)]
+wp30s = [random.random() for _ in range(100000)]
+relative_engagements = engagement_map.query_batch(np.array(lengths), np.array(wp30s))
+print('mean relative engagement of {0} random videos is {1:.2f}'.format(len(lengths), relative_engagements.mean()))
+
+# compile into a dense grid for real-time scoring, each query is a lookup at most grid.max_error below the exact score
+grid = engagement_map.compile_grid()
+print('grid relative engagement of the first video is {0:.3f}, max error {1:.4f}'.format(grid.query(lengths[0], wp30s[0]), grid.max_error))
@@ -18,6 +18,7 @@ import numpy as np
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
 from utils.helper import Timer, write_dict_to_pickle
 from utils.ridge_regressor import RidgeRegressor
+from utils.vid_codec import encode_vids
 
 
 if __name__ == '__main__':
@@ -143,7 +144,7 @@ if __name__ == '__main__':
                     # predict test data from customized ridge regressor
                     test_yhat = RidgeRegressor(train_matrix, test_matrix, verbose=False).predict()
 
-                    predict_result_dict.update({vid: pred for vid, pred in zip(test_vids, test_yhat)})
+                    predict_result_dict.update({vid: pred for vid, pred in zip(encode_vids(test_vids).tolist(), test_yhat)})
 
     timer.stop()
 
@@ -33,6 +33,17 @@ import pandas as pd
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
 from utils.helper import Timer
+from utils.vid_codec import encode_vids, decode_vids
+
+
+def load_predictor(path):
+    """ Load a predictor pickle of {vid: value}, keyed by int64 codes of video ids.
+    Pickles keyed by video id strings are converted, so outputs of earlier runs can still be merged.
+    """
+    predictor = pickle.load(open(path, 'rb'))
+    if len(predictor) > 0 and isinstance(next(iter(predictor)), str):
+        predictor = dict(zip(encode_vids(list(predictor.keys())).tolist(), predictor.values()))
+    return predictor
 
 
 if __name__ == '__main__':
@@ -75,35 +86,35 @@ if __name__ == '__main__':
         test_duration_path = os.path.join(input_dir, 'test_duration.p')
 
         # ground-truth values
-        true_dict = pickle.load(open(true_dict_path, 'rb'))
+        true_dict = load_predictor(true_dict_path)
         vids = true_dict.keys()
 
         # duration predictor
-        duration_predictor = pickle.load(open(duration_predictor_path, 'rb'))
+        duration_predictor = load_predictor(duration_predictor_path)
 
         # context predictor
-        context_predictor = pickle.load(open(context_predictor_path, 'rb'))
+        context_predictor = load_predictor(context_predictor_path)
 
         # topic predictor
-        topic_predictor = pickle.load(open(topic_predictor_path, 'rb'))
+        topic_predictor = load_predictor(topic_predictor_path)
         for vid in vids:
             if vid not in topic_predictor:
                 topic_predictor[vid] = duration_predictor[vid]
 
         # context topic predictor
-        context_topic_predictor = pickle.load(open(context_topic_predictor_path, 'rb'))
+        context_topic_predictor = load_predictor(context_topic_predictor_path)
         for vid in vids:
             if vid not in context_topic_predictor:
                 context_topic_predictor[vid] = context_predictor[vid]
 
         # channel reputation predictor
-        channel_reputation_predictor = pickle.load(open(channel_reputation_predictor_path, 'rb'))
+        channel_reputation_predictor = load_predictor(channel_reputation_predictor_path)
         for vid in vids:
             if vid not in channel_reputation_predictor:
                 channel_reputation_predictor[vid] = duration_predictor[vid]
 
         # all features predictor
-        all_predictor = pickle.load(open(all_predictor_path, 'rb'))
+        all_predictor = load_predictor(all_predictor_path)
         for vid in vids:
             if vid not in all_predictor:
                 if not channel_reputation_predictor[vid] == duration_predictor[vid]:
@@ -112,15 +123,15 @@ if __name__ == '__main__':
                     all_predictor[vid] = context_topic_predictor[vid]
 
         # channel specific predictor
-        channel_specific_predictor = pickle.load(open(channel_specific_predictor_path, 'rb'))
+        channel_specific_predictor = load_predictor(channel_specific_predictor_path)
         for vid in vids:
             if vid not in channel_specific_predictor:
                 channel_specific_predictor[vid] = all_predictor[vid]
 
         # test duration
-        test_duration = pickle.load(open(test_duration_path, 'rb'))
+        test_duration = load_predictor(test_duration_path)
 
-        # generate pandas dataframe
+        # generate pandas dataframe, merge on int64 codes of video ids rather than strings
         true_data_f = pd.DataFrame(list(true_dict.items()), columns=['Vid', 'True'])
         duration_data_f = pd.DataFrame(list(duration_predictor.items()), columns=['Vid', 'Duration'])
         context_data_f = pd.DataFrame(list(context_predictor.items()), columns=['Vid', 'Context'])
@@ -142,6 +153,7 @@ if __name__ == '__main__':
         for name in ['True', 'Duration', 'Context', 'Topic', 'CTopic', 'Reputation', 'All', 'CSP']:
             data_f[name] = data_f[name].where(data_f[name] < 1, 1)
             data_f[name] = data_f[name].where(data_f[name] > 0, 0)
+        data_f['Vid'] = decode_vids(data_f['Vid'].values)
         data_f.to_csv(output_path, sep='\t')
 
         print('header:')
@@ -18,6 +18,7 @@ import numpy as np
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
 from utils.helper import Timer, write_dict_to_pickle
 from utils.ridge_regressor import RidgeRegressor
+from utils.vid_codec import encode_vids
 
 
 def _load_data(filepath, is_re):
@@ -119,7 +120,7 @@ if __name__ == '__main__':
 
     # write to pickle file
     to_write = True
-    predict_result_dict = {vid: pred for vid, pred in zip(test_vids, test_yhat)}
+    predict_result_dict = {vid: pred for vid, pred in zip(encode_vids(test_vids).tolist(), test_yhat)}
     if to_write:
         print('>>> Prepare to write to pickle file...')
         print('>>> Number of videos in final test result dict: {0}'.format(len(predict_result_dict)))
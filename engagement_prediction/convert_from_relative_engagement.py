@@ -19,7 +19,7 @@ from sklearn.metrics import mean_absolute_error, r2_score
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
 from utils.helper import Timer
-from utils.converter import to_watch_percentage
+from utils.converter import to_watch_percentage_array, get_lookup_matrix
 
 
 if __name__ == '__main__':
@@ -36,6 +36,7 @@ if __name__ == '__main__':
 
     engagement_map = pickle.load(open(engagement_map_loc, 'rb'))
     split_keys = np.array(engagement_map['duration'])
+    lookup_matrix = get_lookup_matrix(engagement_map, split_keys)
 
     # load pandas dataframe if exists
     re_dataframe_path = './output/predicted_re_df.csv'
@@ -60,7 +61,8 @@ if __name__ == '__main__':
         mae_list.append(mean_absolute_error(wp_data_f['True'], wp_data_f[name]))
         r2_list.append(r2_score(wp_data_f['True'], wp_data_f[name]))
 
-        converted_wp = to_watch_percentage(engagement_map, re_data_f['VDuration'].tolist(), re_data_f[name].tolist(), lookup_keys=split_keys)
+        converted_wp = to_watch_percentage_array(engagement_map, re_data_f['VDuration'].values, re_data_f[name].values,
+                                                 lookup_keys=split_keys, lookup_matrix=lookup_matrix)
         mae_list.append(mean_absolute_error(wp_data_f['True'], converted_wp))
         r2_list.append(r2_score(wp_data_f['True'], converted_wp))
 
@@ -18,7 +18,8 @@ from sklearn.metrics import mean_absolute_error, r2_score
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
 from utils.helper import Timer, write_dict_to_pickle
-from utils.converter import to_watch_percentage
+from utils.converter import to_watch_percentage_array
+from utils.vid_codec import encode_vids
 
 
 if __name__ == '__main__':
@@ -29,7 +30,6 @@ if __name__ == '__main__':
     test_vids = []
     test_duration = []
     true_engagement = []
-    guess_engagement = []
 
     # == == == == == == == == Part 2: Load dataset == == == == == == == == #
     parser = argparse.ArgumentParser()
@@ -82,11 +82,14 @@ if __name__ == '__main__':
                     test_duration.append(duration)
                     target = float([wp30, re30][is_re])
                     true_engagement.append(target)
-                    random_guess = 0.5
-                    if is_re:
-                        guess_engagement.append(random_guess)
-                    else:
-                        guess_engagement.append(to_watch_percentage(engagement_map, duration, random_guess, lookup_keys=split_keys))
+
+    # the same random guess for all videos, converted to watch percentage of each duration at once
+    random_guess = 0.5
+    if is_re:
+        guess_engagement = [random_guess] * len(test_duration)
+    else:
+        guess_engagement = list(to_watch_percentage_array(engagement_map, np.array(test_duration, dtype=np.int64),
+                                                          random_guess, lookup_keys=split_keys))
 
     print('>>> Predict {0} on duration...'.format(['watch percentage', 'relative engagement'][is_re]))
     print('>>> MAE on test set: {0:.4f}'.format(mean_absolute_error(true_engagement, guess_engagement)))
@@ -97,9 +100,11 @@ if __name__ == '__main__':
 
     # write to pickle file
     to_write = True
-    true_result_dict = {vid: true for vid, true in zip(test_vids, true_engagement)}
-    predict_result_dict = {vid: pred for vid, pred in zip(test_vids, guess_engagement)}
-    test_duration_dict = {vid: duration for vid, duration in zip(test_vids, test_duration)}
+    # results are keyed by int64 codes of video ids
+    test_vid_codes = encode_vids(test_vids).tolist()
+    true_result_dict = {vid: true for vid, true in zip(test_vid_codes, true_engagement)}
+    predict_result_dict = {vid: pred for vid, pred in zip(test_vid_codes, guess_engagement)}
+    test_duration_dict = {vid: duration for vid, duration in zip(test_vid_codes, test_duration)}
     if to_write:
         print('>>> Prepare to write to pickle file...')
         print('>>> Number of videos in final test result dict: {0}'.format(len(test_vids)))
@@ -9,7 +9,6 @@ Time: ~8M
 
 import os, sys, platform
 import numpy as np
-from collections import defaultdict
 from scipy.stats import gaussian_kde
 
 import matplotlib as mpl
@@ -23,6 +22,7 @@ from matplotlib.ticker import FuncFormatter
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
 from utils.helper import Timer, exponent_fmt
+from utils.engagement_map_builder import EngagementMapBuilder
 
 
 def get_engagement_stats_from_file(filepath):
@@ -30,10 +30,8 @@ def get_engagement_stats_from_file(filepath):
         fin.readline()
         for line in fin:
             _, _, duration, _, _, _, _, _, view, _, wp30, _ = line.split('\t', 11)
-            duration = int(duration)
-            wp30 = float(wp30)
-            duration_engagement_tuple.append((duration, wp30, np.log10(duration * wp30)))
-            duration_cnt_dict[duration] += 1
+            duration_list.append(int(duration))
+            wp30_list.append(float(wp30))
 
 
 def plot_contour(x_axis_value, color='r', fsize=14, title=False):
@@ -62,8 +60,8 @@ if __name__ == '__main__':
     timer.start()
 
     bin_number = 1000
-    duration_engagement_tuple = []
-    duration_cnt_dict = defaultdict(int)
+    duration_list = []
+    wp30_list = []
 
     # == == == == == == == == Part 2: Load dataset == == == == == == == == #
     input_loc = '../data/formatted_tweeted_videos'
@@ -78,36 +76,19 @@ if __name__ == '__main__':
     print('>>> Finish loading all data!')
 
     # == == == == == == == == Part 3: Build wp matrix based on duration splits == == == == == == == == #
-    # sort by duration in ascent order
-    sorted_duration_engagement_tuple = sorted(duration_engagement_tuple, key=lambda x: x[0])
+    durations = np.array(duration_list)
+    wp30s = np.array(wp30_list)
+    wt30s = np.log10(durations * wp30s)
 
     # get duration split point
-    duration_list = sorted(duration_cnt_dict.keys())
-    even_split_points = list(np.linspace(1, 5, bin_number))
-
-    # put videos in correct bins
-    wp_bin_matrix = []
-    wp_individual_bin = []
-    wt_bin_matrix = []
-    wt_individual_bin = []
-    bin_idx = 0
-    duration_splits = []
-    # put dur-wp tuple in the correct bin
-    for duration, wp30, wt30 in sorted_duration_engagement_tuple:
-        if np.log10(duration) > even_split_points[bin_idx]:
-            bin_idx += 1
-            # must contains at least 50 videos
-            if len(wp_individual_bin) >= 50:
-                wp_bin_matrix.append(wp_individual_bin)
-                wp_individual_bin = []
-                wt_bin_matrix.append(wt_individual_bin)
-                wt_individual_bin = []
-                duration_splits.append(duration - 1)
-        wp_individual_bin.append(wp30)
-        wt_individual_bin.append(wt30)
-    if len(wp_individual_bin) > 0:
-        wp_bin_matrix.append(np.array(wp_individual_bin))
-        wt_bin_matrix.append(np.array(wt_individual_bin))
+    even_split_points = np.linspace(1, 5, bin_number)
+
+    # sort by duration, put videos in bins of at least 50 videos
+    builder = EngagementMapBuilder(durations, even_split_points)
+    bin_offsets = builder.get_bin_offsets(min_bin_size=50)
+    wp_bin_matrix = builder.get_bins(wp30s, bin_offsets)
+    wt_bin_matrix = builder.get_bins(wt30s, bin_offsets)
+    duration_splits = builder.get_duration_splits(bin_offsets)
 
     # == == == == == == == == Part 4: Plot engagement map == == == == == == == == #
     cornflower_blue = '#6495ed'
@@ -140,10 +121,10 @@ if __name__ == '__main__':
         ax1.tick_params(axis='both', which='major', labelsize=20)
 
         # KDE for top marginal
-        df_x = [np.log10(x[0]) for x in duration_engagement_tuple]
+        df_x = np.log10(durations)
         kde_x = gaussian_kde(df_x)
         # KDE for right marginal
-        df_y = [x[1] for x in duration_engagement_tuple]
+        df_y = wp30s
         kde_y = gaussian_kde(df_y)
 
         xmin, xmax = 1, 5
@@ -219,10 +200,10 @@ if __name__ == '__main__':
         plt.setp(ax1.yaxis.get_majorticklabels(), rotation=90)
 
         # KDE for top marginal
-        df_x = [np.log10(x[0]) for x in duration_engagement_tuple]
+        df_x = np.log10(durations)
         kde_x = gaussian_kde(df_x)
         # KDE for right marginal
-        df_y = [x[2] for x in duration_engagement_tuple]
+        df_y = wt30s
         kde_y = gaussian_kde(df_y)
 
         xmin, xmax = 1, 5
@@ -9,7 +9,6 @@ Time: ~1M
 
 import os, sys, platform
 import numpy as np
-from collections import defaultdict
 from scipy.stats import gaussian_kde
 
 import matplotlib as mpl
@@ -23,19 +22,18 @@ from matplotlib.ticker import FuncFormatter
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
 from utils.helper import Timer, exponent_fmt
+from utils.engagement_map_builder import EngagementMapBuilder
 
 
-def get_duration_wp_from_file(filepath, duration_wp_tuple, duration_stats_dict):
+def get_duration_wp_from_file(filepath, duration_list, wp30_list):
     with open(filepath, 'r') as fin:
         fin.readline()
         for line in fin:
             _, _, duration, dump = line.rstrip().split('\t', 3)
             _, _, _, _, _, view30, _, wp30, _ = dump.split('\t', 8)
-            duration = int(duration)
-            wp30 = float(wp30)
             if int(view30) >= 100:
-                duration_wp_tuple.append((duration, wp30))
-                duration_stats_dict[duration] += 1
+                duration_list.append(int(duration))
+                wp30_list.append(float(wp30))
 
 
 def remove_bad_bins(x_axis, bin_matrix, min_bin=25):
@@ -52,8 +50,8 @@ def remove_bad_bins(x_axis, bin_matrix, min_bin=25):
 
 def loading_data(input_loc, bin_number, min_bin):
     # setting parameters
-    duration_wp_tuple = []
-    duration_stats_dict = defaultdict(int)
+    duration_list = []
+    wp30_list = []
 
     # load dataset
     if os.path.isdir(input_loc):
@@ -62,31 +60,20 @@ def loading_data(input_loc, bin_number, min_bin):
                 # get tweeted music videos
                 if f.startswith('news'):
                     print('>>> Start to load data: {0}...!'.format(f))
-                    get_duration_wp_from_file(os.path.join(subdir, f), duration_wp_tuple, duration_stats_dict)
+                    get_duration_wp_from_file(os.path.join(subdir, f), duration_list, wp30_list)
     else:
         print('>>> Start to load data: {0}...!'.format(input_loc))
-        get_duration_wp_from_file(input_loc, duration_wp_tuple, duration_stats_dict)
+        get_duration_wp_from_file(input_loc, duration_list, wp30_list)
 
-    # sort by duration in ascent order
-    sorted_duration_wp_tuple = sorted(duration_wp_tuple, key=lambda x: x[0])
+    durations = np.array(duration_list)
+    wp30s = np.array(wp30_list)
 
     # get duration split point
     x_axis = list(np.linspace(xmin, xmax, bin_number))
 
-    # put videos in correct bins
-    bin_matrix = []
-    bin_list = []
-    bin_idx = 0
-    # put dur-wp tuple in the correct bin
-    for item in sorted_duration_wp_tuple:
-        if np.log10(item[0]) > x_axis[bin_idx]:
-            bin_matrix.append(bin_list)
-            bin_idx += 1
-            bin_list = []
-        bin_list.append(item[1])
-    if len(bin_list) > 0:
-        bin_matrix.append(bin_list)
-    bin_matrix = [np.array(x) for x in bin_matrix]
+    # sort by duration, close a bin each time videos pass a split point
+    builder = EngagementMapBuilder(durations, x_axis)
+    bin_matrix = builder.get_bins(wp30s, builder.get_bin_offsets())
 
     x_axis, bin_matrix = remove_bad_bins(x_axis, bin_matrix, min_bin)
 
@@ -97,7 +84,7 @@ def loading_data(input_loc, bin_number, min_bin):
         for i in range(len(x_axis)):
             print('duration split point: {0}; number of videos in bin: {1}'.format(x_axis[i], len(bin_matrix[i])))
         print('num of bins: {0}'.format(len(x_axis)))
-    return x_axis, bin_matrix, duration_wp_tuple
+    return x_axis, bin_matrix, (durations, wp30s)
 
 
 if __name__ == '__main__':
@@ -159,15 +146,15 @@ if __name__ == '__main__':
         ax1.legend([plt.Rectangle((0, 0), 1, 1, fc=cornflower_blue), plt.Rectangle((0, 0), 1, 1, fc=tomato)],
                    ['Tweeted News', 'Top News'], loc='upper right', fontsize=24, frameon=False)
 
-        tweeted_df_x = [np.log10(x[0]) for x in tweeted_tuple]
-        tweeted_df_y = [x[1] for x in tweeted_tuple]
+        tweeted_df_x = np.log10(tweeted_tuple[0])
+        tweeted_df_y = tweeted_tuple[1]
         # KDE for top marginal
         tweeted_kde_x = gaussian_kde(tweeted_df_x)
         # KDE for right marginal
         tweeted_kde_y = gaussian_kde(tweeted_df_y)
 
-        quality_df_x = [np.log10(x[0]) for x in quality_tuple]
-        quality_df_y = [x[1] for x in quality_tuple]
+        quality_df_x = np.log10(quality_tuple[0])
+        quality_df_y = quality_tuple[1]
         # KDE for top marginal
         quality_kde_x = gaussian_kde(quality_df_x)
         # KDE for right marginal
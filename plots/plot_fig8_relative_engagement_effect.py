@@ -19,7 +19,7 @@ import matplotlib.pyplot as plt
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
 from utils.helper import Timer
-from utils.converter import to_watch_percentage
+from utils.converter import to_watch_percentage_array
 
 
 def build_reputation_features(arr):
@@ -98,9 +98,7 @@ if __name__ == '__main__':
     ax1.plot(x_axis, y_axis_wp_direct, 'b--', label=r'Predict $\bar \mu_{30}$ directly')
 
     y_axis_re_direct = [predict(x, re_reputation_features, re_model_params) for x in x_axis]
-    y_axis_wp_converted = []
-    for x, y in zip(x_axis, y_axis_re_direct):
-        y_axis_wp_converted.append(to_watch_percentage(engagement_map, x, y, lookup_keys=split_keys))
+    y_axis_wp_converted = to_watch_percentage_array(engagement_map, x_axis, y_axis_re_direct, lookup_keys=split_keys)
     ax1.plot(x_axis, y_axis_wp_converted, 'r', label=r'Predict $\bar \eta_{30}$ then map to $\bar \mu_{30}$')
 
     ax1.set_ylabel('average watch percentage $\\bar \mu_{30}$', fontsize=14)
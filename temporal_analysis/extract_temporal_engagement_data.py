@@ -11,27 +11,33 @@ import os, sys, argparse
 import numpy as np
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
-from utils.helper import Timer, read_as_int_array, read_as_float_array
+from utils.helper import Timer, read_as_ragged_array, iter_batches
 
 
-def extract_engagement_data_from_file(filepath, age, handles, threshold=100):
+def extract_engagement_data_from_file(filepath, age, handles, threshold=100, batch_size=100000):
     with open(filepath, 'r') as fin:
         fin.readline()
-        for line in fin:
-            vid, _, duration, _, category, _, _, _, _, _, _, days, daily_view, daily_watch = line.rstrip().split('\t')
-            duration = int(duration)
-            days = read_as_int_array(days, delimiter=',', truncated=age)
-            daily_view = read_as_int_array(daily_view, delimiter=',', truncated=age)
-            daily_watch = read_as_float_array(daily_watch, delimiter=',', truncated=age)
-            for i in range(age):
-                views = np.sum(daily_view[days <= i])
-                watches = np.sum(daily_watch[days <= i])
-                if views >= threshold:
-                    watch_time = watches * 60 / views
-                    if watch_time > duration:
-                        watch_time = duration
-                    watch_percentage = watch_time / duration
-                    handles[i].write('{0},{1},{2},{3},{4}\n'.format(vid, category, duration, watch_percentage, watch_time))
+        for lines in iter_batches(fin, batch_size):
+            records = [line.rstrip().split('\t') for line in lines]
+            # parse attention dynamics of the whole batch at once, the j-th video is in [offsets[j], offsets[j+1])
+            days_values, offsets = read_as_ragged_array([record[11] for record in records], np.uint32, truncated=age)
+            daily_view_values, _ = read_as_ragged_array([record[12] for record in records], np.uint32, truncated=age)
+            daily_watch_values, _ = read_as_ragged_array([record[13] for record in records], np.float64, truncated=age)
+            for j, record in enumerate(records):
+                vid, _, duration, _, category = record[:5]
+                duration = int(duration)
+                days = days_values[offsets[j]: offsets[j + 1]]
+                daily_view = daily_view_values[offsets[j]: offsets[j + 1]]
+                daily_watch = daily_watch_values[offsets[j]: offsets[j + 1]]
+                for i in range(age):
+                    views = np.sum(daily_view[days <= i])
+                    watches = np.sum(daily_watch[days <= i])
+                    if views >= threshold:
+                        watch_time = watches * 60 / views
+                        if watch_time > duration:
+                            watch_time = duration
+                        watch_percentage = watch_time / duration
+                        handles[i].write('{0},{1},{2},{3},{4}\n'.format(vid, category, duration, watch_percentage, watch_time))
 
 
 if __name__ == '__main__':
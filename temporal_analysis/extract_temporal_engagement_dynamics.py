@@ -13,64 +13,100 @@ import os, sys, pickle, argparse
 import numpy as np
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
-from utils.converter import to_relative_engagement
-from utils.helper import Timer, read_as_int_array, read_as_float_array, strify
-
-
-def extract_engagement_dynamics_from_file(filepath, engagement_map_series, split_key_series, window_size, min_view=100):
+from utils.converter import to_relative_engagement_array, get_lookup_matrix
+from utils.helper import Timer, read_as_ragged_array, iter_batches, strify
+
+
+def get_relative_engagement_lists(durations, dynamics, engagement_map_series, split_key_series, lookup_matrix_series):
+    """ Convert watch percentages of all videos in a batch to relative engagement, with one array call per day.
+    :param durations: numpy array of video durations in the batch
+    :param dynamics: list of (day list, watch percentage list) of each video in the batch
+    :return: list of relative engagement lists of each video
+    """
+    counts = [len(day_list) for day_list, _ in dynamics]
+    video_idx = np.repeat(np.arange(len(dynamics)), counts)
+    days = np.array([day for day_list, _ in dynamics for day in day_list], dtype=np.int64)
+    wps = np.array([wp for _, wp_list in dynamics for wp in wp_list], dtype=np.float64)
+    res = np.zeros(len(wps))
+    for i in np.unique(days):
+        is_day = days == i
+        res[is_day] = to_relative_engagement_array(engagement_map_series[i], durations[video_idx[is_day]], wps[is_day],
+                                                   lookup_keys=split_key_series[i],
+                                                   lookup_matrix=lookup_matrix_series[i])
+    ends = np.cumsum(counts)
+    return [list(res[end - count: end]) for count, end in zip(counts, ends)]
+
+
+def extract_engagement_dynamics_from_file(filepath, engagement_map_series, split_key_series, lookup_matrix_series,
+                                          window_size, min_view=100, batch_size=100000):
     age = len(engagement_map_series)
     with open(filepath, 'r') as fin:
         fin.readline()
-        for line in fin:
-            vid, _, duration, _, _, _, _, _, _, _, _, days, daily_view, daily_watch = line.rstrip().split('\t')
-            duration = int(duration)
-            days = read_as_int_array(days, delimiter=',', truncated=age)
-            daily_view = read_as_int_array(daily_view, delimiter=',', truncated=age)
-            daily_watch = read_as_float_array(daily_watch, delimiter=',', truncated=age)
-            cum_day_list = []
-            cum_wp_list = []
-            cum_re_list = []
-            sliding_day_list = []
-            sliding_wp_list = []
-            sliding_re_list = []
-            for i in range(age):
-                # cumulative watch percentage and relative engagement
-                cum_views = np.sum(daily_view[days <= i])
-                cum_watches = np.sum(daily_watch[days <= i])
-                if cum_views >= min_view:
-                    cum_wp = cum_watches * 60 / cum_views / duration
-                    if cum_wp > 1:
-                        cum_wp = 1
-                    cum_re = to_relative_engagement(engagement_map_series[i], duration, cum_wp, lookup_keys=split_key_series[i])
-                    cum_day_list.append(i)
-                    cum_wp_list.append(cum_wp)
-                    cum_re_list.append(cum_re)
-
-                # sliding window watch percentage and relative engagement
-                if i < window_size:
-                    sliding_views = np.sum(daily_view[days <= i])
-                    sliding_watches = np.sum(daily_watch[days <= i])
-                else:
-                    sliding_views = np.sum(daily_view[(i - window_size < days) & (days <= i)])
-                    sliding_watches = np.sum(daily_watch[(i - window_size < days) & (days <= i)])
-                if sliding_views >= min_view:
-                    sliding_wp = sliding_watches * 60 / sliding_views / duration
-                    if sliding_wp > 1:
-                        sliding_wp = 1
-                    sliding_re = to_relative_engagement(engagement_map_series[i], duration, sliding_wp, lookup_keys=split_key_series[i])
-                    sliding_day_list.append(i)
-                    sliding_wp_list.append(sliding_wp)
-                    sliding_re_list.append(sliding_re)
-
-            # write to output files
-            if len(cum_day_list) > 0:
-                cum_output.write('{0}\t{1}\t{2}\t{3}\n'.format(vid, strify(cum_day_list, delimiter=','),
-                                                               strify(cum_wp_list, delimiter=','),
-                                                               strify(cum_re_list, delimiter=',')))
-            if len(sliding_day_list) > 0:
-                sliding_output.write('{0}\t{1}\t{2}\t{3}\n'.format(vid, strify(sliding_day_list, delimiter=','),
-                                                                   strify(sliding_wp_list, delimiter=','),
-                                                                   strify(sliding_re_list, delimiter=',')))
+        for lines in iter_batches(fin, batch_size):
+            records = [line.rstrip().split('\t') for line in lines]
+            # parse attention dynamics of the whole batch at once, the j-th video is in [offsets[j], offsets[j+1])
+            days_values, offsets = read_as_ragged_array([record[11] for record in records], np.uint32, truncated=age)
+            daily_view_values, _ = read_as_ragged_array([record[12] for record in records], np.uint32, truncated=age)
+            daily_watch_values, _ = read_as_ragged_array([record[13] for record in records], np.float64, truncated=age)
+            durations = np.array([int(record[2]) for record in records])
+            cum_dynamics = []
+            sliding_dynamics = []
+            for j, record in enumerate(records):
+                duration = int(record[2])
+                days = days_values[offsets[j]: offsets[j + 1]]
+                daily_view = daily_view_values[offsets[j]: offsets[j + 1]]
+                daily_watch = daily_watch_values[offsets[j]: offsets[j + 1]]
+                cum_day_list = []
+                cum_wp_list = []
+                sliding_day_list = []
+                sliding_wp_list = []
+                for i in range(age):
+                    # cumulative watch percentage and relative engagement
+                    cum_views = np.sum(daily_view[days <= i])
+                    cum_watches = np.sum(daily_watch[days <= i])
+                    if cum_views >= min_view:
+                        cum_wp = cum_watches * 60 / cum_views / duration
+                        if cum_wp > 1:
+                            cum_wp = 1
+                        cum_day_list.append(i)
+                        cum_wp_list.append(cum_wp)
+
+                    # sliding window watch percentage and relative engagement
+                    if i < window_size:
+                        sliding_views = np.sum(daily_view[days <= i])
+                        sliding_watches = np.sum(daily_watch[days <= i])
+                    else:
+                        sliding_views = np.sum(daily_view[(i - window_size < days) & (days <= i)])
+                        sliding_watches = np.sum(daily_watch[(i - window_size < days) & (days <= i)])
+                    if sliding_views >= min_view:
+                        sliding_wp = sliding_watches * 60 / sliding_views / duration
+                        if sliding_wp > 1:
+                            sliding_wp = 1
+                        sliding_day_list.append(i)
+                        sliding_wp_list.append(sliding_wp)
+
+                cum_dynamics.append((cum_day_list, cum_wp_list))
+                sliding_dynamics.append((sliding_day_list, sliding_wp_list))
+
+            # relative engagement of the whole batch, then write to output files
+            cum_re_lists = get_relative_engagement_lists(durations, cum_dynamics, engagement_map_series,
+                                                         split_key_series, lookup_matrix_series)
+            sliding_re_lists = get_relative_engagement_lists(durations, sliding_dynamics, engagement_map_series,
+                                                             split_key_series, lookup_matrix_series)
+            for j, record in enumerate(records):
+                vid = record[0]
+                cum_day_list, cum_wp_list = cum_dynamics[j]
+                sliding_day_list, sliding_wp_list = sliding_dynamics[j]
+                cum_re_list = cum_re_lists[j]
+                sliding_re_list = sliding_re_lists[j]
+                if len(cum_day_list) > 0:
+                    cum_output.write('{0}\t{1}\t{2}\t{3}\n'.format(vid, strify(cum_day_list, delimiter=','),
+                                                                   strify(cum_wp_list, delimiter=','),
+                                                                   strify(cum_re_list, delimiter=',')))
+                if len(sliding_day_list) > 0:
+                    sliding_output.write('{0}\t{1}\t{2}\t{3}\n'.format(vid, strify(sliding_day_list, delimiter=','),
+                                                                       strify(sliding_wp_list, delimiter=','),
+                                                                       strify(sliding_re_list, delimiter=',')))
 
 
 if __name__ == '__main__':
@@ -84,6 +120,7 @@ if __name__ == '__main__':
     min_view = 100
     engagement_map_series = []
     split_key_series = []
+    lookup_matrix_series = []
 
     cmu_engagement_dynamics = {}
     sliding_engagement_dynamics = {}
@@ -108,12 +145,14 @@ if __name__ == '__main__':
         split_keys = engagement_map['duration']
         engagement_map_series.append(engagement_map)
         split_key_series.append(split_keys)
+        lookup_matrix_series.append(get_lookup_matrix(engagement_map, split_keys))
 
     # == == == == == == == == Part 3: Extract cumulative and sliding windows engagement == == == == == == == == #
     for subdir, _, files in os.walk(input_dir):
         for f in files:
             print('>>> Start to extract data: {0}...'.format(os.path.join(subdir, f)))
-            extract_engagement_dynamics_from_file(os.path.join(subdir, f), engagement_map_series, split_key_series, window_size, min_view)
+            extract_engagement_dynamics_from_file(os.path.join(subdir, f), engagement_map_series, split_key_series,
+                                                  lookup_matrix_series, window_size, min_view)
     print('>>> Finish extracting all data!')
 
     cum_output.close()
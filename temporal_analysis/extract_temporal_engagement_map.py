@@ -10,61 +10,32 @@ Time: ~1H
 
 import sys, os, pickle, argparse
 import numpy as np
-from collections import defaultdict
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
 from utils.helper import Timer
+from utils.engagement_map_builder import EngagementMapBuilder
 
 
 def plot_map_from_file(input_path, output_dir):
     age = os.path.basename(input_path)[-6: -4]
-    duration_engagement_tuple = []
-    duration_cnt_dict = defaultdict(int)
+    duration_list = []
+    wp_list = []
 
     with open(input_path, 'r') as fin:
         for line in fin:
             vid, category, duration, watch_percentage, watch_time = line.rstrip().split(',')
-            duration = int(duration)
-            watch_percentage = float(watch_percentage)
-            watch_time = float(watch_time)
-            duration_engagement_tuple.append((duration, watch_percentage, np.log10(watch_time)))
-            duration_cnt_dict[duration] += 1
+            duration_list.append(int(duration))
+            wp_list.append(float(watch_percentage))
 
     # == == == == == == == == Part 1: Build wp matrix based on duration splits == == == == == == == == #
-    # sort by duration in ascent order
-    sorted_duration_engagement_tuple = sorted(duration_engagement_tuple, key=lambda x: x[0])
-
-    # get ideal split point in log scale
-    even_split_points = [10**x for x in np.linspace(1, 5, bin_number)]
-
-    # put videos in correct bins
-    wp_bin_matrix = []
-    wp_individual_bin = []
-    wt_bin_matrix = []
-    wt_individual_bin = []
-    bin_idx = 0
-    duration_splits = []
-    # put dur-wp tuple in the correct bin
-    for duration, watch_percentage, watch_time in sorted_duration_engagement_tuple:
-        if duration > even_split_points[bin_idx]:
-            bin_idx += 1
-            # must contains at least 50 videos
-            if len(wp_individual_bin) >= 50:
-                wp_bin_matrix.append(np.array(wp_individual_bin))
-                wp_individual_bin = []
-                wt_bin_matrix.append(np.array(wt_individual_bin))
-                wt_individual_bin = []
-                duration_splits.append(even_split_points[bin_idx])
-        wp_individual_bin.append(watch_percentage)
-        wt_individual_bin.append(watch_time)
-    if len(wp_individual_bin) > 0:
-        wp_bin_matrix.append(np.array(wp_individual_bin))
-        wt_bin_matrix.append(np.array(wt_individual_bin))
+    # get ideal split point in log scale, python power of each point rounds differently from vectorized np.power
+    even_split_points = np.array([10**x for x in np.linspace(1, 5, bin_number)])
+
+    # sort by duration, put videos in bins of at least 50 videos, bins are split at the ideal split points
+    builder = EngagementMapBuilder(np.array(duration_list), even_split_points, log_scale=False)
 
     # == == == == == == == == Part 2: Store engagement map offline == == == == == == == == #
-    engagement_map = {'duration': duration_splits}
-    for i in range(len(wp_bin_matrix)):
-        engagement_map[i] = [np.percentile(wp_bin_matrix[i], j / 10) for j in range(1000)]
+    engagement_map = builder.build(np.array(wp_list), min_bin_size=50, percentile_number=1000, use_split_points=True)
     pickle.dump(engagement_map, open(os.path.join(output_dir, 'engagement_map_day{0}.p'.format(age)), 'wb'))
 
 
@@ -14,7 +14,7 @@ import numpy as np
 from scipy.optimize import curve_fit
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
-from utils.helper import Timer, read_as_int_array, read_as_float_array
+from utils.helper import Timer, read_as_ragged_array, iter_batches
 
 
 def func_powerlaw(x, a, b, c):
@@ -56,27 +56,32 @@ if __name__ == '__main__':
     fitting_output.write('Vid,Err_Powerlaw,Err_linear,Err_constant\n')
 
     with open(input_path, 'r') as fin:
-        for line in fin:
-            vid, days, _, re_list = line.rstrip().split('\t')
-            days = read_as_int_array(days, delimiter=',')
-            re_list = read_as_float_array(re_list, delimiter=',')
-
-            # pre-requisite: views in all sliding windows (first 30 days) are at least 100
-            if len(days) == age:
-                # power-law
-                optimal_params = fit_with_powerlaw(days, re_list)
-                if optimal_params is not None:
-                    mae_powerlaw = mean_absolute_error(re_list, [func_powerlaw(x, *optimal_params) for x in days])
-
-                    # linear reg
-                    model = LinearRegression()
-                    model.fit(ts, re_list)
-                    mae_linear = mean_absolute_error(re_list, model.predict(ts))
-
-                    # constant
-                    mae_constant = mean_absolute_error(re_list, [np.median(re_list)]*age)
-
-                    fitting_output.write('{0},{1},{2},{3}\n'.format(vid, mae_powerlaw, mae_linear, mae_constant))
+        for lines in iter_batches(fin, 100000):
+            records = [line.rstrip().split('\t') for line in lines]
+            # parse dynamics of the whole batch at once, the j-th video is in [offsets[j], offsets[j+1])
+            days_values, offsets = read_as_ragged_array([record[1] for record in records], np.uint32)
+            re_values, _ = read_as_ragged_array([record[3] for record in records], np.float64)
+            for j, record in enumerate(records):
+                vid = record[0]
+                days = days_values[offsets[j]: offsets[j + 1]]
+                re_list = re_values[offsets[j]: offsets[j + 1]]
+
+                # pre-requisite: views in all sliding windows (first 30 days) are at least 100
+                if len(days) == age:
+                    # power-law
+                    optimal_params = fit_with_powerlaw(days, re_list)
+                    if optimal_params is not None:
+                        mae_powerlaw = mean_absolute_error(re_list, [func_powerlaw(x, *optimal_params) for x in days])
+
+                        # linear reg
+                        model = LinearRegression()
+                        model.fit(ts, re_list)
+                        mae_linear = mean_absolute_error(re_list, model.predict(ts))
+
+                        # constant
+                        mae_constant = mean_absolute_error(re_list, [np.median(re_list)]*age)
+
+                        fitting_output.write('{0},{1},{2},{3}\n'.format(vid, mae_powerlaw, mae_linear, mae_constant))
 
     fitting_output.close()
 
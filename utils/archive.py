@@ -0,0 +1,46 @@
+""" Stream JSON-lines files out of tar.bz2 archives without unpacking them to disk. """
+
+import os, bz2, shutil, subprocess, tarfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def open_bz2_stream(archive_path, num_threads=None):
+    """ Open a decompressed byte stream of a bz2 file.
+    Decompression runs in parallel over bz2 blocks if lbzip2 or pbzip2 is installed, otherwise falls back to bz2 module.
+    :param archive_path: bz2 compressed file path
+    :param num_threads: number of decompression threads, default all cores
+    :return: a binary file object of decompressed content
+    """
+    num_threads = num_threads or os.cpu_count()
+    # lbzip2 splits any bz2 file by blocks, pbzip2 only parallelizes files compressed by pbzip2
+    for decompressor, thread_flag in [('lbzip2', '-n'), ('pbzip2', '-p')]:
+        if shutil.which(decompressor) is not None:
+            cmd = [decompressor, '-dc', '{0}{1}'.format(thread_flag, num_threads), archive_path]
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=1024*1024)
+            try:
+                yield proc.stdout
+            finally:
+                proc.stdout.close()
+                if proc.wait() not in (0, -13):
+                    raise IOError('{0} fails to decompress {1}'.format(decompressor, archive_path))
+            return
+
+    with bz2.open(archive_path, 'rb') as stream:
+        yield stream
+
+
+def iter_archive_members(archive_path, suffix='.json', num_threads=None):
+    """ Iterate over members of a tar.bz2 archive in one streaming pass.
+    Each member must be consumed before moving to the next one.
+    :param archive_path: tar.bz2 archive path
+    :param suffix: only yield members whose name ends with suffix
+    :param num_threads: number of decompression threads, default all cores
+    :return: a generator of (TarInfo, binary file object) tuples, TarInfo carries name, size and mtime of the member,
+             iterating the file object yields lines
+    """
+    with open_bz2_stream(archive_path, num_threads) as stream:
+        with tarfile.open(fileobj=stream, mode='r|') as tar:
+            for member in tar:
+                if member.isfile() and member.name.endswith(suffix):
+                    yield member, tar.extractfile(member)
@@ -0,0 +1,123 @@
+""" Split large JSON-lines files into newline-aligned byte ranges, so one file can be parsed in parallel. """
+
+import os, shutil
+
+
+def split_into_chunks(filepath, chunk_size, file_size=None):
+    """ Split a file into newline-aligned byte ranges of roughly chunk_size bytes.
+    :param filepath: input file path
+    :param chunk_size: target number of bytes in each chunk
+    :param file_size: number of head bytes to split, default the whole file
+    :return: a list of (start, end) byte offsets, each range starts at a line head and ends after a newline
+    """
+    if file_size is None:
+        file_size = os.path.getsize(filepath)
+    chunks = []
+    start = 0
+    with open(filepath, 'rb') as fin:
+        while start < file_size:
+            end = start + chunk_size
+            if end >= file_size:
+                end = file_size
+            else:
+                # move the cut point to the end of the line it falls in
+                fin.seek(end)
+                fin.readline()
+                end = fin.tell()
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def split_into_shards(filepaths, num_shards):
+    """ Split a sequence of files into contiguous shards of roughly equal bytes, cut at line ends.
+    Concatenating the shards in order gives back all lines of all files in order.
+    :param filepaths: ordered list of input file paths
+    :param num_shards: number of shards
+    :return: a list of num_shards lists of (filepath, start, end) byte ranges, a shard may be empty
+    """
+    file_sizes = [os.path.getsize(filepath) for filepath in filepaths]
+    file_starts = [0]
+    for file_size in file_sizes:
+        file_starts.append(file_starts[-1] + file_size)
+    total_size = file_starts[-1]
+
+    # cut points as (file index, byte offset), moved to the end of the line they fall in
+    cuts = [(0, 0)]
+    file_idx = 0
+    for shard_idx in range(1, num_shards):
+        target = total_size * shard_idx // num_shards
+        while file_idx < len(filepaths) - 1 and target >= file_starts[file_idx + 1]:
+            file_idx += 1
+        offset = target - file_starts[file_idx]
+        if offset > 0:
+            with open(filepaths[file_idx], 'rb') as fin:
+                fin.seek(offset - 1)
+                fin.readline()
+                offset = fin.tell()
+        cuts.append(max(cuts[-1], (file_idx, offset)))
+    cuts.append((len(filepaths), 0))
+
+    shards = []
+    for (start_file, start), (end_file, end) in zip(cuts[:-1], cuts[1:]):
+        ranges = []
+        for file_idx in range(start_file, min(end_file + 1, len(filepaths))):
+            range_start = start if file_idx == start_file else 0
+            range_end = end if file_idx == end_file else file_sizes[file_idx]
+            if range_end > range_start:
+                ranges.append((filepaths[file_idx], range_start, range_end))
+        shards.append(ranges)
+    return shards
+
+
+def find_complete_end(filepath, file_size=None, block_size=1024*1024):
+    """ Find the end of the last complete line, so a line that is still being appended is left out.
+    :param filepath: input file path
+    :param file_size: number of head bytes to search, default the whole file
+    :param block_size: number of bytes read at once when searching backwards
+    :return: byte offset right after the last newline, 0 if there is no complete line
+    """
+    if file_size is None:
+        file_size = os.path.getsize(filepath)
+    end = file_size
+    with open(filepath, 'rb') as fin:
+        while end > 0:
+            start = max(0, end - block_size)
+            fin.seek(start)
+            block = fin.read(end - start)
+            newline_idx = block.rfind(b'\n')
+            if newline_idx >= 0:
+                return start + newline_idx + 1
+            end = start
+    return 0
+
+
+def read_chunk(fin, start, end):
+    """ Read lines in the byte range [start, end) of a file.
+    :param fin: input file object opened in binary mode
+    :param start: start byte offset, must be at a line head
+    :param end: end byte offset, must be after a newline or at the end of file
+    :return: a generator of byte lines
+    """
+    fin.seek(start)
+    position = start
+    while position < end:
+        line = fin.readline()
+        if not line:
+            break
+        position += len(line)
+        yield line
+
+
+def merge_chunks(part_paths, output_path, append=False):
+    """ Concatenate per-chunk outputs in order into one file, then remove the parts.
+    :param part_paths: ordered list of per-chunk output file paths
+    :param output_path: merged output file path
+    :param append: append to the end of an existing output file, default overwrite it
+    """
+    with open(output_path, 'ab' if append else 'wb') as fout:
+        for part_path in part_paths:
+            with open(part_path, 'rb') as fin:
+                shutil.copyfileobj(fin, fout)
+    for part_path in part_paths:
+        os.remove(part_path)
@@ -0,0 +1,284 @@
+""" Columnar binary store of the formatted dataset, written alongside the tab separated text files.
+
+A store is a directory with one part directory for each formatted text file, e.g., store/music for music.txt.
+Each column of a part is saved in its own .npy file, so a reader only touches the columns it asks for:
+    numeric and date columns are typed numpy arrays, loaded as read-only memory maps,
+    categorical columns keep int32 ids in <column>.npy,
+    token columns keep a flat array of int32 ids of all videos in <column>.npy, the ids of the i-th video are in
+    [offsets[i], offsets[i+1]) of the int64 <column>.offsets.npy,
+    ragged columns keep a flat array of all values in <column>.npy, the values of the i-th video are in
+    [offsets[i], offsets[i+1]) of the int64 offsets.npy shared by all ragged columns of a part.
+Video ids are stored as int64 codes of utils.vid_codec, decode them with decode_vids.
+Ids of categorical and token columns index the persistent dictionary <column>.dictionary.npy at the store root.
+Dictionaries are append-only, the id of a value never changes once assigned, so ids stay valid when data is added.
+"""
+
+import os, shutil
+import numpy as np
+
+from utils.helper import ragged_sum, ragged_cumsum, lengths_to_offsets
+
+# column name -> (kind, numpy dtype), in the same order as the columns of formatted text files
+FORMATTED_COLUMNS = {'id': ('fixed', np.int64),
+                     'publish': ('fixed', 'datetime64[D]'),
+                     'duration': ('fixed', np.int32),
+                     'definition': ('fixed', np.int8),
+                     'category': ('categorical', np.str_),
+                     'detect_lang': ('categorical', np.str_),
+                     'channel': ('categorical', np.str_),
+                     'topics': ('tokens', np.str_),
+                     'view30': ('fixed', np.int64),
+                     'watch30': ('fixed', np.float64),
+                     'wp30': ('fixed', np.float32),
+                     'days': ('ragged', np.uint16),
+                     'daily_view': ('ragged', np.uint32),
+                     'daily_watch': ('ragged', np.float32)}
+
+
+class RaggedArray:
+    """ A sequence of variable-length numpy arrays in compressed sparse row layout.
+    The i-th array is values[offsets[i]: offsets[i+1]], indexing and iterating yield views without copy.
+    """
+    def __init__(self, values, offsets):
+        self.values = values
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        return self.values[self.offsets[idx]: self.offsets[idx + 1]]
+
+    def __iter__(self):
+        offsets = np.asarray(self.offsets).tolist()
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            yield self.values[start: end]
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def sum(self):
+        """ Sum of each array, equals np.sum over each array. """
+        return ragged_sum(self.values, self.offsets)
+
+    def cumsum(self):
+        """ Running sums within each array, returned as a ragged array with the same offsets. """
+        return RaggedArray(ragged_cumsum(self.values, self.offsets), self.offsets)
+
+    @staticmethod
+    def concatenate(ragged_arrays):
+        """ Concatenate ragged arrays in order into one ragged array. """
+        values = np.concatenate([ragged_array.values for ragged_array in ragged_arrays])
+        offsets = lengths_to_offsets(np.concatenate([ragged_array.lengths for ragged_array in ragged_arrays]))
+        return RaggedArray(values, offsets)
+
+
+class Dictionary:
+    """ Append-only mapping from string values to int32 ids, ids are positions in values. """
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.index = {value: idx for idx, value in enumerate(self.values)}
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, values):
+        """ Encode values into ids, unseen values are appended with new ids.
+        :param values: an iterable of strings
+        :return: a numpy int32 array of ids
+        """
+        ids = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            if value not in self.index:
+                self.index[value] = len(self.values)
+                self.values.append(value)
+            ids[i] = self.index[value]
+        return ids
+
+    def decode(self, ids):
+        """ Decode ids into a numpy array of values. """
+        return np.array(self.values, dtype=np.str_)[ids]
+
+    def save(self, path):
+        np.save(path, np.array(self.values, dtype=np.str_))
+
+    @staticmethod
+    def load(path):
+        return Dictionary(np.load(path).tolist())
+
+
+class ColumnarWriter:
+    """ Collect batches of columns, then save them as one part of a columnar store on close.
+    Categorical and token columns are encoded with a part-local dictionary, see encode_with_store_dictionaries.
+    """
+    def __init__(self, part_dir, schema=FORMATTED_COLUMNS):
+        self.part_dir = part_dir
+        self.schema = schema
+        self.batches = {column: [] for column in schema}
+
+    def append(self, columns):
+        """ Append one batch of columns.
+        :param columns: dict of column name -> numpy array or list, or RaggedArray for token and ragged columns,
+                        all columns of the schema with equal length
+        """
+        for column, (kind, dtype) in self.schema.items():
+            if kind in ('tokens', 'ragged'):
+                values = columns[column]
+                self.batches[column].append(RaggedArray(np.asarray(values.values, dtype=dtype), values.offsets))
+            else:
+                self.batches[column].append(np.asarray(columns[column], dtype=dtype))
+
+    def close(self):
+        # replace a stale part left by an interrupted or earlier run
+        if os.path.exists(self.part_dir):
+            shutil.rmtree(self.part_dir)
+        os.makedirs(self.part_dir)
+        for column, (kind, dtype) in self.schema.items():
+            _save_column(self.part_dir, column, kind, _concatenate_column(kind, dtype, self.batches[column]))
+        self.batches = None
+
+
+def _concatenate_column(kind, dtype, values_list):
+    """ Concatenate pieces of one column in order, a single piece is returned as is. """
+    if len(values_list) == 1:
+        return values_list[0]
+    if kind in ('tokens', 'ragged'):
+        if len(values_list) == 0:
+            return RaggedArray(np.array([], dtype=dtype), np.zeros(1, dtype=np.int64))
+        return RaggedArray.concatenate(values_list)
+    if len(values_list) == 0:
+        return np.array([], dtype=dtype)
+    return np.concatenate(values_list)
+
+
+def _save_column(part_dir, column, kind, values):
+    """ Save one column of a part in its storage layout, dictionary encoded columns get a part-local dictionary. """
+    column_path = os.path.join(part_dir, column)
+    if kind == 'fixed':
+        np.save(column_path + '.npy', values)
+    elif kind == 'categorical':
+        categories, ids = np.unique(values, return_inverse=True)
+        np.save(column_path + '.npy', ids.astype(np.int32))
+        np.save(column_path + '.categories.npy', categories)
+    elif kind == 'tokens':
+        categories, ids = np.unique(values.values, return_inverse=True)
+        np.save(column_path + '.npy', ids.astype(np.int32))
+        np.save(column_path + '.offsets.npy', values.offsets)
+        np.save(column_path + '.categories.npy', categories)
+    elif kind == 'ragged':
+        # ragged columns of a part share one offsets array, written by the first of them
+        offsets_path = os.path.join(part_dir, 'offsets.npy')
+        if os.path.exists(offsets_path):
+            if not np.array_equal(np.load(offsets_path), values.offsets):
+                raise ValueError('ragged column {0} is not aligned with other ragged columns'.format(column))
+        else:
+            np.save(offsets_path, values.offsets)
+        np.save(column_path + '.npy', values.values)
+    else:
+        raise ValueError('unknown column kind {0}'.format(kind))
+
+
+def _load_dictionary_values(part_dir, column):
+    """ Load the values that ids of a part refer to, the part-local dictionary if the part is not encoded yet. """
+    categories_path = os.path.join(part_dir, column + '.categories.npy')
+    if os.path.exists(categories_path):
+        return np.load(categories_path)
+    return np.load(os.path.join(os.path.dirname(part_dir), column + '.dictionary.npy'))
+
+
+def _load_column(part_dir, column, kind, mmap_mode='r', decode=False):
+    """ Load one column of a part, ids of dictionary encoded columns are decoded into values if decode is True. """
+    column_path = os.path.join(part_dir, column)
+    if kind == 'fixed':
+        return np.load(column_path + '.npy', mmap_mode=mmap_mode)
+    elif kind == 'categorical':
+        ids = np.load(column_path + '.npy', mmap_mode=mmap_mode)
+        return _load_dictionary_values(part_dir, column)[ids] if decode else ids
+    elif kind == 'tokens':
+        ids = np.load(column_path + '.npy', mmap_mode=mmap_mode)
+        offsets = np.load(column_path + '.offsets.npy', mmap_mode=mmap_mode)
+        return RaggedArray(_load_dictionary_values(part_dir, column)[ids] if decode else ids, offsets)
+    elif kind == 'ragged':
+        return RaggedArray(np.load(column_path + '.npy', mmap_mode=mmap_mode),
+                           np.load(os.path.join(part_dir, 'offsets.npy'), mmap_mode=mmap_mode))
+    else:
+        raise ValueError('unknown column kind {0}'.format(kind))
+
+
+def list_parts(store_dir):
+    """ List part names of a columnar store in sorted order.
+    :param store_dir: columnar store dir
+    :return: a list of part names
+    """
+    return sorted(name for name in os.listdir(store_dir) if os.path.isdir(os.path.join(store_dir, name)))
+
+
+def read_columns(store_dir, columns=None, parts=None, decode=False, schema=FORMATTED_COLUMNS):
+    """ Read selected columns of a columnar store, parts are concatenated in order.
+    :param store_dir: columnar store dir
+    :param columns: list of column names, default all columns
+    :param parts: list of part names, default all parts in sorted order
+    :param decode: decode ids of categorical and token columns into string values, default keep int32 ids
+    :param schema: dict of column name -> (kind, dtype)
+    :return: dict of column name -> numpy array, or RaggedArray for token and ragged columns,
+             a single part of a fixed, categorical, token or ragged column is returned as read-only memory maps
+    """
+    if columns is None:
+        columns = list(schema.keys())
+    if parts is None:
+        parts = list_parts(store_dir)
+    ret = {}
+    for column in columns:
+        kind, dtype = schema[column]
+        if kind in ('categorical', 'tokens') and not decode:
+            dtype = np.int32
+        ret[column] = _concatenate_column(kind, dtype, [_load_column(os.path.join(store_dir, part), column, kind,
+                                                                     decode=decode) for part in parts])
+    return ret
+
+
+def read_dictionary(store_dir, column):
+    """ Read the persistent dictionary of a categorical or token column.
+    :param store_dir: columnar store dir
+    :param column: column name
+    :return: a Dictionary object, the value of id i is dictionary.values[i]
+    """
+    return Dictionary.load(os.path.join(store_dir, column + '.dictionary.npy'))
+
+
+def encode_with_store_dictionaries(store_dir, schema=FORMATTED_COLUMNS):
+    """ Re-encode categorical and token columns of all parts from part-local dictionaries to the persistent
+    dictionaries at the store root. Parts are visited in sorted order, and values of a part are added in sorted order,
+    so the ids do not depend on how the input was split among workers. Parts encoded before are left untouched.
+    :param store_dir: columnar store dir
+    :param schema: dict of column name -> (kind, dtype)
+    """
+    for column, (kind, _) in schema.items():
+        if kind not in ('categorical', 'tokens'):
+            continue
+        dictionary_path = os.path.join(store_dir, column + '.dictionary.npy')
+        dictionary = Dictionary.load(dictionary_path) if os.path.exists(dictionary_path) else Dictionary()
+        for part in list_parts(store_dir):
+            column_path = os.path.join(store_dir, part, column)
+            if not os.path.exists(column_path + '.categories.npy'):
+                continue
+            part_to_store_ids = dictionary.encode(np.load(column_path + '.categories.npy').tolist())
+            np.save(column_path + '.npy', part_to_store_ids[np.load(column_path + '.npy')])
+            os.remove(column_path + '.categories.npy')
+        dictionary.save(dictionary_path)
+
+
+def merge_parts(part_dirs, output_dir, schema=FORMATTED_COLUMNS):
+    """ Concatenate parts in order into one part, then remove the input parts.
+    :param part_dirs: ordered list of part dirs
+    :param output_dir: merged part dir
+    :param schema: dict of column name -> (kind, dtype)
+    """
+    writer = ColumnarWriter(output_dir, schema)
+    for part_dir in part_dirs:
+        writer.append({column: _load_column(part_dir, column, kind, mmap_mode=None, decode=True)
+                       for column, (kind, _) in schema.items()})
+    writer.close()
+    for part_dir in part_dirs:
+        shutil.rmtree(part_dir)
@@ -2,6 +2,8 @@
 
 import numpy as np
 
+from utils.helper import count_rows_at_most
+
 
 def to_watch_percentage(lookup_table, duration, re_score, lookup_keys=None):
     """ Convert relative engagement to watch percentage.
@@ -59,3 +61,60 @@ def to_relative_engagement(lookup_table, duration, wp_score, lookup_keys=None):
         re = np.sum(duration_bin <= wp_score) / 1000
         # re = (np.sum(duration_bin < wp_score) + np.sum(duration_bin <= wp_score)) / 2000
         return re
+
+
+def get_lookup_matrix(lookup_table, lookup_keys=None):
+    """ Stack bins of a lookup table into a 2-D array, one row of percentiles per bin.
+    :param lookup_table: duration ~ watch percentage table, in format of dur: [1st percentile, ..., 1000th percentile]
+    :param lookup_keys: pre-computed duration split points
+    :return: 2-D numpy array of len(lookup_keys)+1 rows
+    """
+    if lookup_keys is None:
+        lookup_keys = lookup_table['duration']
+    return np.array([lookup_table[bin_idx] for bin_idx in range(len(lookup_keys) + 1)], dtype=np.float64)
+
+
+def _get_bin_indices(lookup_keys, durations):
+    # same bins as np.sum(lookup_keys < duration), split points are increasing
+    return np.searchsorted(lookup_keys, durations, side='left')
+
+
+def to_watch_percentage_array(lookup_table, durations, re_scores, lookup_keys=None, lookup_matrix=None):
+    """ Convert an array of relative engagement to watch percentage, same values as to_watch_percentage.
+    :param lookup_table: duration ~ watch percentage table, in format of dur: [1st percentile, ..., 1000th percentile]
+    :param durations: numpy array of durations, or a single duration
+    :param re_scores: numpy array of relative engagement scores, broadcast against durations
+    :param lookup_keys: pre-computed duration split points, for faster computation
+    :param lookup_matrix: pre-computed lookup matrix from get_lookup_matrix, for faster computation
+    :return: numpy float array of watch percentages
+    """
+    if lookup_keys is None:
+        lookup_keys = lookup_table['duration']
+    if lookup_matrix is None:
+        lookup_matrix = get_lookup_matrix(lookup_table, lookup_keys)
+    durations, re_scores = np.broadcast_arrays(np.asarray(durations), np.asarray(re_scores, dtype=np.float64))
+    bin_idx = _get_bin_indices(np.asarray(lookup_keys), durations)
+    # index -1 wraps to the last percentile for scores below 0.001, as in to_watch_percentage
+    upper_idx = np.floor(re_scores * 1000).astype(np.int64)
+    upper_idx[(re_scores == 0) | (re_scores == 1)] = 0
+    wps = (lookup_matrix[bin_idx, upper_idx - 1] + lookup_matrix[bin_idx, upper_idx]) / 2
+    wps = np.where(re_scores == 0, lookup_matrix[bin_idx, 0], wps)
+    return np.where(re_scores == 1, lookup_matrix[bin_idx, -1], wps)
+
+
+def to_relative_engagement_array(lookup_table, durations, wp_scores, lookup_keys=None, lookup_matrix=None):
+    """ Convert an array of watch percentage to relative engagement, same values as to_relative_engagement.
+    :param lookup_table: duration ~ watch percentage table, in format of dur: [1st percentile, ..., 1000th percentile]
+    :param durations: numpy array of durations, or a single duration
+    :param wp_scores: numpy array of watch percentage scores, broadcast against durations
+    :param lookup_keys: pre-computed duration split points, for faster computation
+    :param lookup_matrix: pre-computed lookup matrix from get_lookup_matrix, for faster computation
+    :return: numpy float array of relative engagement scores
+    """
+    if lookup_keys is None:
+        lookup_keys = lookup_table['duration']
+    if lookup_matrix is None:
+        lookup_matrix = get_lookup_matrix(lookup_table, lookup_keys)
+    durations, wp_scores = np.broadcast_arrays(np.asarray(durations), np.asarray(wp_scores, dtype=np.float64))
+    bin_idx = _get_bin_indices(np.asarray(lookup_keys), durations)
+    return count_rows_at_most(lookup_matrix, bin_idx, wp_scores) / 1000
@@ -0,0 +1,145 @@
+""" Engagement map compiled into a dense grid, relative engagement of a video is read by array indexing only.
+
+EngagementMap.query_engagement_map walks the duration splits and the percentiles of a bin for every video. The grid
+precomputes both steps. The bin of every integer duration up to the last split is kept in an int32 array, durations
+above the last split fall in the same bin as the last split. Watch percentage is quantised into cells of 2^-step_bits,
+6.1e-5 by default, and the grid keeps the number of percentiles <= the lower edge of each cell, one row per bin, so
+relative engagement is grid[bin_index[ceil(duration)], floor(wp * 2^step_bits)] / percentile_number. A dense array of
+every duration by every cell would repeat the row of a bin for each second in it, 3GB for 100,000 seconds.
+
+Error bounds against query_engagement_map, for watch percentage >= 0 and maps with integer duration splits:
+    duration: none, the bin of a duration is the bin of its ceiling, as splits are integers,
+    watch percentage: the grid is never above the exact relative engagement and at most max_error below it, where
+    max_error is the largest number of percentiles strictly inside one cell over all bins, divided by the percentile
+    number. A cell edge times 2^step_bits is exact in float64 and float32, so no video falls in a neighbouring cell
+    by rounding. Watch percentage is quantised in the dtype of the map, as query_engagement_map compares a float32
+    map in float32, where a watch percentage just below a cell edge rounds onto it.
+    Watch percentages on a cell edge, and in cells without a percentile inside, are exact.
+max_error is computed when the grid is compiled and kept in the file, halving the cell halves it in dense bins.
+
+A grid file (.egrid) holds, little endian, a 64-byte header: magic b'EGRD', uint16 format version, uint8 step bits,
+uint8 byte size of grid counts, uint64 number of bins, uint64 number of percentiles in each bin, uint64 max duration,
+float64 max error, uint8 byte size of map percentiles (4 for float32, 8 for float64), zero padding, then the
+max_duration+1 int32 bin indices at byte 64 and the num_bins x (2^step_bits+1) count matrix at the next multiple of
+64 bytes. Both are memory-mapped on load.
+"""
+
+import struct
+import numpy as np
+
+GRID_MAGIC = b'EGRD'
+GRID_VERSION = 1
+HEADER_FORMAT = '<4sHBBQQQdB'
+HEADER_SIZE = 64
+COUNT_DTYPES = {2: np.dtype('<u2'), 4: np.dtype('<u4')}
+VALUE_DTYPES = {4: np.dtype(np.float32), 8: np.dtype(np.float64)}
+
+
+def _get_grid_offset(max_duration):
+    index_end = HEADER_SIZE + 4 * (max_duration + 1)
+    return (index_end + HEADER_SIZE - 1) // HEADER_SIZE * HEADER_SIZE
+
+
+class EngagementGrid(object):
+    def __init__(self, bin_index, counts, percentile_number, step_bits=14, max_error=None, value_dtype=np.float64):
+        """
+        :param bin_index: numpy int array, bin of each integer duration from 0 to the max duration
+        :param counts: 2-D numpy int array, number of percentiles <= the lower edge of each cell, one row per bin
+        :param percentile_number: number of percentiles in each bin of the map
+        :param step_bits: watch percentage cells are 2^-step_bits wide
+        :param max_error: largest difference to the exact relative engagement, see module docstring
+        :param value_dtype: dtype of the map percentiles, watch percentages are quantised in it
+        """
+        self.bin_index = bin_index
+        self.counts = counts
+        self.percentile_number = percentile_number
+        self.step_bits = step_bits
+        self.max_error = max_error
+        self.max_duration = len(bin_index) - 1
+        self.cell_number = 2 ** step_bits
+        self.value_dtype = np.dtype(value_dtype)
+
+    @classmethod
+    def compile(cls, duration_splits, percentiles, step_bits=14):
+        """ Compile the watch percentage map of an engagement map into a grid.
+        :param duration_splits: numpy int array of duration splits, e.g., from utils.engagement_map_format.to_arrays
+        :param percentiles: 2-D numpy array of watch percentage percentiles, one row per bin, float32 or float64
+        :param step_bits: watch percentage cells are 2^-step_bits wide, 14 for cells of 6.1e-5
+        :return: an EngagementGrid object
+        """
+        duration_splits = np.asarray(duration_splits)
+        if len(duration_splits) > 0 and not np.issubdtype(duration_splits.dtype, np.integer):
+            raise ValueError('engagement grid needs integer duration splits')
+        num_bins, percentile_number = np.shape(percentiles)
+        value_dtype = np.float32 if np.asarray(percentiles).dtype == np.float32 else np.float64
+        # same bin as query_engagement_map, the first split >= duration, or the last split, a map without splits,
+        # e.g., of a small segment, has all durations in bin 0
+        max_duration = int(duration_splits[-1]) if len(duration_splits) > 0 else 0
+        bin_index = np.minimum(np.searchsorted(duration_splits, np.arange(max_duration + 1), side='left'),
+                               max(len(duration_splits) - 1, 0)).astype(np.int32)
+
+        cell_number = 2 ** step_bits
+        edges = np.arange(cell_number + 1) / cell_number
+        counts = np.zeros((num_bins, cell_number + 1), dtype=np.uint16 if percentile_number < 2 ** 16 else np.uint32)
+        max_inside = 0
+        for bin_idx in range(num_bins):
+            # the first percentile > wp only depends on the running max of a row, which is increasing
+            row = np.maximum.accumulate(np.asarray(percentiles[bin_idx], dtype=np.float64))
+            counts[bin_idx] = np.searchsorted(row, edges, side='right')
+            # percentiles strictly inside each cell, the last cell holds any percentile above 1
+            below_upper_edges = np.append(np.searchsorted(row, edges[1:], side='left'), percentile_number)
+            max_inside = max(max_inside, int(np.max(below_upper_edges - counts[bin_idx])))
+        return cls(bin_index, counts, percentile_number, step_bits, max_inside / percentile_number, value_dtype)
+
+    def query(self, durations, watch_percentages):
+        """ Relative engagement of videos, at most max_error below query_engagement_map on each video.
+        :param durations: video length in seconds, or numpy array of them
+        :param watch_percentages: watch percentage, or numpy array of them aligned with durations
+        :return: numpy float64 relative engagement, of the shape of the inputs
+        """
+        duration_idx = np.clip(np.ceil(durations), 0, self.max_duration).astype(np.int64)
+        # in the dtype of the map, scaling by a power of 2 is exact, so floor gives the cell whose lower edge is <= wp
+        watch_percentages = np.asarray(watch_percentages).astype(self.value_dtype)
+        cell_idx = np.clip(np.floor(watch_percentages * self.cell_number), 0, self.cell_number)
+        return self.counts[self.bin_index[duration_idx], cell_idx.astype(np.int64)] / self.percentile_number
+
+    def save(self, path):
+        """ Save the grid as a grid file.
+        :param path: output file path, ends with .egrid
+        """
+        num_bins = len(self.counts)
+        header = struct.pack(HEADER_FORMAT, GRID_MAGIC, GRID_VERSION, self.step_bits, self.counts.dtype.itemsize,
+                             num_bins, self.percentile_number, self.max_duration, self.max_error,
+                             self.value_dtype.itemsize)
+        with open(path, 'wb') as fout:
+            fout.write(header.ljust(HEADER_SIZE, b'\0'))
+            fout.write(np.asarray(self.bin_index, dtype='<i4').tobytes())
+            fout.write(b'\0' * (_get_grid_offset(self.max_duration) - fout.tell()))
+            fout.write(np.asarray(self.counts, dtype=self.counts.dtype.newbyteorder('<')).tobytes())
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """ Load a grid saved by save.
+        :param path: grid file path
+        :param mmap: memory-map the arrays read-only, default True, otherwise read them into memory
+        :return: an EngagementGrid object
+        """
+        with open(path, 'rb') as fin:
+            header = struct.unpack(HEADER_FORMAT, fin.read(struct.calcsize(HEADER_FORMAT)))
+        magic, version, step_bits, itemsize, num_bins, percentile_number, max_duration, max_error, \
+            value_itemsize = header
+        if magic != GRID_MAGIC:
+            raise ValueError('{0} is not an engagement grid'.format(path))
+        if version != GRID_VERSION:
+            raise ValueError('unsupported engagement grid format version {0} in {1}'.format(version, path))
+        sections = [(np.dtype('<i4'), HEADER_SIZE, (max_duration + 1,)),
+                    (COUNT_DTYPES[itemsize], _get_grid_offset(max_duration), (num_bins, 2 ** step_bits + 1))]
+        arrays = []
+        for dtype, offset, shape in sections:
+            if mmap:
+                arrays.append(np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape))
+            else:
+                with open(path, 'rb') as fin:
+                    fin.seek(offset)
+                    arrays.append(np.fromfile(fin, dtype=dtype, count=int(np.prod(shape))).reshape(shape))
+        return cls(arrays[0], arrays[1], percentile_number, step_bits, max_error, VALUE_DTYPES[value_itemsize])
@@ -0,0 +1,367 @@
+""" Build engagement maps from numpy arrays of video durations and engagement metrics.
+
+Videos are sorted by duration and walked against ideal duration split points. A video whose duration passes the
+current split point advances the walk by one split point only, so a sparse duration range takes several videos to
+catch up. Each advance is a chance to close the current bin, either at every advance, or only once the bin holds
+enough videos. The same binning then applies to any metric aligned with the durations, e.g., watch percentage or
+watch time, and each bin of an engagement map keeps the percentiles of watch percentage in it, optionally also the
+percentiles of log10 watch time under key 'watch_time', a list of one percentiles list per bin.
+A segmented engagement map is an engagement map of all videos that also holds one engagement map per value of a
+group-by column, e.g., category, under keys 'group_by' and 'segments', see build_segment_maps.
+Confidence bands of percentiles are estimated by resampling each bin with replacement, see bootstrap.
+
+Bins only depend on the number of videos of each duration, so a builder can also be set up from duration counts,
+then videos are streamed in batches into a bounded-memory quantile sketch of their bin, see build_with_sketches.
+Each bin keeps a second sketch of log10 watch time, so maps built from sketches also hold 'watch_time'.
+Sketches of the same bins merge, so shards of a dataset can be summarized by separate workers and reduced into one
+map, see summarize, merge_summaries and build_from_summaries.
+"""
+
+import numpy as np
+
+from utils.quantile_sketch import QuantileSketch
+
+
+def get_percentiles(values, percentile_number=1000):
+    """ Evenly spaced percentiles of values in one vectorized call, each equals np.percentile(values, j/10) bit by bit.
+    :param values: numpy array of values in one bin
+    :param percentile_number: number of percentiles, the j-th is at j*100/percentile_number
+    :return: a list of numpy float64 percentiles
+    """
+    return list(np.percentile(values, np.arange(percentile_number) * 100 / percentile_number))
+
+
+def bootstrap_percentiles(values, num_resample=1000, percentile_number=1000, confidence=0.95, seed=None,
+                          chunk_size=2**22):
+    """ Bootstrap confidence intervals of the percentiles of one bin.
+    A resample of sorted values is a vector of counts, so its order statistics are found by searchsorted on the
+    cumulative counts rather than by sorting, resamples are drawn as an index matrix of chunk_size entries at a time.
+    :param values: numpy float array of values in one bin
+    :param num_resample: number of bootstrap resamples
+    :param percentile_number: number of percentiles, the j-th is at j*100/percentile_number
+    :param confidence: confidence level of the intervals
+    :param seed: seed of resampling, or a numpy RandomState
+    :return: numpy float arrays of lower and upper bounds, one per percentile
+    """
+    values = np.sort(values)
+    num_value = len(values)
+    rng = seed if isinstance(seed, np.random.RandomState) else np.random.RandomState(seed)
+    ranks = np.arange(percentile_number) * 100 / percentile_number / 100 * (num_value - 1)
+    lower_ranks, upper_ranks = np.floor(ranks), np.ceil(ranks)
+    resampled_percentiles = np.empty((num_resample, percentile_number))
+    rows_per_chunk = max(1, chunk_size // num_value)
+    for start in range(0, num_resample, rows_per_chunk):
+        num_row = min(rows_per_chunk, num_resample - start)
+        # flat cumulative counts of all rows, the r-th row starts at r*num_value
+        row_starts = (np.arange(num_row) * num_value)[:, None]
+        indices = rng.randint(0, num_value, (num_row, num_value)) + row_starts
+        cum_counts = np.cumsum(np.bincount(indices.ravel(), minlength=num_row * num_value))
+        lower_values = values[np.searchsorted(cum_counts, row_starts + lower_ranks, side='right') - row_starts]
+        upper_values = values[np.searchsorted(cum_counts, row_starts + upper_ranks, side='right') - row_starts]
+        resampled_percentiles[start: start + num_row] = \
+            lower_values + (upper_values - lower_values) * (ranks - lower_ranks)
+    alpha = (1 - confidence) / 2 * 100
+    lower_bounds, upper_bounds = np.percentile(resampled_percentiles, [alpha, 100 - alpha], axis=0)
+    return lower_bounds, upper_bounds
+
+
+def _bootstrap_job(args):
+    """ Unpack one (values, num_resample, percentile_number, confidence, seed) job for the worker pool. """
+    return bootstrap_percentiles(*args)
+
+
+def get_watch_times(durations, watch_percentages):
+    """ Average watch time in log10 scale, the watch time engagement metric.
+    :param durations: numpy int array of video durations in seconds
+    :param watch_percentages: numpy float array aligned with durations
+    :return: numpy float array of log10(duration * watch percentage)
+    """
+    return np.log10(np.asarray(durations) * np.asarray(watch_percentages))
+
+
+class EngagementMapBuilder(object):
+    def __init__(self, durations, split_points, log_scale=True, counts=None):
+        """
+        :param durations: numpy int array of video durations in seconds, or of distinct durations if counts is given
+        :param split_points: increasing ideal duration split points, in log10 scale if log_scale is True
+        :param log_scale: compare log10 of durations with split points, otherwise durations themselves
+        :param counts: numpy int array of number of videos of each distinct duration, default count from durations
+        """
+        durations = np.asarray(durations)
+        if counts is None:
+            # stable sort keeps videos of equal duration in input order, the same as sorted() on tuples by duration
+            self.sort_idx = np.argsort(durations, kind='mergesort')
+            self.unique_durations, counts = np.unique(durations, return_counts=True)
+        else:
+            self.sort_idx = None
+            sort_idx = np.argsort(durations)
+            self.unique_durations, counts = durations[sort_idx], np.asarray(counts)[sort_idx]
+        self.split_points = np.asarray(split_points)
+        # sorted position of the first video of each distinct duration
+        self.group_starts = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.num_video = int(self.group_starts[-1])
+        self.seen_counts = np.zeros(len(self.unique_durations), dtype=np.int64)
+        positions = np.log10(self.unique_durations) if log_scale else self.unique_durations
+        self._walk(np.searchsorted(self.split_points, positions, side='left'))
+
+    def _walk(self, num_passed):
+        """ Walk sorted videos against split points, one group of equal durations at a time.
+        A video at split point index b advances to b+1 if it passes split point b, i.e., b < num_passed, so the index
+        after the last video of the g-th group is B_g = min(B_g-1 + count_g, num_passed_g), and the first
+        B_g - B_g-1 videos of the group advance. Unrolled, B_g = C_g + min(0, min_{j<=g}(num_passed_j - C_j)), where C_g
+        is the number of videos up to the g-th group.
+        :param num_passed: numpy int array, number of split points below each distinct duration
+        """
+        cum_counts = self.group_starts[1:]
+        if len(cum_counts) > 0:
+            bin_indices = cum_counts + np.minimum(0, np.minimum.accumulate(num_passed - cum_counts))
+        else:
+            bin_indices = np.zeros(0, dtype=np.int64)
+        num_advance = np.diff(np.concatenate([[0], bin_indices]))
+        advance_groups = np.repeat(np.arange(len(num_advance)), num_advance)
+        advance_steps = np.arange(len(advance_groups)) - np.repeat(np.cumsum(num_advance) - num_advance, num_advance)
+        # sorted positions of videos that advance the walk, and the split point index after each of them
+        self.advances = self.group_starts[advance_groups] + advance_steps
+        self.advance_bin_indices = (bin_indices - num_advance)[advance_groups] + advance_steps + 1
+        self.advance_durations = self.unique_durations[advance_groups]
+
+    def get_bin_offsets(self, min_bin_size=None):
+        """ Bin boundaries in sorted order, a bin is closed right before a video that advances the walk.
+        :param min_bin_size: close a bin only if it holds at least min_bin_size videos, otherwise it merges into
+                             the next bin, default close a bin at every advance, even an empty one
+        :return: numpy int64 offsets of length num_bins+1, the i-th bin is [offsets[i], offsets[i+1]) of sorted videos
+        """
+        if self.num_video == 0:
+            return np.zeros(1, dtype=np.int64)
+        if min_bin_size is None:
+            bin_starts = [0] + self.advances.tolist()
+        else:
+            bin_starts = [0]
+            for position in self.advances.tolist():
+                if position - bin_starts[-1] >= min_bin_size:
+                    bin_starts.append(position)
+        return np.array(bin_starts + [self.num_video], dtype=np.int64)
+
+    def get_bins(self, values, offsets):
+        """ Split values into bins.
+        :param values: numpy array aligned with input durations, e.g., watch percentage
+        :param offsets: bin boundaries from get_bin_offsets
+        :return: a list of numpy arrays, one per bin
+        """
+        if self.sort_idx is None:
+            raise ValueError('a builder set up from duration counts has no videos to bin, use assign_bins instead')
+        values = np.asarray(values)[self.sort_idx]
+        return [values[start: end] for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+    def assign_bins(self, durations, offsets):
+        """ Bin index of each video in a batch, for videos streamed in the same order as they were counted.
+        Videos of equal duration can fall into two bins, the earlier ones go to the lower bin as in a stable sort.
+        :param durations: numpy int array of video durations of a batch
+        :param offsets: bin boundaries from get_bin_offsets
+        :return: numpy int array of bin indices
+        """
+        groups = np.searchsorted(self.unique_durations, durations)
+        # rank of each video among videos of the same duration, in arrival order
+        sort_idx = np.argsort(groups, kind='mergesort')
+        sorted_groups = groups[sort_idx]
+        steps = np.arange(len(groups))
+        is_group_head = np.concatenate([[True], sorted_groups[1:] != sorted_groups[:-1]])
+        ranks = np.empty(len(groups), dtype=np.int64)
+        ranks[sort_idx] = steps - np.maximum.accumulate(np.where(is_group_head, steps, 0))
+        positions = self.group_starts[groups] + self.seen_counts[groups] + ranks
+        self.seen_counts += np.bincount(groups, minlength=len(self.seen_counts))
+        return np.searchsorted(offsets, positions, side='right') - 1
+
+    def get_duration_splits(self, offsets, use_split_points=False):
+        """ Duration split between each two adjacent bins.
+        :param offsets: bin boundaries from get_bin_offsets
+        :param use_split_points: use the split point reached by the video that opens the next bin, default use the
+                                 duration of that video minus one second
+        :return: a list of num_bins-1 duration splits
+        """
+        # every bin but the first opens at an advance
+        advance_idx = np.searchsorted(self.advances, offsets[1:-1])
+        if use_split_points:
+            return list(self.split_points[self.advance_bin_indices[advance_idx]])
+        return (self.advance_durations[advance_idx] - 1).tolist()
+
+    def build(self, watch_percentages, min_bin_size=50, percentile_number=1000, use_split_points=False,
+              watch_times=None):
+        """ Build an engagement map, in format of {'duration': duration splits, bin index: percentiles list}.
+        :param watch_percentages: numpy float array aligned with input durations
+        :param min_bin_size: minimal number of videos in a bin
+        :param percentile_number: number of percentiles in each bin
+        :param use_split_points: split bins at split points rather than at durations, see get_duration_splits
+        :param watch_times: numpy float array of log10 watch time aligned with input durations, see get_watch_times,
+                            default no watch time percentiles
+        :return: an engagement map dict
+        """
+        offsets = self.get_bin_offsets(min_bin_size)
+        engagement_map = {'duration': self.get_duration_splits(offsets, use_split_points)}
+        for bin_idx, wp_bin in enumerate(self.get_bins(watch_percentages, offsets)):
+            engagement_map[bin_idx] = get_percentiles(wp_bin, percentile_number)
+        if watch_times is not None:
+            # the same bins, percentiles of another metric
+            engagement_map['watch_time'] = [get_percentiles(wt_bin, percentile_number)
+                                            for wt_bin in self.get_bins(watch_times, offsets)]
+        return engagement_map
+
+    def bootstrap(self, watch_percentages, min_bin_size=50, percentile_number=1000, num_resample=1000,
+                  confidence=0.95, seed=None, pool=None):
+        """ Bootstrap confidence bands of the percentiles of each bin, bins are the same as build.
+        :param watch_percentages: numpy float array aligned with input durations
+        :param min_bin_size: minimal number of videos in a bin
+        :param percentile_number: number of percentiles in each bin
+        :param num_resample: number of bootstrap resamples of each bin
+        :param confidence: confidence level of the bands
+        :param seed: seed of resampling, each bin draws from its own stream, so bands do not depend on the pool
+        :param pool: a multiprocessing pool to spread bins across, default run in this process
+        :return: duration splits, and 2-D numpy arrays of lower and upper bounds, one row per bin
+        """
+        offsets = self.get_bin_offsets(min_bin_size)
+        bins = self.get_bins(watch_percentages, offsets)
+        seeds = np.random.RandomState(seed).randint(2 ** 31, size=len(bins)).tolist()
+        jobs = [(wp_bin, num_resample, percentile_number, confidence, bin_seed)
+                for wp_bin, bin_seed in zip(bins, seeds)]
+        bands = pool.imap(_bootstrap_job, jobs) if pool is not None else map(_bootstrap_job, jobs)
+        lower_bounds, upper_bounds = zip(*bands) if len(jobs) > 0 else ([], [])
+        return self.get_duration_splits(offsets), np.array(lower_bounds), np.array(upper_bounds)
+
+    def skip_videos(self, durations, counts):
+        """ Mark videos streamed elsewhere as seen, e.g., by workers of earlier shards, so that assign_bins continues
+        after them and splits videos of equal duration across bins the same way as a single pass.
+        :param durations: numpy int array of distinct durations
+        :param counts: numpy int array of number of videos of each duration
+        """
+        self.seen_counts[np.searchsorted(self.unique_durations, durations)] += counts
+
+    def summarize(self, batches, offsets, k=4096, seed=None, watch_time=True):
+        """ Stream videos into one quantile sketch per bin, a partial summary that merges with other partial summaries.
+        :param batches: an iterable of (durations, watch percentages) numpy arrays, in the same order as counted
+        :param offsets: bin boundaries from get_bin_offsets
+        :param k: number of values a sketch level holds, None to keep all values for exact percentiles
+        :param seed: seed of random offsets in sketch compactions
+        :param watch_time: also keep a sketch of log10 watch time in each bin
+        :return: a list of QuantileSketch objects of watch percentage, one per bin, and a list of QuantileSketch
+                 objects of log10 watch time, one per bin, None if watch_time is False
+        """
+        rng = np.random.RandomState(seed)
+        sketches = [QuantileSketch(k, rng) for _ in range(len(offsets) - 1)]
+        watch_time_sketches = [QuantileSketch(k, rng) for _ in range(len(offsets) - 1)] if watch_time else None
+        for durations, watch_percentages in batches:
+            bin_indices = self.assign_bins(durations, offsets)
+            sort_idx = np.argsort(bin_indices, kind='mergesort')
+            bin_offsets = np.searchsorted(bin_indices[sort_idx], np.arange(len(sketches) + 1))
+            watch_percentages = np.asarray(watch_percentages)[sort_idx]
+            if watch_time:
+                watch_times = get_watch_times(np.asarray(durations)[sort_idx], watch_percentages)
+            for bin_idx in np.flatnonzero(np.diff(bin_offsets)).tolist():
+                start, end = bin_offsets[bin_idx], bin_offsets[bin_idx + 1]
+                sketches[bin_idx].update(watch_percentages[start: end])
+                if watch_time:
+                    watch_time_sketches[bin_idx].update(watch_times[start: end])
+        return sketches, watch_time_sketches
+
+    def build_from_summaries(self, sketches, offsets, percentile_number=1000, use_split_points=False,
+                             watch_time_sketches=None):
+        """ Build an engagement map from quantile sketches of its bins.
+        :param sketches: a list of QuantileSketch objects of watch percentage, one per bin
+        :param offsets: bin boundaries from get_bin_offsets
+        :param percentile_number: number of percentiles in each bin
+        :param use_split_points: split bins at split points rather than at durations, see get_duration_splits
+        :param watch_time_sketches: a list of QuantileSketch objects of log10 watch time, one per bin,
+                                    default no watch time percentiles
+        :return: an engagement map dict
+        """
+        engagement_map = {'duration': self.get_duration_splits(offsets, use_split_points)}
+        q = np.arange(percentile_number) * 100 / percentile_number
+        for bin_idx, sketch in enumerate(sketches):
+            engagement_map[bin_idx] = list(sketch.percentile(q))
+        if watch_time_sketches is not None:
+            engagement_map['watch_time'] = [list(sketch.percentile(q)) for sketch in watch_time_sketches]
+        return engagement_map
+
+    def build_with_sketches(self, batches, min_bin_size=50, percentile_number=1000, use_split_points=False, k=4096,
+                            seed=None, watch_time=True):
+        """ Build an engagement map in bounded memory, watch percentages of each bin are kept in a quantile sketch.
+        Bins are the same as those of build, percentiles are estimated within the rank error bound of each sketch.
+        :param batches: an iterable of (durations, watch percentages) numpy arrays, in the same order as counted
+        :param min_bin_size: minimal number of videos in a bin
+        :param percentile_number: number of percentiles in each bin
+        :param use_split_points: split bins at split points rather than at durations, see get_duration_splits
+        :param k: number of values a sketch level holds, see QuantileSketch
+        :param seed: seed of random offsets in sketch compactions
+        :param watch_time: also keep percentiles of log10 watch time in each bin, from a sketch of its own
+        :return: an engagement map dict, and a numpy array of the normalized rank error bound of each bin's
+                 watch percentage sketch
+        """
+        offsets = self.get_bin_offsets(min_bin_size)
+        sketches, watch_time_sketches = self.summarize(batches, offsets, k, seed, watch_time)
+        engagement_map = self.build_from_summaries(sketches, offsets, percentile_number, use_split_points,
+                                                   watch_time_sketches)
+        return engagement_map, np.array([sketch.get_rank_error_bound() for sketch in sketches])
+
+
+def build_segment_maps(durations, watch_percentages, segments, split_points, min_bin_size=50, percentile_number=1000,
+                       watch_times=None):
+    """ Build one engagement map per segment, each segment keeps its videos in input order, so its map is the same
+    as the map built from its videos alone.
+    :param durations: numpy int array of video durations in seconds
+    :param watch_percentages: numpy float array aligned with durations
+    :param segments: numpy array of segment values aligned with durations, e.g., category ids
+    :param split_points: increasing ideal duration split points in log10 scale
+    :param min_bin_size: minimal number of videos in a bin
+    :param percentile_number: number of percentiles in each bin
+    :param watch_times: numpy float array of log10 watch time aligned with durations, default no watch time map
+    :return: a dict of segment value: engagement map dict
+    """
+    segment_values, inverse = np.unique(np.asarray(segments), return_inverse=True)
+    sort_idx = np.argsort(inverse, kind='mergesort')
+    segment_offsets = np.searchsorted(inverse[sort_idx], np.arange(len(segment_values) + 1))
+    segment_maps = {}
+    for segment_value, start, end in zip(segment_values.tolist(), segment_offsets[:-1], segment_offsets[1:]):
+        idx = sort_idx[start: end]
+        builder = EngagementMapBuilder(np.asarray(durations)[idx], split_points)
+        segment_maps[segment_value] = builder.build(np.asarray(watch_percentages)[idx], min_bin_size=min_bin_size,
+                                                    percentile_number=percentile_number,
+                                                    watch_times=None if watch_times is None else watch_times[idx])
+    return segment_maps
+
+
+def merge_summaries(summaries):
+    """ Merge partial summaries of shards bin by bin.
+    :param summaries: a list of partial summaries, each a list of QuantileSketch objects of the same bins
+    :return: a list of merged QuantileSketch objects, one per bin
+    """
+    merged = summaries[0]
+    for summary in summaries[1:]:
+        for sketch, other in zip(merged, summary):
+            sketch.merge(other)
+    return merged
+
+
+def compare_engagement_maps(exact_map, approx_map):
+    """ Compare an approximate engagement map with the exact one built from the same videos and bins.
+    :param exact_map: exact engagement map dict
+    :param approx_map: approximate engagement map dict with the same duration splits
+    :return: numpy arrays of the max absolute watch percentage difference in each bin, and the max absolute
+             relative engagement difference in each bin, i.e., how far the rank of an approximate percentile in
+             the exact bin is from the rank it stands for
+    """
+    if list(exact_map['duration']) != list(approx_map['duration']):
+        raise ValueError('engagement maps have different duration splits')
+    num_bin = len(exact_map['duration']) + 1
+    wp_diffs = np.zeros(num_bin)
+    re_diffs = np.zeros(num_bin)
+    for bin_idx in range(num_bin):
+        exact_percentiles = np.array(exact_map[bin_idx])
+        approx_percentiles = np.array(approx_map[bin_idx])
+        wp_diffs[bin_idx] = np.max(np.abs(exact_percentiles - approx_percentiles))
+        # the rank range of a value in the exact bin is [#percentiles < value, #percentiles <= value]
+        num_percentile = len(exact_percentiles)
+        target_ranks = np.arange(num_percentile)
+        lower_ranks = np.searchsorted(exact_percentiles, approx_percentiles, side='left')
+        upper_ranks = np.searchsorted(exact_percentiles, approx_percentiles, side='right') - 1
+        rank_diffs = np.maximum(0, np.maximum(lower_ranks - target_ranks, target_ranks - upper_ranks))
+        re_diffs[bin_idx] = np.max(rank_diffs) / num_percentile
+    return wp_diffs, re_diffs
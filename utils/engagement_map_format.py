@@ -0,0 +1,149 @@
+""" Compact binary format of engagement maps, memory-mapped on load without parsing or copying.
+
+A pickled engagement map is a dict of one list of Python floats per bin, loading it allocates every float as an
+object. A binary engagement map file (.emap) holds the same map as three sections, little endian:
+    a 64-byte header: magic b'EMAP', uint16 format version, uint8 byte size of percentiles (4 for float32, 8 for
+    float64), uint8 kind of duration splits (0 for int64 as in engagement_map.p, 1 for float64 as in temporal maps),
+    uint64 number of bins, uint64 number of percentiles in each bin, uint8 number of metrics, zero padding,
+    the num_bins-1 duration splits, at byte 64,
+    the num_metrics x num_bins x num_percentiles percentile matrices in row-major order, at the next multiple of 64
+    bytes, the first of watch percentage, the second of log10 watch time if the map has one.
+Pickled maps convert to and from this format without loss in float64, see import_pickle and export_pickle.
+"""
+
+import os, pickle, struct
+import numpy as np
+
+EMAP_MAGIC = b'EMAP'
+EMAP_VERSION = 1
+HEADER_FORMAT = '<4sHBBQQB'
+HEADER_SIZE = 64
+SPLIT_DTYPES = [np.dtype('<i8'), np.dtype('<f8')]
+PERCENTILE_DTYPES = {4: np.dtype('<f4'), 8: np.dtype('<f8')}
+
+
+def _get_matrix_offset(num_bins):
+    split_end = HEADER_SIZE + 8 * max(num_bins - 1, 0)
+    return (split_end + HEADER_SIZE - 1) // HEADER_SIZE * HEADER_SIZE
+
+
+def is_binary_engagement_map(path):
+    """ Check whether a file is a binary engagement map by its magic bytes. """
+    with open(path, 'rb') as fin:
+        return fin.read(len(EMAP_MAGIC)) == EMAP_MAGIC
+
+
+def to_arrays(engagement_map, dtype=np.float64):
+    """ Convert an engagement map dict to numpy arrays.
+    :param engagement_map: engagement map dict, in format of {'duration': splits, bin index: percentiles list},
+                           optionally with a list of watch time percentiles lists under key 'watch_time'
+    :param dtype: dtype of percentile matrices, np.float64 or np.float32
+    :return: numpy array of duration splits, 2-D numpy array of watch percentage percentiles, one row per bin, and
+             2-D numpy array of watch time percentiles, None if the map has none
+    """
+    duration_splits = np.asarray(engagement_map['duration'])
+    if not np.issubdtype(duration_splits.dtype, np.floating):
+        duration_splits = duration_splits.astype(np.int64)
+    num_bins = len(duration_splits) + 1 if 0 in engagement_map else 0
+    percentiles = np.array([engagement_map[bin_idx] for bin_idx in range(num_bins)], dtype=dtype)
+    if num_bins == 0:
+        percentiles = percentiles.reshape(0, 0)
+    watch_time_percentiles = None
+    if 'watch_time' in engagement_map:
+        watch_time_percentiles = np.array(engagement_map['watch_time'], dtype=dtype).reshape(percentiles.shape)
+    return duration_splits, percentiles, watch_time_percentiles
+
+
+def to_dict(duration_splits, percentiles, watch_time_percentiles=None):
+    """ Convert numpy arrays back to an engagement map dict, the format of engagement_map.p.
+    :param duration_splits: numpy array of duration splits
+    :param percentiles: 2-D numpy array of watch percentage percentiles, one row per bin
+    :param watch_time_percentiles: 2-D numpy array of watch time percentiles, default none
+    :return: an engagement map dict
+    """
+    if np.issubdtype(duration_splits.dtype, np.floating):
+        engagement_map = {'duration': list(np.asarray(duration_splits, dtype=np.float64))}
+    else:
+        engagement_map = {'duration': np.asarray(duration_splits).tolist()}
+    for bin_idx, row in enumerate(np.asarray(percentiles, dtype=np.float64)):
+        engagement_map[bin_idx] = list(row)
+    if watch_time_percentiles is not None:
+        engagement_map['watch_time'] = [list(row) for row in np.asarray(watch_time_percentiles, dtype=np.float64)]
+    return engagement_map
+
+
+def save_engagement_map(engagement_map, path, dtype=np.float64):
+    """ Write an engagement map dict to a binary engagement map file.
+    :param engagement_map: engagement map dict
+    :param path: output file path, e.g., ../data/engagement_map.emap
+    :param dtype: dtype of percentile matrix, np.float64 keeps percentiles exactly, np.float32 halves the size
+    """
+    if 'segments' in engagement_map:
+        raise ValueError('segmented engagement maps are stored pickled only')
+    duration_splits, *matrices = to_arrays(engagement_map, dtype)
+    matrices = [matrix for matrix in matrices if matrix is not None]
+    num_bins, percentile_number = matrices[0].shape
+    split_kind = 1 if np.issubdtype(duration_splits.dtype, np.floating) else 0
+    header = struct.pack(HEADER_FORMAT, EMAP_MAGIC, EMAP_VERSION, matrices[0].dtype.itemsize, split_kind,
+                         num_bins, percentile_number, len(matrices))
+    with open(path, 'wb') as fout:
+        fout.write(header.ljust(HEADER_SIZE, b'\0'))
+        fout.write(duration_splits.astype(SPLIT_DTYPES[split_kind]).tobytes())
+        fout.write(b'\0' * (_get_matrix_offset(num_bins) - fout.tell()))
+        for matrix in matrices:
+            fout.write(matrix.astype(matrix.dtype.newbyteorder('<')).tobytes())
+
+
+def load_engagement_map(path, mmap=True):
+    """ Read a binary engagement map file.
+    :param path: binary engagement map file path
+    :param mmap: memory-map the arrays read-only, default True, otherwise read them into memory
+    :return: numpy array of duration splits, 2-D numpy array of watch percentage percentiles, one row per bin, and
+             2-D numpy array of watch time percentiles, None if the map has none
+    """
+    with open(path, 'rb') as fin:
+        magic, version, itemsize, split_kind, num_bins, percentile_number, num_metrics = \
+            struct.unpack(HEADER_FORMAT, fin.read(struct.calcsize(HEADER_FORMAT)))
+    if magic != EMAP_MAGIC:
+        raise ValueError('{0} is not a binary engagement map'.format(path))
+    if version != EMAP_VERSION:
+        raise ValueError('unsupported engagement map format version {0} in {1}'.format(version, path))
+    split_dtype, percentile_dtype = SPLIT_DTYPES[split_kind], PERCENTILE_DTYPES[itemsize]
+    matrix_size = num_bins * percentile_number * itemsize
+    sections = [(split_dtype, HEADER_SIZE, (max(num_bins - 1, 0),))]
+    for metric_idx in range(num_metrics):
+        sections.append((percentile_dtype, _get_matrix_offset(num_bins) + metric_idx * matrix_size,
+                         (num_bins, percentile_number)))
+    arrays = []
+    for dtype, offset, shape in sections:
+        if np.prod(shape) == 0:
+            arrays.append(np.zeros(shape, dtype=dtype))
+        elif mmap:
+            arrays.append(np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape))
+        else:
+            with open(path, 'rb') as fin:
+                fin.seek(offset)
+                arrays.append(np.fromfile(fin, dtype=dtype, count=int(np.prod(shape))).reshape(shape))
+    return arrays[0], arrays[1], arrays[2] if num_metrics > 1 else None
+
+
+def import_pickle(pickle_path, path, dtype=np.float64):
+    """ Convert a pickled engagement map, e.g., engagement_map.p, to a binary engagement map file. """
+    with open(pickle_path, 'rb') as fin:
+        save_engagement_map(pickle.load(fin), path, dtype)
+
+
+def export_pickle(path, pickle_path):
+    """ Convert a binary engagement map file back to a pickled engagement map dict. """
+    with open(pickle_path, 'wb') as fout:
+        pickle.dump(to_dict(*load_engagement_map(path, mmap=False)), fout)
+
+
+def read_engagement_map(path):
+    """ Read an engagement map dict from either a pickled or a binary engagement map file. """
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    if is_binary_engagement_map(path):
+        return to_dict(*load_engagement_map(path, mmap=False))
+    with open(path, 'rb') as fin:
+        return pickle.load(fin)
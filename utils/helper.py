@@ -40,6 +40,113 @@ def read_as_float_array(content, truncated=None, delimiter=None):
         return np.array(list(map(float, content.split(delimiter)[:truncated])), dtype=np.float64)
 
 
+def read_as_ragged_array(contents, dtype=np.float64, truncated=None, delimiter=','):
+    """ Read many delimiter separated strings into one flat numpy array in a single parsing call.
+    :param contents: a list of string inputs
+    :param dtype: numpy dtype of elements, e.g., np.uint32 or np.float64
+    :param truncated: head number of elements extracted from each string, an int or an int array with one per string
+    :param delimiter: delimiter string
+    :return: a flat numpy array of all elements, and a numpy int64 offsets array of length len(contents)+1,
+             elements of the i-th string are values[offsets[i]: offsets[i+1]]
+    """
+    lengths = np.array([content.count(delimiter) + 1 for content in contents], dtype=np.int64)
+    values = np.fromstring(delimiter.join(contents), dtype=dtype, sep=delimiter)
+    if len(values) != np.sum(lengths):
+        raise ValueError('fail to parse all elements as {0}'.format(np.dtype(dtype).name))
+    if truncated is not None:
+        positions = np.arange(len(values)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        values = values[positions < np.repeat(np.minimum(lengths, truncated), lengths)]
+        lengths = np.minimum(lengths, truncated)
+    return values, lengths_to_offsets(lengths)
+
+
+def ragged_sum(values, offsets):
+    """ Sum each segment of a flat array that concatenates variable-length segments.
+    Segments of equal length are summed together along axis 1, so each result equals np.sum over that segment bit by bit.
+    :param values: flat numpy array of all segments
+    :param offsets: numpy int array of segment boundaries, the i-th segment is values[offsets[i]: offsets[i+1]]
+    :return: a numpy array of segment sums, 0 for empty segments
+    """
+    starts = np.asarray(offsets[:-1])
+    lengths = np.diff(offsets)
+    sums = np.zeros(len(lengths), dtype=np.sum(values[:0]).dtype)
+    for length in np.unique(lengths):
+        if length > 0:
+            segment_idx = np.flatnonzero(lengths == length)
+            sums[segment_idx] = np.sum(values[starts[segment_idx, None] + np.arange(length)], axis=1)
+    return sums
+
+
+def ragged_cumsum(values, offsets):
+    """ Cumulative sum within each segment of a flat array that concatenates variable-length segments.
+    Segments of equal length are accumulated together along axis 1, so each result equals np.cumsum over that segment.
+    :param values: flat numpy array of all segments
+    :param offsets: numpy int array of segment boundaries, the i-th segment is values[offsets[i]: offsets[i+1]]
+    :return: a flat numpy array of running sums, aligned with values
+    """
+    starts = np.asarray(offsets[:-1])
+    lengths = np.diff(offsets)
+    cumsums = np.zeros(len(values), dtype=np.cumsum(values[:0]).dtype)
+    for length in np.unique(lengths):
+        if length > 0:
+            positions = starts[lengths == length, None] + np.arange(length)
+            cumsums[positions] = np.cumsum(values[positions], axis=1)
+    return cumsums
+
+
+def lengths_to_offsets(lengths):
+    """ Convert segment lengths into segment boundaries of a flat array.
+    :param lengths: numpy int array of segment lengths
+    :return: a numpy int64 offsets array of length len(lengths)+1
+    """
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def count_rows_at_most(matrix, row_idx, values, is_increasing=None):
+    """ Count entries <= value in one row of a matrix for each value, same as np.sum(matrix[row_idx] <= value).
+    Increasing rows are bisected all at once, as np.searchsorted with side='right' on each row, other rows are counted
+    in full. Values are compared in the dtype of the matrix, a NaN value counts 0.
+    :param matrix: 2-D numpy array, e.g., percentiles of an engagement map with one row per bin
+    :param row_idx: numpy int array, the row of each value
+    :param values: numpy array of values aligned with row_idx
+    :param is_increasing: whether all rows are increasing, default checked on the matrix
+    :return: numpy int array of counts
+    """
+    values = np.asarray(values).astype(matrix.dtype)
+    if is_increasing is None:
+        is_increasing = np.all(np.diff(matrix, axis=1) >= 0)
+    if not is_increasing:
+        return np.sum(matrix[row_idx] <= values[..., np.newaxis], axis=-1)
+    num_column = matrix.shape[1]
+    lower = np.zeros(values.shape, dtype=np.int64)
+    upper = np.full(values.shape, num_column, dtype=np.int64)
+    while np.any(lower < upper):
+        middle = (lower + upper) // 2
+        is_searching = lower < upper
+        is_right = is_searching & (matrix[row_idx, np.minimum(middle, num_column - 1)] <= values)
+        lower = np.where(is_right, middle + 1, lower)
+        upper = np.where(is_searching & ~is_right, middle, upper)
+    return lower
+
+
+def iter_batches(iterable, batch_size):
+    """ Group an iterable into lists of batch_size items, the last list may be shorter.
+    :param iterable: an iterable structure, e.g., lines of a file
+    :param batch_size: number of items in each list
+    :return: a generator of lists
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
 def strify(iterable_struct, delimiter=','):
     """ Convert an iterable structure to comma separated string.
     :param iterable_struct: an iterable structure
@@ -0,0 +1,186 @@
+""" Count cube of videos by category, integer duration and watch percentage bucket, built once over the dataset.
+
+Watch percentage in [0, 1] is quantised into bucket_number equal buckets, a cube cell counts the videos of one
+category and one duration whose watch percentage falls in one bucket. Only non-empty cells are kept, as sorted int64
+keys of (category id, duration, bucket) and their counts, so cubes of batches merge by adding counts of equal keys.
+
+Any engagement map configuration, i.e., split points, minimal bin size, number of percentiles and a subset of
+categories, is derived from the cube without reading the dataset, see get_engagement_map. Bins are the same as
+EngagementMapBuilder builds from the same videos, as they only depend on duration counts. Each percentile is taken on
+bucket midpoints, so in a bin whose boundaries fall between two durations, it is within 0.5/bucket_number of the exact
+percentile of the videos in the bin. The cube does not keep the arrival order of videos, so when a bin boundary falls
+inside one duration, videos of that duration are split between the bins evenly over their buckets, instead of by
+arrival order. Those bins hold other videos than the exact map and have no bound, get_engagement_map reports them.
+The cube counts watch percentage only, so derived maps hold no 'watch_time' percentiles.
+"""
+
+import numpy as np
+
+from utils.engagement_map_builder import EngagementMapBuilder
+
+CUBE_VERSION = 1
+# durations are below 2^31 seconds, keys are ((category id * MAX_DURATION) + duration) * bucket_number + bucket
+MAX_DURATION = 2 ** 31
+
+
+class HistogramCube(object):
+    def __init__(self, bucket_number=10000):
+        """
+        :param bucket_number: number of equal watch percentage buckets in [0, 1]
+        """
+        self.bucket_number = bucket_number
+        self.categories = []
+        self.category_ids = {}
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        # cells of all categories, aggregated at the first query after an update
+        self._cells = None
+
+    def __len__(self):
+        return int(np.sum(self.counts))
+
+    def update(self, durations, watch_percentages, categories=None):
+        """ Add a batch of videos.
+        :param durations: numpy int array of video durations in seconds
+        :param watch_percentages: numpy float array of watch percentages in [0, 1] aligned with durations
+        :param categories: a list of category id strings aligned with durations, default all in category ''
+        """
+        if categories is None:
+            categories = [''] * len(durations)
+        for category in set(categories) - set(self.category_ids):
+            self.category_ids[category] = len(self.categories)
+            self.categories.append(category)
+        category_ids = np.array([self.category_ids[category] for category in categories], dtype=np.int64)
+        buckets = np.minimum((np.asarray(watch_percentages) * self.bucket_number).astype(np.int64),
+                             self.bucket_number - 1)
+        keys = (category_ids * MAX_DURATION + np.asarray(durations, dtype=np.int64)) * self.bucket_number + buckets
+        keys, inverse = np.unique(np.concatenate([self.keys, keys]), return_inverse=True)
+        self.counts = np.bincount(inverse, weights=np.concatenate([self.counts, np.ones(len(buckets))]),
+                                  minlength=len(keys)).astype(np.int64)
+        self.keys = keys
+        self._cells = None
+
+    def get_cells(self, categories=None):
+        """ Non-empty (duration, bucket) cells of a subset of categories, sorted by duration then bucket.
+        :param categories: an iterable of category id strings, default all categories
+        :return: numpy int arrays of durations, buckets and counts of cells
+        """
+        if categories is None and self._cells is not None:
+            return self._cells
+        cell_keys = self.keys % (MAX_DURATION * self.bucket_number)
+        counts = self.counts
+        if categories is not None:
+            selected_ids = [self.category_ids[category] for category in map(str, categories)
+                            if category in self.category_ids]
+            mask = np.isin(self.keys // (MAX_DURATION * self.bucket_number), selected_ids)
+            cell_keys, counts = cell_keys[mask], counts[mask]
+        if len(self.categories) > 1:
+            cell_keys, inverse = np.unique(cell_keys, return_inverse=True)
+            counts = np.bincount(inverse, weights=counts, minlength=len(cell_keys)).astype(np.int64)
+        cells = cell_keys // self.bucket_number, cell_keys % self.bucket_number, counts
+        if categories is None:
+            self._cells = cells
+        return cells
+
+    def get_bin_histograms(self, split_points, min_bin_size=50, categories=None):
+        """ Bucket counts of each bin, bins are walked from duration counts as in EngagementMapBuilder.
+        :param split_points: increasing ideal duration split points in log10 scale
+        :param min_bin_size: minimal number of videos in a bin
+        :param categories: an iterable of category id strings, default all categories
+        :return: an EngagementMapBuilder, bin offsets, a numpy float64 array of num_bins*bucket_number counts,
+                 the count of bucket j of bin i is at i*bucket_number+j, and a sorted list of split bins, i.e., bins
+                 with a boundary inside one duration
+        """
+        durations, buckets, counts = self.get_cells(categories)
+        # first cell of each duration, durations are non-negative so the first cell is always a head
+        group_heads = np.flatnonzero(np.diff(np.concatenate([[-1], durations])))
+        group_ends = np.append(group_heads[1:], len(durations))
+        builder = EngagementMapBuilder(durations[group_heads], split_points,
+                                       counts=np.add.reduceat(counts, group_heads) if len(counts) > 0 else counts)
+        offsets = builder.get_bin_offsets(min_bin_size)
+
+        # bins of the first and last video of each duration, a duration in one bin puts all its cells in that bin
+        group_starts = builder.group_starts
+        first_bins = np.searchsorted(offsets, group_starts[:-1], side='right') - 1
+        last_bins = np.searchsorted(offsets, group_starts[1:] - 1, side='right') - 1
+        cell_groups = np.repeat(np.arange(len(group_heads)), group_ends - group_heads)
+        is_whole = (first_bins == last_bins)[cell_groups]
+        bin_indices = [first_bins[cell_groups][is_whole]]
+        bin_buckets = [buckets[is_whole]]
+        bin_counts = [counts[is_whole]]
+        split_bins = set()
+        for group_idx in np.flatnonzero(first_bins != last_bins).tolist():
+            # spread the videos of each bucket evenly over the duration, then cut them at bin offsets
+            cell_start, cell_end = group_heads[group_idx], group_ends[group_idx]
+            group_counts = counts[cell_start: cell_end]
+            video_buckets = np.repeat(buckets[cell_start: cell_end], group_counts)
+            steps = np.arange(len(video_buckets)) - np.repeat(np.cumsum(group_counts) - group_counts, group_counts)
+            video_buckets = video_buckets[np.argsort((steps + 0.5) / np.repeat(group_counts, group_counts),
+                                                     kind='mergesort')]
+            cuts = np.clip(offsets[first_bins[group_idx]: last_bins[group_idx] + 2] - group_starts[group_idx],
+                           0, len(video_buckets))
+            for bin_idx, start, end in zip(range(first_bins[group_idx], last_bins[group_idx] + 1),
+                                           cuts[:-1].tolist(), cuts[1:].tolist()):
+                split_bins.add(bin_idx)
+                segment_buckets, segment_counts = np.unique(video_buckets[start: end], return_counts=True)
+                bin_indices.append(np.full(len(segment_buckets), bin_idx, dtype=np.int64))
+                bin_buckets.append(segment_buckets)
+                bin_counts.append(segment_counts)
+
+        histograms = np.bincount(np.concatenate(bin_indices) * self.bucket_number + np.concatenate(bin_buckets),
+                                 weights=np.concatenate(bin_counts), minlength=(len(offsets) - 1) * self.bucket_number)
+        return builder, offsets, histograms, sorted(split_bins)
+
+    def get_engagement_map(self, split_points=np.linspace(1, 5, 1000), min_bin_size=50, percentile_number=1000,
+                           categories=None):
+        """ Derive an engagement map from the cube, in the same format as EngagementMapBuilder.build.
+        Each percentile is within 0.5/bucket_number of the exact percentile of the videos in its bin, except in split
+        bins, whose boundary falls inside one duration, see module docstring.
+        :param split_points: increasing ideal duration split points in log10 scale
+        :param min_bin_size: minimal number of videos in a bin
+        :param percentile_number: number of percentiles in each bin
+        :param categories: an iterable of category id strings, default all categories
+        :return: an engagement map dict, and a list of split bin indices the bound does not cover
+        """
+        builder, offsets, histograms, split_bins = self.get_bin_histograms(split_points, min_bin_size, categories)
+        engagement_map = {'duration': builder.get_duration_splits(offsets)}
+        if builder.num_video == 0:
+            return engagement_map, []
+        # video ranks of every bin and percentile, linearly interpolated between bucket midpoints as np.percentile
+        # counts are below 2^53, float64 cumulative counts are exact
+        cum_counts = np.cumsum(histograms)
+        bin_sizes = np.diff(offsets)
+        ranks = np.arange(percentile_number) / percentile_number * (bin_sizes[:, None] - 1)
+        lower = np.floor(ranks)
+        bin_starts = offsets[:-1, None]
+        lower_buckets = np.searchsorted(cum_counts, bin_starts + lower, side='right') % self.bucket_number
+        upper_buckets = np.searchsorted(cum_counts, bin_starts + np.ceil(ranks), side='right') % self.bucket_number
+        lower_values = (lower_buckets + 0.5) / self.bucket_number
+        upper_values = (upper_buckets + 0.5) / self.bucket_number
+        percentiles = lower_values + (upper_values - lower_values) * (ranks - lower)
+        for bin_idx in range(len(bin_sizes)):
+            engagement_map[bin_idx] = list(percentiles[bin_idx])
+        return engagement_map, split_bins
+
+    def save(self, path):
+        """ Save the cube as an uncompressed npz file.
+        :param path: output file path, ends with .npz
+        """
+        np.savez(path, version=CUBE_VERSION, bucket_number=self.bucket_number, categories=np.array(self.categories),
+                 keys=self.keys, counts=self.counts)
+
+    @classmethod
+    def load(cls, path):
+        """ Load a cube saved by save.
+        :param path: npz file path
+        :return: a HistogramCube object
+        """
+        with np.load(path) as data:
+            if int(data['version']) != CUBE_VERSION:
+                raise ValueError('unsupported histogram cube version {0} in {1}'.format(data['version'], path))
+            cube = cls(int(data['bucket_number']))
+            cube.categories = data['categories'].tolist()
+            cube.category_ids = {category: category_id for category_id, category in enumerate(cube.categories)}
+            cube.keys = data['keys']
+            cube.counts = data['counts']
+        return cube
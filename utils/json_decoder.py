@@ -0,0 +1,74 @@
+""" Decode the fields of a raw video json line that the formatted dataset needs.
+
+Each record carries large strings that are never used downstream, e.g., title and description.
+A faster json backend is used when installed, in the order of orjson, pysimdjson, then the standard json module.
+pysimdjson parses lazily, so only the needed fields are materialized into python objects.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+if orjson is not None:
+    JSON_BACKEND = 'orjson'
+elif simdjson is not None:
+    JSON_BACKEND = 'simdjson'
+else:
+    JSON_BACKEND = 'json'
+
+SNIPPET_FIELDS = ('publishedAt', 'categoryId', 'detectLang', 'channelId')
+CONTENT_DETAILS_FIELDS = ('duration', 'definition')
+INSIGHTS_FIELDS = ('startDate', 'days', 'dailyView', 'dailyWatch')
+TOPIC_FIELDS = ('topicIds', 'relevantTopicIds')
+
+_simdjson_parser = simdjson.Parser() if simdjson is not None else None
+
+
+def _select_fields(video):
+    """ Select the needed fields from a parsed video object, works for both dict and simdjson lazy object.
+    """
+    snippet = video['snippet']
+    content_details = video['contentDetails']
+    insights = video['insights']
+    if 'topicDetails' in video:
+        topic_details = [list(video['topicDetails'][field]) if field in video['topicDetails'] else []
+                         for field in TOPIC_FIELDS]
+    else:
+        topic_details = None
+    return (video['id'],) \
+        + tuple(snippet[field] for field in SNIPPET_FIELDS) \
+        + tuple(content_details[field] for field in CONTENT_DETAILS_FIELDS) \
+        + (topic_details,) \
+        + tuple(insights[field] for field in INSIGHTS_FIELDS)
+
+
+def decode_video(line, backend=JSON_BACKEND):
+    """ Decode one raw video json line into a flat tuple of needed fields.
+    :param line: raw json line, str or bytes
+    :param backend: json backend, one of 'orjson', 'simdjson' and 'json'
+    :return: (id, publishedAt, categoryId, detectLang, channelId, duration, definition,
+              topic_details, startDate, days, dailyView, dailyWatch),
+              topic_details is None if the video has no topicDetails, otherwise [topicIds, relevantTopicIds]
+    """
+    if backend == 'orjson':
+        try:
+            return _select_fields(orjson.loads(line))
+        except orjson.JSONDecodeError:
+            # orjson is stricter than json module, e.g., on lone surrogates, keep json module as the reference
+            pass
+    elif backend == 'simdjson':
+        if isinstance(line, str):
+            line = line.encode('utf-8', 'surrogatepass')
+        try:
+            return _select_fields(_simdjson_parser.parse(line))
+        except ValueError:
+            pass
+    return _select_fields(json.loads(line))
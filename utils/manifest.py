@@ -0,0 +1,114 @@
+""" Manifest of converted input files, so that a rerun only converts new or changed inputs.
+
+The manifest is a json file of {'version': 1, 'files': {input key: entry}}, each entry records the input size,
+modification time in ns and sha1 of its content when it was converted, the output file it produced and its row count.
+The byte offset up to which the input is converted is also kept, together with the columnar parts that hold records
+appended after the first conversion, so a followed input only converts its newly appended lines.
+It is rewritten after each converted input, so a crash loses at most the inputs in progress.
+"""
+
+import os, json, hashlib
+
+MANIFEST_VERSION = 1
+
+
+def file_digest(path, size=None, block_size=1024*1024):
+    """ Compute sha1 hex digest of the head of a file.
+    :param path: file path
+    :param size: number of head bytes to digest, default the whole file
+    :param block_size: number of bytes read at once
+    :return: hex digest string
+    """
+    sha1 = hashlib.sha1()
+    remaining = os.path.getsize(path) if size is None else size
+    with open(path, 'rb') as fin:
+        while remaining > 0:
+            block = fin.read(min(block_size, remaining))
+            if not block:
+                break
+            sha1.update(block)
+            remaining -= len(block)
+    return sha1.hexdigest()
+
+
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r') as fin:
+                manifest = json.load(fin)
+            if manifest.get('version') != MANIFEST_VERSION:
+                raise ValueError('unsupported manifest version {0} in {1}'.format(manifest.get('version'), path))
+            self.entries = manifest['files']
+
+    def is_converted(self, key, size, mtime, digest_func=None):
+        """ Check whether an input is unchanged since it was converted.
+        An input with the same size but a different mtime is unchanged if its content hash matches, e.g., touched.
+        :param key: input key, e.g., path relative to input dir
+        :param size: current input size in bytes
+        :param mtime: current input modification time in ns
+        :param digest_func: function without argument that returns the current content hash, default compare mtime only
+        :return: True if the input has been converted and not changed since
+        """
+        entry = self.entries.get(key)
+        # an input followed up to a line that was still being written is not fully converted
+        if entry is None or entry['size'] != size or entry.get('offset', size) != size:
+            return False
+        if entry['mtime'] == mtime:
+            return True
+        if digest_func is not None and entry['hash'] is not None and digest_func() == entry['hash']:
+            entry['mtime'] = mtime
+            self.save()
+            return True
+        return False
+
+    def record(self, key, size, mtime, digest, output, num_rows, columnar=None, offset=None):
+        """ Record a converted input and save the manifest.
+        :param key: input key, e.g., path relative to input dir
+        :param size: input size in bytes when conversion started
+        :param mtime: input modification time in ns when conversion started
+        :param digest: sha1 hex digest of the converted input content, None if not available
+        :param output: output file name
+        :param num_rows: number of records in output
+        :param columnar: part name in columnar store, None if not written
+        :param offset: byte offset up to which the input is converted, default the whole input
+        """
+        self.entries[key] = {'size': size, 'mtime': mtime, 'hash': digest, 'output': output, 'rows': num_rows,
+                             'columnar': columnar, 'offset': size if offset is None else offset, 'tails': []}
+        self.save()
+
+    def record_tail(self, key, size, mtime, offset, num_rows, columnar_tail=None):
+        """ Record records appended to a converted input and save the manifest.
+        The content hash is cleared, it is not recomputed over the whole input at every append.
+        :param key: input key, e.g., path relative to input dir
+        :param size: input size in bytes when the tail conversion started
+        :param mtime: input modification time in ns when the tail conversion started
+        :param offset: byte offset up to which the input is converted now
+        :param num_rows: number of records appended to output
+        :param columnar_tail: part name in columnar store of the appended records, None if not written
+        """
+        entry = self.entries[key]
+        entry.update({'size': size, 'mtime': mtime, 'hash': None, 'offset': offset, 'rows': entry['rows'] + num_rows})
+        if columnar_tail is not None:
+            entry.setdefault('tails', []).append(columnar_tail)
+        self.save()
+
+    def get_offset(self, key):
+        """ Byte offset up to which an input is converted, None if it is not converted. """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        return entry.get('offset', entry['size'])
+
+    def get_tails(self, key):
+        """ Columnar part names of records appended to an input after its first conversion. """
+        entry = self.entries.get(key)
+        return [] if entry is None else entry.get('tails', [])
+
+    def save(self):
+        # write to a temporary file first, so an interrupted save keeps the previous manifest
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fout:
+            json.dump({'version': MANIFEST_VERSION, 'files': self.entries}, fout, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,133 @@
+""" Formatted dataset partitioned by publish date and category, so date-range selections skip files without scanning.
+
+A partitioned dataset is a directory tree publish=<yyyy-mm-dd>/category=<category id>/<name>.txt, where <name>.txt is
+the formatted text file the records come from. Each partition file is a formatted text file with the same header,
+its records keep the order they have in the formatted text file.
+Partitions are pruned by directory names only, see select_partitions.
+"""
+
+import os
+from glob import glob, escape
+from collections import defaultdict
+
+PUBLISH_PREFIX = 'publish='
+CATEGORY_PREFIX = 'category='
+
+
+def get_partition_path(partition_dir, publish, category, name):
+    """ Path of the partition file of records from one formatted text file.
+    :param partition_dir: partitioned dataset dir
+    :param publish: publish date string, yyyy-mm-dd
+    :param category: category id string
+    :param name: formatted text file name, e.g., music.txt
+    :return: partition file path
+    """
+    return os.path.join(partition_dir, PUBLISH_PREFIX + publish, CATEGORY_PREFIX + category, name)
+
+
+def _flush_partitions(buffers, written, partition_dir, name, header, append):
+    """ Write buffered records to their partition files, then empty the buffers.
+    :param buffers: dict of (publish, category) -> list of buffered record lines
+    :param written: set of (publish, category) whose partition files are already written by this split
+    """
+    for key, lines in buffers.items():
+        partition_path = get_partition_path(partition_dir, key[0], key[1], name)
+        if not os.path.exists(os.path.dirname(partition_path)):
+            os.makedirs(os.path.dirname(partition_path))
+        # a partition file is overwritten at its first flush, unless appending to an existing one
+        is_new = key not in written and not (append and os.path.exists(partition_path))
+        with open(partition_path, 'w' if is_new else 'a') as fout:
+            if is_new:
+                fout.write(header)
+            fout.writelines(lines)
+        written.add(key)
+    buffers.clear()
+
+
+def write_partitions(formatted_path, partition_dir, append=False, name=None, header=None, buffer_size=64*1024*1024):
+    """ Split the records of a formatted text file into partitions by publish date and category.
+    Records are buffered per partition and flushed when the buffers hold buffer_size bytes, so memory is bounded.
+    :param formatted_path: formatted text file path, with header
+    :param partition_dir: partitioned dataset dir
+    :param append: append to existing partition files, e.g., records appended to a followed input, default overwrite
+    :param name: partition file name, default the formatted text file name
+    :param header: header line of partition files if the formatted text file has none, e.g., a tail of appended records
+    :param buffer_size: number of buffered bytes of records over all partitions before they are flushed, default 64MB
+    :return: number of records written
+    """
+    if name is None:
+        name = os.path.basename(formatted_path)
+    buffers = defaultdict(list)
+    written = set()
+    num_rows = 0
+    num_bytes = 0
+    with open(formatted_path, 'r') as fin:
+        if header is None:
+            header = fin.readline()
+        for line in fin:
+            # publish and category are the 2nd and 5th columns
+            _, publish, _, _, category, _ = line.split('\t', 5)
+            buffers[(publish, category)].append(line)
+            num_rows += 1
+            num_bytes += len(line)
+            if num_bytes >= buffer_size:
+                _flush_partitions(buffers, written, partition_dir, name, header, append)
+                num_bytes = 0
+    _flush_partitions(buffers, written, partition_dir, name, header, append)
+    return num_rows
+
+
+def _glob_partitions(partition_dir, name):
+    """ List all partition files of records from one formatted text file. """
+    return glob(os.path.join(partition_dir, PUBLISH_PREFIX + '*', CATEGORY_PREFIX + '*', escape(name)))
+
+
+def remove_partitions(partition_dir, name):
+    """ Remove all partition files of records from one formatted text file, e.g., before it is partitioned again.
+    :param partition_dir: partitioned dataset dir
+    :param name: formatted text file name, e.g., music.txt
+    """
+    for partition_path in _glob_partitions(partition_dir, name):
+        os.remove(partition_path)
+
+
+def has_partitions(partition_dir, name):
+    """ Check whether any partition file holds records from one formatted text file. """
+    return len(_glob_partitions(partition_dir, name)) > 0
+
+
+def _list_values(dir_path, prefix):
+    """ List the partition values of sub dirs named <prefix><value>, in sorted order. """
+    if not os.path.isdir(dir_path):
+        return []
+    return sorted(d[len(prefix):] for d in os.listdir(dir_path)
+                  if d.startswith(prefix) and os.path.isdir(os.path.join(dir_path, d)))
+
+
+def select_partitions(partition_dir, start=None, end=None, categories=None, names=None):
+    """ Select partition files by publish date range and categories, pruned by directory names without reading files.
+    :param partition_dir: partitioned dataset dir
+    :param start: first publish date included, yyyy-mm-dd, default no lower bound
+    :param end: first publish date excluded, yyyy-mm-dd, default no upper bound
+    :param categories: an iterable of category id strings, default all categories
+    :param names: an iterable of formatted text file names, default all files
+    :return: a list of partition file paths, ordered by publish date, category and file name
+    """
+    if categories is not None:
+        categories = set(map(str, categories))
+    if names is not None:
+        names = set(names)
+    partition_paths = []
+    for publish in _list_values(partition_dir, PUBLISH_PREFIX):
+        # dates in yyyy-mm-dd compare in the same order as strings
+        if (start is not None and publish < start) or (end is not None and publish >= end):
+            continue
+        publish_dir = os.path.join(partition_dir, PUBLISH_PREFIX + publish)
+        for category in _list_values(publish_dir, CATEGORY_PREFIX):
+            if categories is not None and category not in categories:
+                continue
+            category_dir = os.path.join(publish_dir, CATEGORY_PREFIX + category)
+            for name in sorted(os.listdir(category_dir)):
+                if names is None or name in names:
+                    partition_paths.append(os.path.join(category_dir, name))
+    return partition_paths
@@ -0,0 +1,101 @@
+""" Mergeable quantile sketch in bounded memory, for engagement maps of corpora that do not fit in memory.
+
+The sketch is a stack of compactors in the style of KLL: level h holds values that each stand for 2^h input values.
+When a level holds k values, they are sorted and every other value, starting at a random offset, is promoted to
+level h+1, the others are dropped. A compaction at level h moves the estimated rank of any value by at most 2^h,
+so the sketch keeps rank_error = sum of 2^h over all its compactions, a deterministic bound of the absolute rank error
+of any quantile. With n values the bound is at most n*log2(n/k)/k, and the random offsets make the actual error
+much smaller, as errors of independent compactions cancel out. Memory is k values per level, i.e., k*log2(n/k).
+A sketch that has never compacted holds all values and returns exact percentiles, with k=None it never compacts,
+i.e., an exact summary that still merges with others.
+"""
+
+import numpy as np
+
+
+class QuantileSketch(object):
+    def __init__(self, k=4096, seed=None):
+        """
+        :param k: number of values a level holds before it is compacted, an even number, larger is more accurate,
+                  None to keep all values
+        :param seed: seed of the random offsets, or a numpy RandomState
+        """
+        if k is not None and (k < 2 or k % 2 != 0):
+            raise ValueError('k must be an even number of at least 2, got {0}'.format(k))
+        self.k = k
+        self.rng = seed if isinstance(seed, np.random.RandomState) else np.random.RandomState(seed)
+        self.levels = [np.zeros(0, dtype=np.float64)]
+        # batches of an exact summary, concatenated only when percentiles are taken
+        self.batches = []
+        self.num_value = 0
+        self.rank_error = 0
+
+    def __len__(self):
+        return self.num_value
+
+    def update(self, values):
+        """ Add a batch of values.
+        :param values: numpy array of values
+        """
+        values = np.asarray(values, dtype=np.float64)
+        self.num_value += len(values)
+        self._add(0, values)
+
+    def merge(self, other):
+        """ Merge another sketch with the same k into this sketch, the result sketches the union of both inputs.
+        :param other: a QuantileSketch object
+        """
+        if other.k != self.k:
+            raise ValueError('cannot merge sketches with k={0} and k={1}'.format(self.k, other.k))
+        self.num_value += other.num_value
+        self.rank_error += other.rank_error
+        for level, values in enumerate(other.levels):
+            self._add(level, values)
+        for values in other.batches:
+            self._add(0, values)
+
+    def _add(self, level, values):
+        """ Add values to a level, then compact all full groups of k values at once. """
+        if self.k is None:
+            self.batches.append(values)
+            return
+        while len(values) > 0:
+            if level == len(self.levels):
+                self.levels.append(np.zeros(0, dtype=np.float64))
+            buffer = np.concatenate([self.levels[level], values])
+            num_full = len(buffer) // self.k
+            if num_full == 0:
+                self.levels[level] = buffer
+                return
+            compacted = np.sort(buffer[:num_full * self.k].reshape(num_full, self.k), axis=1)
+            offsets = self.rng.randint(0, 2, num_full)
+            values = compacted[np.arange(num_full)[:, None], offsets[:, None] + np.arange(0, self.k, 2)].ravel()
+            self.levels[level] = buffer[num_full * self.k:]
+            self.rank_error += num_full * 2 ** level
+            level += 1
+
+    def get_rank_error_bound(self):
+        """ Deterministic bound of the rank error of any quantile, normalized by the number of values. """
+        return self.rank_error / self.num_value if self.num_value > 0 else 0.0
+
+    def percentile(self, q):
+        """ Estimate percentiles with linear interpolation, the same definition as np.percentile.
+        :param q: percentile or numpy array of percentiles in [0, 100]
+        :return: numpy float64 array of estimated percentiles, exact if the sketch has never compacted
+        """
+        if self.num_value == 0:
+            raise ValueError('cannot take percentiles of an empty sketch')
+        if self.rank_error == 0:
+            return np.percentile(np.concatenate(self.levels + self.batches), q)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level_values), 2 ** level, dtype=np.int64)
+                                  for level, level_values in enumerate(self.levels)])
+        sort_idx = np.argsort(values, kind='mergesort')
+        values = values[sort_idx]
+        # a value of weight w covers w consecutive ranks, rank r is held by the first value whose cumulative weight > r
+        cum_weights = np.cumsum(weights[sort_idx])
+        ranks = np.asarray(q, dtype=np.float64) / 100 * (cum_weights[-1] - 1)
+        lower = np.floor(ranks)
+        lower_values = values[np.searchsorted(cum_weights, lower, side='right')]
+        upper_values = values[np.minimum(np.searchsorted(cum_weights, np.ceil(ranks), side='right'), len(values) - 1)]
+        return lower_values + (upper_values - lower_values) * (ranks - lower)
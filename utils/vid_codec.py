@@ -0,0 +1,64 @@
+""" Reversible encoding between 11-char YouTube video ids and 64-bit integers.
+
+A YouTube video id is a base64url encoded 64-bit value: the first 10 chars carry 6 bits each,
+and the last char carries the remaining 4 bits, so it is always one of 'AEIMQUYcgkosw048'.
+Ids are packed big-endian into an uint64 and returned as int64, so equal ids give equal codes and codes can be
+used as join keys in numpy and pandas. Codes do not preserve the string order of ids.
+"""
+
+import numpy as np
+
+ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
+VID_LENGTH = 11
+
+# ascii byte -> 6-bit value, 64 marks chars outside the alphabet
+_CHAR_TO_BITS = np.full(256, 64, dtype=np.uint64)
+_CHAR_TO_BITS[np.frombuffer(ALPHABET.encode('ascii'), dtype=np.uint8)] = np.arange(64, dtype=np.uint64)
+_BITS_TO_CHAR = np.frombuffer(ALPHABET.encode('ascii'), dtype=np.uint8)
+_SHIFTS = np.array([58 - 6 * i for i in range(VID_LENGTH - 1)], dtype=np.uint64)
+
+
+def encode_vids(vids):
+    """ Encode video ids into int64 codes.
+    :param vids: a list or numpy array of 11-char video ids
+    :return: a numpy int64 array of codes
+    """
+    vids = np.asarray(vids)
+    if len(vids) == 0:
+        return np.array([], dtype=np.int64)
+    if vids.dtype.kind == 'U':
+        vids = np.char.encode(vids, 'ascii')
+    if vids.dtype.kind != 'S' or vids.dtype.itemsize > VID_LENGTH:
+        raise ValueError('video ids must be strings of {0} chars'.format(VID_LENGTH))
+    chars = np.frombuffer(vids.astype('S{0}'.format(VID_LENGTH)).tobytes(), dtype=np.uint8).reshape(-1, VID_LENGTH)
+    bits = _CHAR_TO_BITS[chars]
+    # the last char of a valid id leaves its lowest 2 bits unused
+    is_invalid = np.any(bits == 64, axis=1) | (bits[:, -1] & np.uint64(3) > 0)
+    if np.any(is_invalid):
+        raise ValueError('not a valid YouTube video id: {0}'.format(vids[is_invalid][0].decode('ascii', 'replace')))
+    codes = np.bitwise_or.reduce(bits[:, :-1] << _SHIFTS, axis=1) | (bits[:, -1] >> np.uint64(2))
+    return codes.view(np.int64)
+
+
+def decode_vids(codes):
+    """ Decode int64 codes into video ids.
+    :param codes: a list or numpy array of int64 codes
+    :return: a numpy unicode array of 11-char video ids
+    """
+    codes = np.asarray(codes, dtype=np.int64).view(np.uint64)
+    if len(codes) == 0:
+        return np.array([], dtype='U{0}'.format(VID_LENGTH))
+    bits = np.empty((len(codes), VID_LENGTH), dtype=np.uint64)
+    bits[:, :-1] = (codes[:, None] >> _SHIFTS) & np.uint64(63)
+    bits[:, -1] = (codes & np.uint64(15)) << np.uint64(2)
+    return np.char.decode(np.frombuffer(_BITS_TO_CHAR[bits].tobytes(), dtype='S{0}'.format(VID_LENGTH)), 'ascii')
+
+
+def encode_vid(vid):
+    """ Encode one video id into an int code. """
+    return int(encode_vids([vid])[0])
+
+
+def decode_vid(code):
+    """ Decode one int code into a video id. """
+    return str(decode_vids([code])[0])
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Benchmark decoding speed of raw json collection, full json.loads against field-selective decode_video.
+Each available backend of decode_video is reported, the default backend is the first available in orjson, simdjson, json.
+
+Usage: python benchmark_json_decoding.py -i ../data/tweeted_videos/travel.json -n 100000
+Time: ~1M
+"""
+
+import os, sys, time, argparse, json
+from itertools import islice
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
+from utils.helper import Timer
+from utils.json_decoder import decode_video, orjson, simdjson, JSON_BACKEND
+
+
+def benchmark(decode_func, lines):
+    """ Decode all lines and return the number of records decoded per second, corrupted records are skipped.
+    """
+    start_time = time.time()
+    for line in lines:
+        try:
+            decode_func(line)
+        except ValueError:
+            continue
+    return len(lines) / (time.time() - start_time)
+
+
+if __name__ == '__main__':
+    # == == == == == == == == Part 1: Set up experiment parameters == == == == == == == == #
+    print('>>> Start to benchmark json decoding...')
+    timer = Timer()
+    timer.start()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input', help='input file path of raw json collection', required=True)
+    parser.add_argument('-n', '--number', help='number of records to decode, default 100000', type=int, default=100000)
+    args = parser.parse_args()
+
+    input_path = args.input
+    if not os.path.exists(input_path):
+        print('>>> Input file does not exist!')
+        print('>>> Exit...')
+        sys.exit(1)
+
+    # == == == == == == == == Part 2: Load raw lines into memory, so that disk reading is not timed == == == == == == #
+    with open(input_path, 'rb') as fin:
+        raw_lines = list(islice(fin, args.number))
+    print('>>> Loaded {0} records from {1}'.format(len(raw_lines), input_path))
+
+    # == == == == == == == == Part 3: Time each decoding path == == == == == == == == #
+    baseline = benchmark(lambda line: json.loads(line.rstrip()), raw_lines)
+    print('>>> json.loads full decoding: {0:.0f} records/sec'.format(baseline))
+
+    available_backends = ['json']
+    if simdjson is not None:
+        available_backends.insert(0, 'simdjson')
+    if orjson is not None:
+        available_backends.insert(0, 'orjson')
+    for backend in available_backends:
+        speed = benchmark(lambda line: decode_video(line, backend=backend), raw_lines)
+        print('>>> decode_video with {0}{1}: {2:.0f} records/sec, {3:.2f}x of json.loads'
+              .format(backend, ['', ' (default)'][backend == JSON_BACKEND], speed, speed / baseline))
+
+    timer.stop()
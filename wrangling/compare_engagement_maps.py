@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Script to report how an approximate engagement map, e.g., built with quantile sketches, differs from the exact one.
+Both maps must be built from the same dataset, so that they share duration splits.
+
+Usage: python compare_engagement_maps.py -e ../data/engagement_map.p -a ../data/engagement_map_sketch.p
+Time: ~1M
+"""
+
+import sys, os, argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
+from utils.helper import Timer
+from utils.engagement_map_builder import compare_engagement_maps
+from utils.engagement_map_format import read_engagement_map
+
+
+if __name__ == '__main__':
+    # == == == == == == == == Part 1: Set up experiment parameters == == == == == == == == #
+    print('>>> Start to compare engagement maps...')
+    timer = Timer()
+    timer.start()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-e', '--exact', help='file path of exact engagement map, pickled or binary', required=True)
+    parser.add_argument('-a', '--approx', help='file path of approximate engagement map, pickled or binary', required=True)
+    args = parser.parse_args()
+
+    # == == == == == == == == Part 2: Compare percentiles in each bin == == == == == == == == #
+    exact_map = read_engagement_map(args.exact)
+    approx_map = read_engagement_map(args.approx)
+    wp_diffs, re_diffs = compare_engagement_maps(exact_map, approx_map)
+
+    print('>>> Number of duration bins: {0}'.format(len(wp_diffs)))
+    print('>>> Max watch percentage difference in a bin, max: {0:.5f}, mean: {1:.5f}, median: {2:.5f}'
+          .format(np.max(wp_diffs), np.mean(wp_diffs), np.median(wp_diffs)))
+    print('>>> Max relative engagement difference in a bin, max: {0:.4f}, mean: {1:.4f}, median: {2:.4f}'
+          .format(np.max(re_diffs), np.mean(re_diffs), np.median(re_diffs)))
+    print('>>> Bins with identical percentiles: {0}'.format(np.sum(wp_diffs == 0)))
+    for bin_idx in np.argsort(re_diffs)[::-1][:5]:
+        print('>>> Bin {0}, max watch percentage difference: {1:.5f}, max relative engagement difference: {2:.4f}'
+              .format(bin_idx, wp_diffs[bin_idx], re_diffs[bin_idx]))
+
+    timer.stop()
@@ -9,84 +9,226 @@ Target: extract tweeted videos dataset
 Usage: python construct_formatted_dataset.py -i ../data/tweeted_videos -o ../data/formatted_tweeted_videos
 Time: ~1H
 
+Target: extract tweeted videos dataset with a pool of 8 worker processes, large files are split into 256MB chunks
+Usage: python construct_formatted_dataset.py -i ../data/tweeted_videos -o ../data/formatted_tweeted_videos -w 8 -c 256
+Time: ~10M
+
+Target: extract tweeted videos dataset directly from the archive, without uncompressing it first
+Usage: python construct_formatted_dataset.py -i ../data/tweeted_videos.tar.bz2 -o ../data/formatted_tweeted_videos -w 8
+Time: ~20M
+
+Target: extract tweeted videos dataset, and also write a columnar binary store that readers load column by column
+Usage: python construct_formatted_dataset.py -i ../data/tweeted_videos -o ../data/formatted_tweeted_videos -w 8 --columnar ../data/columnar_tweeted_videos
+Time: ~10M
+
+Target: rerun after new crawl files are added or a run is interrupted, only new or changed inputs are converted
+Usage: python construct_formatted_dataset.py -i ../data/tweeted_videos -o ../data/formatted_tweeted_videos -w 8
+Time: depends on new inputs, converted inputs are listed in ../data/formatted_tweeted_videos.manifest.json
+
+Target: extract tweeted videos dataset, and also partition it by publish date and category for date-range selections
+Usage: python construct_formatted_dataset.py -i ../data/tweeted_videos -o ../data/formatted_tweeted_videos -w 8 --partition ../data/partitioned_tweeted_videos
+Time: ~10M
+
+Target: keep converting records appended to crawl files that are still being written, poll every 60 seconds
+Usage: python construct_formatted_dataset.py -i ../data/tweeted_videos -o ../data/formatted_tweeted_videos -w 8 --follow --interval 60
+Time: runs until interrupted by Ctrl+C, each poll converts only the lines appended since the last one
+
 Target: extract quality videos dataset
 Usage: python construct_formatted_dataset.py -i ../data/quality_videos -o ../data/formatted_quality_videos
 Time: ~2M
 """
 
-import os, sys
-import argparse, json, isodate
-from datetime import datetime
+import os, sys, time, shutil
+import argparse, hashlib, isodate
+from glob import glob
+from collections import defaultdict
+from functools import partial, lru_cache
+from multiprocessing import Pool
 import numpy as np
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
-from utils.helper import Timer, read_as_float_array, read_as_int_array, strify
+from utils.helper import Timer, read_as_ragged_array, lengths_to_offsets, ragged_sum, iter_batches, strify
+from utils.chunker import split_into_chunks, find_complete_end, read_chunk, merge_chunks
+from utils.archive import iter_archive_members
+from utils.manifest import Manifest, file_digest
+from utils.partition import write_partitions, remove_partitions, has_partitions
+from utils.columnar import RaggedArray, ColumnarWriter, merge_parts, encode_with_store_dictionaries
+from utils.json_decoder import decode_video
+from utils.vid_codec import encode_vids
+
+
+@lru_cache(maxsize=None)
+def parse_duration(duration):
+    """ Parse an ISO 8601 duration string into seconds, memoized since few distinct strings repeat across videos.
+    """
+    return isodate.parse_duration(duration).seconds
+
+
+def format_batch(lines, truncated=None, columnar=False):
+    """
+    Format a batch of raw json lines into tab separated records.
+    Attention dynamics of the whole batch are parsed into flat arrays, then truncated and aggregated in vectorized ops.
+    :param lines: raw json lines
+    :param truncated: head number of extracted elements in attention dynamics
+    :param columnar: also return the batch as columns of the columnar store
+    :return: concatenated formatted records, each ends with a newline, and dict of columns if columnar is True
+    """
+    videos = []
+    for line in lines:
+        # skip if data is corrupted, a record missing a needed field raises KeyError
+        try:
+            videos.append(decode_video(line))
+        except ValueError:
+            continue
+    if len(videos) == 0:
+        return ('', None) if columnar else ''
+
+    vids, published_ats, categories, detect_langs, channels, durations, definitions, topic_details_list, \
+        start_dates, days_list, daily_view_list, daily_watch_list = zip(*videos)
+    num_video = len(videos)
+    published_ats = [published_at[:10] for published_at in published_ats]
+    durations = np.array([parse_duration(duration) for duration in durations])
+
+    # attention dynamics information, flat arrays of all videos with offsets of each video
+    time_diffs = (np.array(start_dates, dtype='datetime64[D]') - np.array(published_ats, dtype='datetime64[D]'))\
+        .astype(np.int64)
+    # head number of elements, then offset by the days between publish date and insight start date
+    days, offsets = read_as_ragged_array(days_list, np.uint32, truncated=truncated)
+    days = days + np.repeat(time_diffs, np.diff(offsets))
+    is_valid_day = days < truncated
+    days = days[is_valid_day]
+    valid_lengths = np.bincount(np.repeat(np.arange(num_video), np.diff(offsets))[is_valid_day], minlength=num_video)
+    offsets = lengths_to_offsets(valid_lengths)
+    daily_view, _ = read_as_ragged_array(daily_view_list, np.uint32, truncated=valid_lengths)
+    daily_watch, _ = read_as_ragged_array(daily_watch_list, np.float64, truncated=valid_lengths)
+
+    is_first_30_days = days < 30
+    lengths_30 = np.bincount(np.repeat(np.arange(num_video), valid_lengths)[is_first_30_days], minlength=num_video)
+    view30 = ragged_sum(daily_view[is_first_30_days], lengths_to_offsets(lengths_30))
+    watch30 = ragged_sum(daily_watch[is_first_30_days], lengths_to_offsets(lengths_30))
+    # I have cleaned the data, so views in the first 30 days will be greater than 100
+    # take care of zero view and very occasionally (streamed video) zero duration
+    wp30 = watch30*60/view30/durations
+    dynamics = [RaggedArray(days, offsets), RaggedArray(daily_view, offsets), RaggedArray(daily_watch, offsets)]
+
+    # python scalars format into the same strings as numpy scalars, but much faster
+    days, daily_view, daily_watch = days.tolist(), daily_view.tolist(), daily_watch.tolist()
+    formatted_records = []
+    topic_tokens = []
+    topic_lengths = []
+    offsets = offsets.tolist()
+    for i in range(num_video):
+        start, end = offsets[i], offsets[i + 1]
+
+        # freebase topic information
+        if topic_details_list[i] is not None:
+            topic_ids, relevant_topic_ids = topic_details_list[i]
+            topics_set = set(topic_ids).union(set(relevant_topic_ids))
+            topics = strify(topics_set)
+            topic_tokens.extend(sorted(topics_set))
+            topic_lengths.append(len(topics_set))
+        else:
+            topics = 'NA'
+            topic_lengths.append(0)
+
+        # upper bound watch percentage to 1
+        if wp30[i] > 1:
+            video_wp30 = 1
+        else:
+            video_wp30 = wp30[i]
+
+        formatted_records.append('{0}\t{1}\t{2}\t{3}\t{4}\t{5}\t{6}\t{7}\t{8}\t{9}\t{10}\t{11}\t{12}\t{13}\n'
+                                 .format(vids[i], published_ats[i], durations[i], [0, 1][definitions[i] == 'hd'],
+                                         categories[i], detect_langs[i], channels[i], topics,
+                                         view30[i], watch30[i], video_wp30, strify(days[start: end]),
+                                         strify(daily_view[start: end]), strify(daily_watch[start: end])))
+    if columnar:
+        columns = {'id': encode_vids(vids), 'publish': published_ats, 'duration': durations,
+                   'definition': [definition == 'hd' for definition in definitions], 'category': categories,
+                   'detect_lang': detect_langs, 'channel': channels,
+                   'topics': RaggedArray(topic_tokens, lengths_to_offsets(topic_lengths)),
+                   'view30': view30, 'watch30': watch30, 'wp30': np.where(wp30 > 1, 1, wp30),
+                   'days': dynamics[0], 'daily_view': dynamics[1], 'daily_watch': dynamics[2]}
+        return ''.join(formatted_records), columns
+    return ''.join(formatted_records)
+
+
+def _read_lines(input_path, chunk=None, sha1=None):
+    """ Read raw json lines from a file path, or from an already opened binary file object such as an archive member.
+    Lines are also fed to sha1 if given, so the input is digested in the same read.
+    """
+    if hasattr(input_path, 'read'):
+        fin = None
+        lines = input_path
+    else:
+        fin = open(input_path, 'rb')
+        if chunk is None:
+            chunk = (0, os.path.getsize(input_path))
+        lines = read_chunk(fin, *chunk)
+    try:
+        for line in lines:
+            if sha1 is not None:
+                sha1.update(line)
+            yield line
+    finally:
+        if fin is not None:
+            fin.close()
 
 
-def extract_info(input_path, output_path, truncated=None):
+def extract_info(input_path, output_path, truncated=None, chunk=None, pool=None, batch_size=10000,
+                 columnar_path=None, sha1=None):
     """
     Extract essential information from each video.
-    :param input_path: input file path
+    :param input_path: input file path, or a binary file object of json lines such as a tar archive member
     :param output_path: output file path
     :param truncated: head number of extracted elements in attention dynamics
-    :return:
+    :param chunk: (start, end) byte range of input file to extract, default the whole file
+    :param pool: worker pool to format batches of lines in parallel, default format in current process
+    :param batch_size: number of lines sent to a worker at once
+    :param columnar_path: part dir of columnar store to write the same records, default not written
+    :param sha1: hashlib sha1 object to update with the bytes read, default the input is not digested
+    :return: number of formatted records
     """
     fout = open(output_path, 'w')
-    fout.write('{0}\t{1}\t{2}\t{3}\t{4}\t{5}\t{6}\t{7}\t{8}\t{9}\t{10}\t{11}\t{12}\t{13}\n'
-               .format('id', 'publish', 'duration', 'definition', 'category', 'detect_lang', 'channel', 'topics',
-                       'view30', 'watch30', 'wp30', 'days', 'daily_view', 'daily_watch'))
-
-    with open(input_path, 'r') as fin:
-        for line in fin:
-            # skip if data is corrupted or reading duration fails
-            try:
-                video = json.loads(line.rstrip())
-            except:
-                continue
+    writer = ColumnarWriter(columnar_path) if columnar_path is not None else None
+    # only the first chunk of a file carries the header
+    if chunk is None or chunk[0] == 0:
+        fout.write('{0}\t{1}\t{2}\t{3}\t{4}\t{5}\t{6}\t{7}\t{8}\t{9}\t{10}\t{11}\t{12}\t{13}\n'
+                   .format('id', 'publish', 'duration', 'definition', 'category', 'detect_lang', 'channel', 'topics',
+                           'view30', 'watch30', 'wp30', 'days', 'daily_view', 'daily_watch'))
 
-            vid = video['id']
-            published_at = video['snippet']['publishedAt'][:10]
-            duration = isodate.parse_duration(video['contentDetails']['duration']).seconds
-            definition = [0, 1][video['contentDetails']['definition'] == 'hd']
-            category = video['snippet']['categoryId']
-            detect_lang = video['snippet']['detectLang']
-            channel = video['snippet']['channelId']
-
-            # freebase topic information
-            if 'topicDetails' in video:
-                if 'topicIds' in video['topicDetails']:
-                    topic_ids = set(video['topicDetails']['topicIds'])
-                else:
-                    topic_ids = set()
-                if 'relevantTopicIds' in video['topicDetails']:
-                    relevant_topic_ids = set(video['topicDetails']['relevantTopicIds'])
-                else:
-                    relevant_topic_ids = set()
-                topics_set = topic_ids.union(relevant_topic_ids)
-                topics = strify(topics_set)
-            else:
-                topics = 'NA'
-
-            # attention dynamics information
-            start_date = video['insights']['startDate']
-            time_diff = (datetime(*map(int, start_date.split('-'))) - datetime(*map(int, published_at.split('-')))).days
-            days = read_as_int_array(video['insights']['days'], delimiter=',', truncated=truncated) + time_diff
-            days = days[days < truncated]
-            daily_view = read_as_int_array(video['insights']['dailyView'], delimiter=',', truncated=len(days))
-            view30 = np.sum(daily_view[days < 30])
-            daily_watch = read_as_float_array(video['insights']['dailyWatch'], delimiter=',', truncated=len(days))
-            watch30 = np.sum(daily_watch[days < 30])
-            # I have cleaned the data, so views in the first 30 days will be greater than 100
-            # take care of zero view and very occasionally (streamed video) zero duration
-            wp30 = watch30*60/view30/duration
-            # upper bound watch percentage to 1
-            if wp30 > 1:
-                wp30 = 1
-
-            fout.write('{0}\t{1}\t{2}\t{3}\t{4}\t{5}\t{6}\t{7}\t{8}\t{9}\t{10}\t{11}\t{12}\t{13}\n'
-                       .format(vid, published_at, duration, definition, category, detect_lang, channel, topics,
-                               view30, watch30, wp30, strify(days), strify(daily_view), strify(daily_watch)))
+    batches = iter_batches(_read_lines(input_path, chunk, sha1), batch_size)
+    format_func = partial(format_batch, truncated=truncated, columnar=writer is not None)
+    if pool is None:
+        formatted_batches = map(format_func, batches)
+    else:
+        # imap keeps the input order, so records are written in the same order as the serial path
+        formatted_batches = pool.imap(format_func, batches)
+    num_rows = 0
+    for formatted_batch in formatted_batches:
+        if writer is None:
+            formatted_records = formatted_batch
+        else:
+            formatted_records = formatted_batch[0]
+            if formatted_batch[1] is not None:
+                writer.append(formatted_batch[1])
+        fout.write(formatted_records)
+        num_rows += formatted_records.count('\n')
     fout.close()
+    if writer is not None:
+        writer.close()
+    return num_rows
+
+
+def _extract_info_job(args):
+    """ Unpack one (input_path, output_path, truncated, chunk, columnar_path, is_digested) job for the worker pool.
+    A job of a whole file also returns its sha1 digest, computed while reading it, otherwise None.
+    """
+    input_path, output_path, truncated, chunk, columnar_path, is_digested = args
+    sha1 = hashlib.sha1() if is_digested else None
+    num_rows = extract_info(input_path, output_path, truncated=truncated, chunk=chunk, columnar_path=columnar_path,
+                            sha1=sha1)
+    return input_path, chunk, num_rows, sha1.hexdigest() if is_digested else None
 
 
 if __name__ == '__main__':
@@ -99,30 +241,277 @@ if __name__ == '__main__':
     age = 120
 
     parser = argparse.ArgumentParser()
-    parser.add_argument('-i', '--input', help='input file dir of raw json collection', required=True)
+    parser.add_argument('-i', '--input', help='input file dir of raw json collection, or its tar.bz2 archive',
+                        required=True)
     parser.add_argument('-o', '--output', help='output file dir of formatted data', required=True)
+    parser.add_argument('-w', '--workers', help='number of worker processes, default 1', type=int, default=1)
+    parser.add_argument('-c', '--chunk', help='chunk size in MB to split large files for workers, default 256',
+                        type=float, default=256)
+    parser.add_argument('--columnar', help='output dir of columnar binary store, default not written')
+    parser.add_argument('--partition', help='output dir of formatted data partitioned by publish date and category, '
+                                            'default not written')
+    parser.add_argument('-m', '--manifest', help='manifest file path of converted inputs, default <output>.manifest.json',
+                        default=None)
+    parser.add_argument('--follow', help='keep polling input file dir for appended records until interrupted',
+                        action='store_true')
+    parser.add_argument('--interval', help='seconds between two polls in follow mode, default 60', type=float,
+                        default=60)
     args = parser.parse_args()
 
     input_dir = args.input
     output_dir = args.output
+    num_workers = args.workers
+    chunk_size = int(args.chunk * 1024 * 1024)
+    columnar_dir = args.columnar
+    partition_dir = args.partition
+    manifest_path = args.manifest if args.manifest is not None else output_dir.rstrip('/') + '.manifest.json'
+    is_followed = args.follow
+    interval = args.interval
 
     if not os.path.exists(input_dir):
         print('>>> Input file dir does not exist!')
         print('>>> Exit...')
         sys.exit(1)
 
-    if os.path.exists(output_dir):
-        print('>>> Output file dir already exists, rename, check or backup it before starting new job!')
+    if is_followed and not os.path.isdir(input_dir):
+        print('>>> Follow mode only works on an input file dir, an archive cannot be appended!')
         print('>>> Exit...')
         sys.exit(1)
+
+    # an existing output dir is resumed from its manifest, only new or changed inputs are converted
+    is_resumed = os.path.exists(output_dir)
+    if is_resumed:
+        if not os.path.exists(manifest_path):
+            print('>>> Output file dir already exists without a manifest, '
+                  'rename, check or backup it before starting new job!')
+            print('>>> Exit...')
+            sys.exit(1)
+        print('>>> Resume from manifest {0}...'.format(manifest_path))
     else:
         os.mkdir(output_dir)
 
+    if columnar_dir is not None:
+        if os.path.exists(columnar_dir) and not is_resumed:
+            print('>>> Columnar store dir already exists, rename, check or backup it before starting new job!')
+            print('>>> Exit...')
+            sys.exit(1)
+        elif not os.path.exists(columnar_dir):
+            os.mkdir(columnar_dir)
+
+    if partition_dir is not None:
+        if os.path.exists(partition_dir) and not is_resumed:
+            print('>>> Partition dir already exists, rename, check or backup it before starting new job!')
+            print('>>> Exit...')
+            sys.exit(1)
+        elif not os.path.exists(partition_dir):
+            os.mkdir(partition_dir)
+
+    manifest = Manifest(manifest_path)
+    if is_resumed:
+        # remove chunk and tail parts left by an interrupted run, their records are converted again
+        for part_path in glob(os.path.join(output_dir, '*.part[0-9][0-9][0-9][0-9]')) + \
+                glob(os.path.join(output_dir, '*.tail[0-9][0-9][0-9][0-9]')):
+            os.remove(part_path)
+        if columnar_dir is not None:
+            recorded_tails = {tail for key in manifest.entries for tail in manifest.get_tails(key)}
+            for part_path in glob(os.path.join(columnar_dir, '*.part[0-9][0-9][0-9][0-9]')) + \
+                    glob(os.path.join(columnar_dir, '*.tail[0-9][0-9][0-9][0-9]')):
+                if os.path.basename(part_path) not in recorded_tails:
+                    shutil.rmtree(part_path)
+
+    # save at once, so a run interrupted before its first converted input can still be resumed
+    manifest.save()
+
     # == == == == == == == == Part 2: Construct dataset == == == == == == == == #
-    for subdir, _, files in os.walk(input_dir):
-        for f in files:
-            if f.endswith('json'):
-                print('>>> Start to reformat file {0}...'.format(os.path.join(subdir, f)))
-                extract_info(os.path.join(subdir, f), os.path.join(output_dir, f[:-4]+'txt'), truncated=age)
+    def get_columnar_path(f):
+        return os.path.join(columnar_dir, f[:-5]) if columnar_dir is not None else None
+
+    def is_converted(key, size, mtime, output_path, columnar_path, digest_func=None):
+        # an unchanged input is skipped only if its outputs are still there
+        return manifest.is_converted(key, size, mtime, digest_func) and os.path.exists(output_path) \
+            and (columnar_path is None or os.path.exists(columnar_path)) \
+            and (partition_dir is None or has_partitions(partition_dir, os.path.basename(output_path)))
+
+    def partition(output_path):
+        # split records of a finished output by publish date and category, replacing its earlier partitions
+        if partition_dir is not None:
+            remove_partitions(partition_dir, os.path.basename(output_path))
+            write_partitions(output_path, partition_dir)
+
+    def record(key, size, mtime, digest, output_path, num_rows, columnar_path, offset=None):
+        manifest.record(key, size, mtime, digest, os.path.basename(output_path), num_rows,
+                        os.path.basename(columnar_path) if columnar_path is not None else None, offset)
+
+    def remove_tails(key):
+        # records appended to an input are converted again together with the whole input
+        for tail in manifest.get_tails(key):
+            tail_path = os.path.join(columnar_dir, tail) if columnar_dir is not None else None
+            if tail_path is not None and os.path.exists(tail_path):
+                shutil.rmtree(tail_path)
+
+    def iter_json_files():
+        for subdir, _, files in os.walk(input_dir):
+            for f in files:
+                if f.endswith('json'):
+                    yield os.path.join(subdir, f), f
+
+    # input path -> (manifest key, size, mtime, end) taken before conversion, changes after that are left for next run
+    # in follow mode, a last line that is still being written is left out, i.e., converted up to its complete end
+    jobs = []
+    input_stats = {}
+    for input_path, f in iter_json_files():
+        output_path = os.path.join(output_dir, f[:-4]+'txt')
+        key = os.path.relpath(input_path, input_dir)
+        stat = os.stat(input_path)
+        if is_converted(key, stat.st_size, stat.st_mtime_ns, output_path, get_columnar_path(f),
+                        partial(file_digest, input_path, stat.st_size)):
+            print('>>> Skip converted file {0}...'.format(input_path))
+            continue
+        remove_tails(key)
+        jobs.append((input_path, output_path, age, get_columnar_path(f)))
+        end = find_complete_end(input_path, stat.st_size) if is_followed else stat.st_size
+        input_stats[input_path] = (key, stat.st_size, stat.st_mtime_ns, end)
+
+    def record_job(input_path, output_path, columnar_path, num_rows, digest):
+        key, size, mtime, end = input_stats[input_path]
+        partition(output_path)
+        record(key, size, mtime, digest, output_path, num_rows, columnar_path, end)
+
+    if os.path.isfile(input_dir) and input_dir.endswith('.tar.bz2'):
+        # stream json files out of the archive, members arrive one after another so workers share lines of a member
+        # members are compared by size and mtime in tar header, their content hash is not recorded
+        pool = Pool(num_workers) if num_workers > 1 else None
+        for member, fileobj in iter_archive_members(input_dir):
+            f = os.path.basename(member.name)
+            output_path = os.path.join(output_dir, f[:-4]+'txt')
+            mtime = int(member.mtime * 10**9)
+            if is_converted(member.name, member.size, mtime, output_path, get_columnar_path(f)):
+                print('>>> Skip converted archive member {0}...'.format(member.name))
+                continue
+            print('>>> Start to reformat archive member {0}...'.format(member.name))
+            num_rows = extract_info(fileobj, output_path, truncated=age, pool=pool, columnar_path=get_columnar_path(f))
+            partition(output_path)
+            record(member.name, member.size, mtime, None, output_path, num_rows, get_columnar_path(f))
+        if pool is not None:
+            pool.close()
+            pool.join()
+    elif num_workers > 1:
+        # split large files into newline-aligned byte ranges, each range is written to its own part file
+        chunk_jobs = []
+        part_paths = {}
+        columnar_part_paths = {}
+        pending_chunks = {}
+        num_rows = defaultdict(int)
+        digests = {}
+        digest_results = {}
+        pool = Pool(num_workers)
+        for input_path, output_path, truncated, columnar_path in jobs:
+            # an empty file is one empty chunk, so its output still carries the header
+            chunks = split_into_chunks(input_path, chunk_size, input_stats[input_path][3]) or [(0, 0)]
+            pending_chunks[input_path] = len(chunks)
+            if len(chunks) == 1:
+                # a whole file is digested by the worker that reads it
+                chunk_jobs.append((input_path, output_path, truncated, chunks[0], columnar_path, True))
+            else:
+                # sha1 of a file cannot be combined from its chunks, it is digested by a pool job of its own
+                digest_results[input_path] = pool.apply_async(file_digest, (input_path, input_stats[input_path][3]))
+                part_paths[output_path] = []
+                columnar_part_paths[columnar_path] = []
+                for chunk_idx, chunk in enumerate(chunks):
+                    part_path = '{0}.part{1:>04}'.format(output_path, chunk_idx)
+                    part_paths[output_path].append(part_path)
+                    columnar_part_path = None
+                    if columnar_path is not None:
+                        columnar_part_path = '{0}.part{1:>04}'.format(columnar_path, chunk_idx)
+                        columnar_part_paths[columnar_path].append(columnar_part_path)
+                    chunk_jobs.append((input_path, part_path, truncated, chunk, columnar_part_path, False))
+
+        # schedule the largest chunks first, so the slowest chunk does not set the finish time
+        chunk_jobs.sort(key=lambda job: job[3][1] - job[3][0], reverse=True)
+        print('>>> Start to reformat {0} files in {1} chunks with {2} workers...'
+              .format(len(jobs), len(chunk_jobs), num_workers))
+        outputs = {input_path: (output_path, columnar_path) for input_path, output_path, _, columnar_path in jobs}
+        with pool:
+            for input_path, chunk, chunk_rows, digest in pool.imap_unordered(_extract_info_job, chunk_jobs):
+                print('>>> Finish reformatting file {0}, bytes {1}-{2}...'.format(input_path, *chunk))
+                num_rows[input_path] += chunk_rows
+                if digest is not None:
+                    digests[input_path] = digest
+                pending_chunks[input_path] -= 1
+                if pending_chunks[input_path] == 0:
+                    # all chunks of a file are done, merge its parts and record it in manifest
+                    output_path, columnar_path = outputs[input_path]
+                    if output_path in part_paths:
+                        merge_chunks(part_paths[output_path], output_path)
+                        if columnar_path is not None:
+                            merge_parts(columnar_part_paths[columnar_path], columnar_path)
+                    digest = digests[input_path] if input_path in digests else digest_results[input_path].get()
+                    record_job(input_path, output_path, columnar_path, num_rows[input_path], digest)
+    else:
+        for input_path, output_path, truncated, columnar_path in jobs:
+            print('>>> Start to reformat file {0}...'.format(input_path))
+            sha1 = hashlib.sha1()
+            num_rows = extract_info(input_path, output_path, truncated=truncated, chunk=(0, input_stats[input_path][3]),
+                                    columnar_path=columnar_path, sha1=sha1)
+            record_job(input_path, output_path, columnar_path, num_rows, sha1.hexdigest())
+
+    if columnar_dir is not None:
+        # workers encode with part-local dictionaries, translate them to persistent dictionaries of the whole store
+        encode_with_store_dictionaries(columnar_dir)
 
     timer.stop()
+
+    # == == == == == == == == Part 3: Follow appended records == == == == == == == == #
+    if is_followed:
+        print('>>> Follow input file dir {0}, poll every {1} seconds, stop with Ctrl+C...'.format(input_dir, interval))
+        pool = Pool(num_workers) if num_workers > 1 else None
+        try:
+            while True:
+                time.sleep(interval)
+                is_updated = False
+                for input_path, f in iter_json_files():
+                    output_path = os.path.join(output_dir, f[:-4]+'txt')
+                    columnar_path = get_columnar_path(f)
+                    key = os.path.relpath(input_path, input_dir)
+                    stat = os.stat(input_path)
+                    offset = manifest.get_offset(key)
+                    end = find_complete_end(input_path, stat.st_size)
+                    if offset is None or stat.st_size < offset or not os.path.exists(output_path):
+                        # a new input, or an input truncated and written again from scratch
+                        print('>>> Start to reformat file {0}...'.format(input_path))
+                        remove_tails(key)
+                        sha1 = hashlib.sha1()
+                        num_rows = extract_info(input_path, output_path, truncated=age, chunk=(0, end), pool=pool,
+                                                columnar_path=columnar_path, sha1=sha1)
+                        partition(output_path)
+                        record(key, stat.st_size, stat.st_mtime_ns, sha1.hexdigest(), output_path, num_rows,
+                               columnar_path, end)
+                    elif end > offset:
+                        # format appended lines into a tail file first, so output only grows by complete batches
+                        print('>>> Start to reformat file {0}, appended bytes {1}-{2}...'
+                              .format(input_path, offset, end))
+                        tail_idx = len(manifest.get_tails(key))
+                        tail_path = '{0}.tail{1:>04}'.format(output_path, tail_idx)
+                        columnar_tail_path = '{0}.tail{1:>04}'.format(columnar_path, tail_idx) \
+                            if columnar_path is not None else None
+                        num_rows = extract_info(input_path, tail_path, truncated=age, chunk=(offset, end), pool=pool,
+                                                columnar_path=columnar_tail_path)
+                        if partition_dir is not None:
+                            with open(output_path, 'r') as fin:
+                                header = fin.readline()
+                            write_partitions(tail_path, partition_dir, append=True, name=os.path.basename(output_path),
+                                             header=header)
+                        merge_chunks([tail_path], output_path, append=True)
+                        columnar_tail = os.path.basename(columnar_tail_path) if columnar_path is not None else None
+                        manifest.record_tail(key, stat.st_size, stat.st_mtime_ns, end, num_rows, columnar_tail)
+                    else:
+                        continue
+                    is_updated = True
+                if is_updated and columnar_dir is not None:
+                    encode_with_store_dictionaries(columnar_dir)
+        except KeyboardInterrupt:
+            print('>>> Stop following input file dir {0}...'.format(input_dir))
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Script to convert an engagement map between pickle and the memory-mappable binary format, or to compile it.
+The direction is set by the output extension, .emap writes binary format, .egrid writes a compiled grid, any other
+writes pickle.
+
+Usage: python convert_engagement_map.py -i ../data/engagement_map.p -o ../data/engagement_map.emap
+Usage: python convert_engagement_map.py -i ../data/engagement_map.emap -o ../data/engagement_map.p
+Time: ~5S
+
+Target: compile an engagement map into a dense grid of relative engagement for real-time scoring, see
+utils/engagement_grid.py for its error bounds
+Usage: python convert_engagement_map.py -i ../data/engagement_map.p -o ../data/engagement_map.egrid
+Time: ~10S
+"""
+
+import sys, os, argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
+from utils.helper import Timer
+from utils.engagement_map_format import is_binary_engagement_map, import_pickle, export_pickle, to_arrays, \
+    read_engagement_map, load_engagement_map
+from utils.engagement_grid import EngagementGrid
+
+
+if __name__ == '__main__':
+    # == == == == == == == == Part 1: Set up experiment parameters == == == == == == == == #
+    print('>>> Start to convert engagement map...')
+    timer = Timer()
+    timer.start()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input', help='input file path of engagement map, pickled or binary', required=True)
+    parser.add_argument('-o', '--output', help='output file path of engagement map, .emap for binary format',
+                        required=True)
+    parser.add_argument('--float32', help='store percentiles as float32 in binary format, half the size but rounded',
+                        action='store_true')
+    parser.add_argument('--step-bits', help='compiled grid only, watch percentage cells are 2^-step_bits wide, '
+                                            'default 14', type=int, default=14)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        print('>>> Input engagement map does not exist!')
+        print('>>> Exit...')
+        sys.exit(1)
+
+    # == == == == == == == == Part 2: Convert engagement map == == == == == == == == #
+    is_binary_input = is_binary_engagement_map(args.input)
+    if args.output.endswith('.egrid'):
+        # a binary map keeps its own dtype, the grid quantises watch percentage in it
+        if is_binary_input:
+            duration_splits, percentiles, _ = load_engagement_map(args.input)
+        else:
+            duration_splits, percentiles, _ = to_arrays(read_engagement_map(args.input))
+        grid = EngagementGrid.compile(duration_splits, percentiles, step_bits=args.step_bits)
+        grid.save(args.output)
+        print('>>> Grid relative engagement is at most {0:.4f} below query_engagement_map, for cells of {1:.2e}'
+              .format(grid.max_error, 1 / grid.cell_number))
+    elif args.output.endswith('.emap'):
+        if is_binary_input:
+            print('>>> Input engagement map is already in binary format!')
+            print('>>> Exit...')
+            sys.exit(1)
+        import_pickle(args.input, args.output, dtype=np.float32 if args.float32 else np.float64)
+    else:
+        if not is_binary_input:
+            print('>>> Input engagement map is already pickled!')
+            print('>>> Exit...')
+            sys.exit(1)
+        export_pickle(args.input, args.output)
+    print('>>> Finish converting {0} to {1}!'.format(args.input, args.output))
+
+    timer.stop()
@@ -6,25 +6,170 @@ Here the age cutoff is day 30. For temporal engagement map, refer to extract_tem
 
 Usage: python extract_engagement_map.py -i ../data/formatted_tweeted_videos -o ../data/engagement_map.p
 Time: ~8M
+The map also keeps percentiles of log10 watch time in the same bins under key 'watch_time', built in the same pass,
+except maps derived from a histogram cube, which does not keep watch time.
+With --group-by category|detect_lang|definition, the map also holds one map per segment value under key 'segments'.
+Usage: python extract_engagement_map.py -i ../data/formatted_tweeted_videos -o ../data/engagement_map_category.p --group-by category
+An output path ending with .emap writes the map in binary format of utils/engagement_map_format.py instead of pickle,
+convert between both formats with convert_engagement_map.py.
+
+Target: extract engagement map in bounded memory, for datasets too large to hold in memory
+Percentiles of each bin are estimated by a quantile sketch, the rank error bound of each bin is printed,
+compare with the exact map by compare_engagement_maps.py.
+Usage: python extract_engagement_map.py -i ../data/formatted_tweeted_videos -o ../data/engagement_map_sketch.p --sketch
+Time: ~10M
+
+Target: extract engagement map by map-reduce over shards of the dataset, on local worker processes or on many nodes
+Each shard is a contiguous byte range of the input files. Workers count durations of their shards, then summarize
+watch percentages of their shards into per-bin sketches, the reducer merges the summaries of all shards into one map.
+Without --sketch summaries keep all values, and the map is identical to the single process one.
+Usage: python extract_engagement_map.py -i ../data/formatted_tweeted_videos -o ../data/engagement_map.p -w 8
+On nodes sharing a file system, run each phase with the same --work-dir, and --shard i on the i-th node:
+Usage: python extract_engagement_map.py -i ../data/formatted_tweeted_videos -o ../data/engagement_map.p --work-dir ../data/emap_work --shards 16 --phase plan|count|summarize|reduce [--shard i]
+Time: ~2M with 8 workers
+
+Target: update engagement map with newly formatted videos, without rescanning the videos it is built from
+The state of all videos is saved next to the map, an update loads it, adds the new videos and rebuilds the map.
+Usage: python extract_engagement_map.py -i ../data/formatted_tweeted_videos -o ../data/engagement_map.p --state ../data/engagement_map_state.npz
+Usage: python extract_engagement_map.py -i ../data/formatted_new_videos -o ../data/engagement_map.p --state ../data/engagement_map_state.npz --update
+Time: ~10S per update
+
+Target: derive engagement map of any bin number, percentile number or categories from a histogram cube
+The cube is built once by extract_histogram_cube.py, percentiles are within 0.5/bucket number of the exact map,
+except in bins with a boundary inside one duration, whose number is printed.
+Usage: python extract_engagement_map.py -i ../data/histogram_cube.npz -o ../data/engagement_map_music.p --categories 10 --bin-number 500
+Time: ~3S
 """
 
-import sys, os, pickle, argparse
+import sys, os, json, pickle, argparse
 import numpy as np
 from collections import defaultdict
+from multiprocessing import Pool
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
-from utils.helper import Timer
+from utils.helper import Timer, iter_batches
+from utils.chunker import split_into_shards, read_chunk
+from utils.engagement_map_builder import EngagementMapBuilder, merge_summaries, get_watch_times, build_segment_maps
+from utils.engagement_map_state import EngagementMapState
+from utils.histogram_cube import HistogramCube
+from utils.engagement_map_format import save_engagement_map
+
+bin_number = 1000
+# columns of formatted dataset that segmented engagement maps can be grouped by
+SEGMENT_COLUMNS = {'definition': 3, 'category': 4, 'detect_lang': 5}
 
 
-def get_engagement_stats_from_file(filepath):
+def get_engagement_stats_from_file(filepath, segment_column=None):
     with open(filepath, 'r') as fin:
         fin.readline()
         for line in fin:
-            _, _, duration, _, _, _, _, _, view, _, wp30, _ = line.split('\t', 11)
-            duration = int(duration)
-            wp30 = float(wp30)
-            duration_engagement_tuple.append((duration, wp30, np.log10(duration * wp30)))
-            duration_cnt_dict[duration] += 1
+            fields = line.split('\t', 11)
+            _, _, duration, _, _, _, _, _, view, _, wp30, _ = fields
+            duration_list.append(int(duration))
+            wp30_list.append(float(wp30))
+            if segment_column is not None:
+                segment_list.append(fields[segment_column])
+
+
+def list_input_files(input_dir):
+    """ List input files in the order the dataset is loaded. """
+    return [os.path.join(subdir, f) for subdir, _, files in os.walk(input_dir) for f in files]
+
+
+def iter_engagement_batches(ranges, batch_size=100000):
+    """ Stream durations and watch percentages of byte ranges of files in batches, in the same order at every call.
+    :param ranges: a list of (filepath, start, end) byte ranges, a range from 0 starts with the header
+    :param batch_size: number of videos in each batch
+    :return: a generator of (durations, watch percentages) numpy arrays
+    """
+    for filepath, start, end in ranges:
+        with open(filepath, 'rb') as fin:
+            lines = read_chunk(fin, start, end)
+            if start == 0:
+                next(lines, None)
+            for batch in iter_batches(lines, batch_size):
+                durations = []
+                wp30s = []
+                for line in batch:
+                    _, _, duration, _, _, _, _, _, view, _, wp30, _ = line.split(b'\t', 11)
+                    durations.append(int(duration))
+                    wp30s.append(float(wp30))
+                yield np.array(durations), np.array(wp30s)
+
+
+def count_durations(batches):
+    """ Count videos of each duration.
+    :return: numpy int arrays of distinct durations and their counts
+    """
+    duration_cnt_dict = defaultdict(int)
+    for durations, _ in batches:
+        for duration, cnt in zip(*np.unique(durations, return_counts=True)):
+            duration_cnt_dict[duration] += cnt
+    return np.array(list(duration_cnt_dict.keys()), dtype=np.int64), \
+        np.array(list(duration_cnt_dict.values()), dtype=np.int64)
+
+
+def get_shard_path(work_dir, name, shard_idx):
+    return os.path.join(work_dir, '{0}_{1:>04}'.format(name, shard_idx))
+
+
+def load_shards(work_dir):
+    with open(os.path.join(work_dir, 'shards.json'), 'r') as fin:
+        return json.load(fin)
+
+
+def load_builder(work_dir, num_shards, skip_shards=0):
+    """ Set up a builder from duration counts of all shards, with videos of the first skip_shards shards seen. """
+    shard_counts = []
+    for shard_idx in range(num_shards):
+        with np.load(get_shard_path(work_dir, 'counts', shard_idx) + '.npz') as counts:
+            shard_counts.append((counts['durations'], counts['counts']))
+    durations, inverse = np.unique(np.concatenate([d for d, _ in shard_counts]), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate([c for _, c in shard_counts])).astype(np.int64)
+    builder = EngagementMapBuilder(durations, np.linspace(1, 5, bin_number), counts=counts)
+    for shard_durations, shard_counts in shard_counts[:skip_shards]:
+        builder.skip_videos(shard_durations, shard_counts)
+    return builder
+
+
+def count_shard(work_dir, shard_idx):
+    """ Map phase 1, count videos of each duration in one shard. """
+    durations, counts = count_durations(iter_engagement_batches(load_shards(work_dir)[shard_idx]))
+    np.savez(get_shard_path(work_dir, 'counts', shard_idx) + '.npz', durations=durations, counts=counts)
+    return shard_idx
+
+
+def summarize_shard(work_dir, shard_idx, k, seed):
+    """ Map phase 2, summarize wp and watch time of one shard into per-bin sketches, bins are set by all counts. """
+    shards = load_shards(work_dir)
+    builder = load_builder(work_dir, len(shards), skip_shards=shard_idx)
+    summary = builder.summarize(iter_engagement_batches(shards[shard_idx]), builder.get_bin_offsets(50), k=k,
+                                seed=seed + shard_idx)
+    with open(get_shard_path(work_dir, 'summary', shard_idx) + '.p', 'wb') as fout:
+        pickle.dump(summary, fout, protocol=pickle.HIGHEST_PROTOCOL)
+    return shard_idx
+
+
+def _shard_job(args):
+    """ Unpack one (phase function, work_dir, shard_idx, *params) job for the worker pool. """
+    func, work_dir, shard_idx = args[:3]
+    return func(work_dir, shard_idx, *args[3:])
+
+
+def reduce_summaries(work_dir):
+    """ Reduce phase, merge per-bin sketches of all shards in shard order and build the engagement map. """
+    num_shards = len(load_shards(work_dir))
+    builder = load_builder(work_dir, num_shards)
+    summaries = []
+    for shard_idx in range(num_shards):
+        with open(get_shard_path(work_dir, 'summary', shard_idx) + '.p', 'rb') as fin:
+            summaries.append(pickle.load(fin))
+    # each summary holds sketches of watch percentage and of watch time, merged metric by metric
+    sketches = merge_summaries([summary[0] for summary in summaries])
+    watch_time_sketches = merge_summaries([summary[1] for summary in summaries])
+    engagement_map = builder.build_from_summaries(sketches, builder.get_bin_offsets(50), percentile_number=1000,
+                                                  watch_time_sketches=watch_time_sketches)
+    return engagement_map, np.array([sketch.get_rank_error_bound() for sketch in sketches])
 
 
 if __name__ == '__main__':
@@ -33,13 +178,38 @@ if __name__ == '__main__':
     timer = Timer()
     timer.start()
 
-    bin_number = 1000
-    duration_engagement_tuple = []
-    duration_cnt_dict = defaultdict(int)
+    duration_list = []
+    wp30_list = []
+    segment_list = []
 
     parser = argparse.ArgumentParser()
-    parser.add_argument('-i', '--input', help='input file dir of formatted dataset', required=True)
-    parser.add_argument('-o', '--output', help='output file path of engagement map', required=True)
+    parser.add_argument('-i', '--input', help='input file dir of formatted dataset, or its histogram cube .npz',
+                        required=True)
+    parser.add_argument('-o', '--output', help='output file path of engagement map, .emap for binary format',
+                        required=True)
+    parser.add_argument('--sketch', help='estimate percentiles with quantile sketches in bounded memory',
+                        action='store_true')
+    parser.add_argument('-k', help='number of values in a sketch level, larger is more accurate, default 4096',
+                        type=int, default=4096)
+    parser.add_argument('-w', '--workers', help='number of local worker processes of map-reduce build, default 1',
+                        type=int, default=1)
+    parser.add_argument('--shards', help='number of shards of map-reduce build, default number of workers', type=int)
+    parser.add_argument('--work-dir', help='dir of shard plan, counts and summaries, shared by all nodes, '
+                                           'default <output>.work')
+    parser.add_argument('--phase', help='run one phase of map-reduce build, default all phases',
+                        choices=['plan', 'count', 'summarize', 'reduce', 'all'])
+    parser.add_argument('--shard', help='shard index to run count or summarize phase on, default all shards', type=int)
+    parser.add_argument('--state', help='file path of engagement map state of all videos, saved after build')
+    parser.add_argument('--update', help='add videos of input file dir to the saved state rather than rebuild',
+                        action='store_true')
+    parser.add_argument('--categories', help='category ids of map derived from histogram cube, default all',
+                        nargs='+')
+    parser.add_argument('--bin-number', help='number of duration split points of map derived from histogram cube, '
+                                             'default 1000', type=int, default=1000)
+    parser.add_argument('--percentile-number', help='number of percentiles in each bin of map derived from '
+                                                    'histogram cube, default 1000', type=int, default=1000)
+    parser.add_argument('--group-by', help='also build one engagement map per value of this column, in the same pass',
+                        choices=sorted(SEGMENT_COLUMNS))
     args = parser.parse_args()
 
     input_dir = args.input
@@ -49,50 +219,124 @@ if __name__ == '__main__':
         print('>>> Input file dir does not exist!')
         print('>>> Exit...')
         sys.exit(1)
+    if args.group_by is not None and (args.state is not None or args.sketch or args.workers > 1 or
+                                      args.phase is not None or input_dir.endswith('.npz')):
+        print('>>> Segmented engagement maps are only built in memory from formatted dataset!')
+        print('>>> Exit...')
+        sys.exit(1)
+    if args.group_by is not None and output_path.endswith('.emap'):
+        print('>>> Segmented engagement maps are stored pickled only, use an output path not ending with .emap!')
+        print('>>> Exit...')
+        sys.exit(1)
+    if args.update and (args.state is None or not os.path.exists(args.state)):
+        print('>>> Engagement map state to update does not exist!')
+        print('>>> Exit...')
+        sys.exit(1)
+
+    if input_dir.endswith('.npz'):
+        # == == == == == == == == Part 2: Derive engagement map from histogram cube == == == == == == == == #
+        cube = HistogramCube.load(input_dir)
+        print('>>> Finish loading histogram cube of {0} videos in {1} buckets!'.format(len(cube), cube.bucket_number))
+        engagement_map, split_bins = cube.get_engagement_map(np.linspace(1, 5, args.bin_number), min_bin_size=50,
+                                                             percentile_number=args.percentile_number,
+                                                             categories=args.categories)
+        print('>>> Percentiles are within 0.5/{0} of the exact map except in {1} bins split inside a duration: {2}'
+              .format(cube.bucket_number, len(split_bins), split_bins))
+    elif args.workers > 1 or args.phase is not None:
+        # == == == == == == == == Part 2: Plan shards, count videos of each duration == == == == == == == == #
+        # shards are contiguous in input order, so shard i continues the duration ranks of shards before it
+        phase = args.phase or 'all'
+        work_dir = args.work_dir or output_path + '.work'
+        k = args.k if args.sketch else None
+        if phase in ['plan', 'all']:
+            if not os.path.exists(work_dir):
+                os.makedirs(work_dir)
+            shards = split_into_shards(list_input_files(input_dir), args.shards or args.workers)
+            with open(os.path.join(work_dir, 'shards.json'), 'w') as fout:
+                json.dump(shards, fout)
+            print('>>> Finish planning {0} shards in {1}!'.format(len(shards), work_dir))
+        num_shards = len(load_shards(work_dir))
+        shard_indices = range(num_shards) if args.shard is None else [args.shard]
+
+        pool = Pool(args.workers) if args.workers > 1 else None
+
+        def run_phase(name, func, *params):
+            jobs = [(func, work_dir, shard_idx) + params for shard_idx in shard_indices]
+            for shard_idx in (pool.imap_unordered(_shard_job, jobs) if pool is not None else map(_shard_job, jobs)):
+                print('>>> Finish {0} phase of shard {1}...'.format(name, shard_idx))
+
+        if phase in ['count', 'all']:
+            run_phase('count', count_shard)
+
+        # == == == == == == == == Part 3: Summarize wp of each shard into per-bin sketches == == == == == == == == #
+        if phase in ['summarize', 'all']:
+            run_phase('summarize', summarize_shard, k, 42)
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        # merge summaries of all shards, other phases leave their outputs in work dir for the next phase
+        engagement_map = None
+        if phase in ['reduce', 'all']:
+            engagement_map, rank_error_bounds = reduce_summaries(work_dir)
+            if args.sketch:
+                print('>>> Rank error bound of sketches, max: {0:.5f}, mean: {1:.5f}'
+                      .format(np.max(rank_error_bounds), np.mean(rank_error_bounds)))
+    elif args.sketch:
+        # == == == == == == == == Part 2: Count videos of each duration == == == == == == == == #
+        # bins only depend on duration counts, a second pass streams each video into the sketch of its bin
+        input_ranges = [(filepath, 0, os.path.getsize(filepath)) for filepath in list_input_files(input_dir)]
+        durations, counts = count_durations(iter_engagement_batches(input_ranges))
+        print('>>> Finish counting {0} videos of {1} durations!'.format(np.sum(counts), len(durations)))
+
+        # == == == == == == == == Part 3: Build wp sketches based on duration splits == == == == == == == == #
+        builder = EngagementMapBuilder(durations, np.linspace(1, 5, bin_number), counts=counts)
+        engagement_map, rank_error_bounds = builder.build_with_sketches(iter_engagement_batches(input_ranges),
+                                                                        min_bin_size=50, percentile_number=1000,
+                                                                        k=args.k, seed=42)
+        print('>>> Rank error bound of sketches, max: {0:.5f}, mean: {1:.5f}'
+              .format(np.max(rank_error_bounds), np.mean(rank_error_bounds)))
+    else:
+        # == == == == == == == == Part 2: Load dataset == == == == == == == == #
+        for subdir, _, files in os.walk(input_dir):
+            for f in files:
+                print('>>> Start to load data: {0}...'.format(os.path.join(subdir, f)))
+                get_engagement_stats_from_file(os.path.join(subdir, f), SEGMENT_COLUMNS.get(args.group_by))
+        print('>>> Finish loading all data!')
+
+        # == == == == == == == == Part 3: Build wp and wt matrices based on duration splits == == == == == == #
+        # get duration split point
+        even_split_points = np.linspace(1, 5, bin_number)
+        durations = np.array(duration_list)
+        wp30s = np.array(wp30_list)
+        wt30s = get_watch_times(durations, wp30s)
+
+        if args.state is not None:
+            # new videos go after the videos already in state, as if their files were loaded last
+            state = EngagementMapState.load(args.state) if args.update else EngagementMapState()
+            state.update(durations, wp30s)
+            state.save(args.state)
+            print('>>> Engagement map state of {0} videos saved to {1}'.format(len(state), args.state))
+            engagement_map = state.build(even_split_points, min_bin_size=50, percentile_number=1000)
+        else:
+            # sort by duration, put videos in bins of at least 50 videos
+            builder = EngagementMapBuilder(durations, even_split_points)
+            engagement_map = builder.build(wp30s, min_bin_size=50, percentile_number=1000, watch_times=wt30s)
 
-    # == == == == == == == == Part 2: Load dataset == == == == == == == == #
-    for subdir, _, files in os.walk(input_dir):
-        for f in files:
-            print('>>> Start to load data: {0}...'.format(os.path.join(subdir, f)))
-            get_engagement_stats_from_file(os.path.join(subdir, f))
-    print('>>> Finish loading all data!')
-
-    # == == == == == == == == Part 3: Build wp matrix based on duration splits == == == == == == == == #
-    # sort by duration in ascent order
-    sorted_duration_engagement_tuple = sorted(duration_engagement_tuple, key=lambda x: x[0])
-
-    # get duration split point
-    duration_list = sorted(duration_cnt_dict.keys())
-    even_split_points = list(np.linspace(1, 5, bin_number))
-
-    # put videos in correct bins
-    wp_bin_matrix = []
-    wp_individual_bin = []
-    wt_bin_matrix = []
-    wt_individual_bin = []
-    bin_idx = 0
-    duration_splits = []
-    # put dur-wp tuple in the correct bin
-    for duration, wp30, wt30 in sorted_duration_engagement_tuple:
-        if np.log10(duration) > even_split_points[bin_idx]:
-            bin_idx += 1
-            # must contains at least 50 videos
-            if len(wp_individual_bin) >= 50:
-                wp_bin_matrix.append(wp_individual_bin)
-                wp_individual_bin = []
-                wt_bin_matrix.append(wt_individual_bin)
-                wt_individual_bin = []
-                duration_splits.append(duration - 1)
-        wp_individual_bin.append(wp30)
-        wt_individual_bin.append(wt30)
-    if len(wp_individual_bin) > 0:
-        wp_bin_matrix.append(np.array(wp_individual_bin))
-        wt_bin_matrix.append(np.array(wt_individual_bin))
+        if args.group_by is not None:
+            # maps of segments are indexed by segment value inside the map of all videos
+            engagement_map['group_by'] = args.group_by
+            engagement_map['segments'] = build_segment_maps(durations, wp30s, np.array(segment_list),
+                                                            even_split_points, min_bin_size=50,
+                                                            percentile_number=1000, watch_times=wt30s)
+            print('>>> Finish building engagement maps of {0} segments by {1}!'
+                  .format(len(engagement_map['segments']), args.group_by))
 
     # == == == == == == == == Part 4: Store engagement map offline == == == == == == == == #
-    engagement_map = {'duration': duration_splits}
-    for i in range(len(duration_splits) + 1):
-        engagement_map[i] = [np.percentile(wp_bin_matrix[i], j / 10) for j in range(1000)]
-    pickle.dump(engagement_map, open(output_path, 'wb'))
+    if engagement_map is not None:
+        if output_path.endswith('.emap'):
+            save_engagement_map(engagement_map, output_path)
+        else:
+            pickle.dump(engagement_map, open(output_path, 'wb'))
 
     timer.stop()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Script to estimate how stable each percentile of the engagement map is, by bootstrap resampling of each bin.
+Bins are the same as extract_engagement_map.py, each bin is resampled with replacement, and the confidence interval
+of each percentile is taken over the resamples. Sparse bins, e.g., of long videos with barely 50 videos, get wide bands.
+Output is a npz file of duration splits and num_bins x 1000 matrices of lower and upper bounds.
+
+Usage: python extract_engagement_map_bootstrap.py -i ../data/formatted_tweeted_videos -o ../data/engagement_map_bootstrap.npz -b 1000 -w 8
+Time: ~6M, ~2M with 8 workers
+"""
+
+import sys, os, argparse
+import numpy as np
+from multiprocessing import Pool
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
+from utils.helper import Timer
+from utils.engagement_map_builder import EngagementMapBuilder
+
+
+def get_engagement_stats_from_file(filepath):
+    with open(filepath, 'r') as fin:
+        fin.readline()
+        for line in fin:
+            _, _, duration, _, _, _, _, _, view, _, wp30, _ = line.split('\t', 11)
+            duration_list.append(int(duration))
+            wp30_list.append(float(wp30))
+
+
+if __name__ == '__main__':
+    # == == == == == == == == Part 1: Set up experiment parameters == == == == == == == == #
+    print('>>> Start to bootstrap engagement map...')
+    timer = Timer()
+    timer.start()
+
+    bin_number = 1000
+    duration_list = []
+    wp30_list = []
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input', help='input file dir of formatted dataset', required=True)
+    parser.add_argument('-o', '--output', help='output file path of confidence bands, ends with .npz', required=True)
+    parser.add_argument('-b', '--resamples', help='number of bootstrap resamples of each bin, default 1000', type=int,
+                        default=1000)
+    parser.add_argument('-c', '--confidence', help='confidence level of the bands, default 0.95', type=float,
+                        default=0.95)
+    parser.add_argument('-w', '--workers', help='number of worker processes to spread bins across, default 1',
+                        type=int, default=1)
+    args = parser.parse_args()
+
+    input_dir = args.input
+    output_path = args.output
+
+    if not os.path.exists(input_dir):
+        print('>>> Input file dir does not exist!')
+        print('>>> Exit...')
+        sys.exit(1)
+
+    # == == == == == == == == Part 2: Load dataset == == == == == == == == #
+    for subdir, _, files in os.walk(input_dir):
+        for f in files:
+            print('>>> Start to load data: {0}...'.format(os.path.join(subdir, f)))
+            get_engagement_stats_from_file(os.path.join(subdir, f))
+    print('>>> Finish loading all data!')
+
+    # == == == == == == == == Part 3: Bootstrap percentiles of each bin == == == == == == == == #
+    builder = EngagementMapBuilder(np.array(duration_list), np.linspace(1, 5, bin_number))
+    pool = Pool(args.workers) if args.workers > 1 else None
+    duration_splits, lower_bounds, upper_bounds = builder.bootstrap(np.array(wp30_list), min_bin_size=50,
+                                                                    percentile_number=1000,
+                                                                    num_resample=args.resamples,
+                                                                    confidence=args.confidence, seed=42, pool=pool)
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    # widest band of each bin, over the 1st to 99th percentiles where bands are meaningful
+    band_widths = np.max((upper_bounds - lower_bounds)[:, 10: 991], axis=1)
+    bin_sizes = np.diff(builder.get_bin_offsets(min_bin_size=50))
+    print('>>> Widest {0:.0%} confidence band in a bin, max: {1:.4f}, mean: {2:.4f}, median: {3:.4f}'
+          .format(args.confidence, np.max(band_widths), np.mean(band_widths), np.median(band_widths)))
+    for bin_idx in np.argsort(band_widths)[::-1][:5]:
+        print('>>> Bin {0}, {1} videos, widest band: {2:.4f}'.format(bin_idx, bin_sizes[bin_idx], band_widths[bin_idx]))
+
+    # == == == == == == == == Part 4: Store confidence bands offline == == == == == == == == #
+    np.savez(output_path, duration=np.array(duration_splits), lower=lower_bounds, upper=upper_bounds,
+             confidence=args.confidence, resamples=args.resamples)
+
+    timer.stop()
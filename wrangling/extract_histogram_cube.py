@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Script to count videos by category, duration and watch percentage bucket from given formatted dataset.
+Engagement maps of any bin number, percentile number or categories are then derived from the cube in a second,
+refer to extract_engagement_map.py with the cube as input.
+
+Usage: python extract_histogram_cube.py -i ../data/formatted_tweeted_videos -o ../data/histogram_cube.npz
+Time: ~8M
+"""
+
+import sys, os, argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
+from utils.helper import Timer, iter_batches
+from utils.histogram_cube import HistogramCube
+
+
+if __name__ == '__main__':
+    # == == == == == == == == Part 1: Set up experiment parameters == == == == == == == == #
+    print('>>> Start to extract histogram cube...')
+    timer = Timer()
+    timer.start()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input', help='input file dir of formatted dataset', required=True)
+    parser.add_argument('-o', '--output', help='output file path of histogram cube, ends with .npz', required=True)
+    parser.add_argument('-b', '--buckets', help='number of watch percentage buckets, percentiles of derived maps are '
+                                                'within 0.5/buckets in bins whose boundaries fall between durations, '
+                                                'default 10000', type=int, default=10000)
+    args = parser.parse_args()
+
+    input_dir = args.input
+    output_path = args.output
+
+    if not os.path.exists(input_dir):
+        print('>>> Input file dir does not exist!')
+        print('>>> Exit...')
+        sys.exit(1)
+
+    # == == == == == == == == Part 2: Count videos in batches == == == == == == == == #
+    cube = HistogramCube(args.buckets)
+    for subdir, _, files in os.walk(input_dir):
+        for f in files:
+            print('>>> Start to load data: {0}...'.format(os.path.join(subdir, f)))
+            with open(os.path.join(subdir, f), 'r') as fin:
+                fin.readline()
+                for lines in iter_batches(fin, 100000):
+                    durations = []
+                    categories = []
+                    wp30s = []
+                    for line in lines:
+                        _, _, duration, _, category, _, _, _, _, _, wp30, _ = line.split('\t', 11)
+                        durations.append(int(duration))
+                        categories.append(category)
+                        wp30s.append(float(wp30))
+                    cube.update(np.array(durations), np.array(wp30s), categories)
+    print('>>> Finish counting {0} videos in {1} cells of {2} categories!'
+          .format(len(cube), len(cube.keys), len(cube.categories)))
+
+    # == == == == == == == == Part 3: Store histogram cube offline == == == == == == == == #
+    cube.save(output_path)
+
+    timer.stop()
@@ -7,13 +7,44 @@ Test: 2016-08-21 to 2016-08-31
 
 Usage: python split_dataset_and_append_relative_engagement.py -i ../data/formatted_tweeted_videos -o ../engagement_prediction
 Time: ~15M
+
+Target: split the partitioned dataset written by construct_formatted_dataset.py --partition, only partitions are listed
+and no publish date is compared, records of one output file are ordered by publish date instead of crawl order
+Usage: python split_dataset_and_append_relative_engagement.py -i ../data/partitioned_tweeted_videos -o ../engagement_prediction -p
+Time: ~15M
 """
 
 import os, sys, pickle, argparse
+import numpy as np
+from collections import defaultdict
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
-from utils.helper import Timer
-from utils.converter import to_relative_engagement
+from utils.helper import Timer, iter_batches
+from utils.converter import to_relative_engagement_array, get_lookup_matrix
+from utils.partition import select_partitions
+
+
+def write_header(fout):
+    fout.write('{0}\t{1}\t{2}\t{3}\t{4}\t{5}\t{6}\t{7}\t{8}\t{9}\t{10}\t{11}\t{12}\t{13}\t{14}\n'
+               .format('id', 'publish', 'duration', 'definition', 'category', 'detect_lang', 'channel', 'topics',
+                       'view30', 'watch30', 'wp30', 're30', 'days', 'daily_view', 'daily_watch'))
+
+
+def append_relative_engagement(lines):
+    """ Insert relative engagement after wp30 of a batch of formatted records.
+    :param lines: formatted records, each ends with a newline
+    :return: list of formatted records with re30, and their publish dates
+    """
+    line_contents = [line.rstrip().split('\t') for line in lines]
+    durations = np.array([int(line_content[2]) for line_content in line_contents])
+    wp30s = np.array([float(line_content[10]) for line_content in line_contents])
+    re30s = to_relative_engagement_array(lookup_table=engagement_map, durations=durations, wp_scores=wp30s,
+                                         lookup_keys=split_keys, lookup_matrix=lookup_matrix)
+    records = []
+    for line, line_content, re30 in zip(lines, line_contents, re30s):
+        head, days, daily_view, daily_watch = line.rsplit('\t', 3)
+        records.append(('{0}\t{1}\t{2}\t{3}\t{4}'.format(head, re30, days, daily_view, daily_watch), line_content[1]))
+    return records
 
 
 def extract_info(input_path, output_loc):
@@ -23,33 +54,39 @@ def extract_info(input_path, output_loc):
     :return:
     """
     f_train = open(os.path.join(output_loc, 'train_data', os.path.basename(input_path)), 'w')
-    f_train.write('{0}\t{1}\t{2}\t{3}\t{4}\t{5}\t{6}\t{7}\t{8}\t{9}\t{10}\t{11}\t{12}\t{13}\t{14}\n'
-                  .format('id', 'publish', 'duration', 'definition', 'category', 'detect_lang', 'channel', 'topics',
-                          'view30', 'watch30', 'wp30', 're30', 'days', 'daily_view', 'daily_watch'))
+    write_header(f_train)
     f_test = open(os.path.join(output_loc, 'test_data', os.path.basename(input_path)), 'w')
-    f_test.write('{0}\t{1}\t{2}\t{3}\t{4}\t{5}\t{6}\t{7}\t{8}\t{9}\t{10}\t{11}\t{12}\t{13}\t{14}\n'
-                 .format('id', 'publish', 'duration', 'definition', 'category', 'detect_lang', 'channel', 'topics',
-                         'view30', 'watch30', 'wp30', 're30', 'days', 'daily_view', 'daily_watch'))
+    write_header(f_test)
 
     with open(input_path, 'r') as fin:
         fin.readline()
-        for line in fin:
-            head, days, daily_view, daily_watch = line.rsplit('\t', 3)
-            line_content = line.rstrip().split('\t')
-            published_at = line_content[1]
-            duration = int(line_content[2])
-            wp30 = float(line_content[10])
-            re30 = to_relative_engagement(lookup_table=engagement_map, duration=duration, wp_score=wp30, lookup_keys=split_keys)
-
-            if published_at < '2016-08-21':
-                f_train.write('{0}\t{1}\t{2}\t{3}\t{4}'.format(head, re30, days, daily_view, daily_watch))
-            else:
-                f_test.write('{0}\t{1}\t{2}\t{3}\t{4}'.format(head, re30, days, daily_view, daily_watch))
+        for lines in iter_batches(fin, 100000):
+            for record, published_at in append_relative_engagement(lines):
+                if published_at < split_date:
+                    f_train.write(record)
+                else:
+                    f_test.write(record)
 
     f_train.close()
     f_test.close()
 
 
+def extract_partitions(partition_paths, output_path):
+    """ Append relative engagement to selected partitions of formatted TWEETED VIDEOS dataset
+    :param partition_paths: partition file paths, all records are written
+    :param output_path: output file path
+    :return:
+    """
+    with open(output_path, 'w') as fout:
+        write_header(fout)
+        for partition_path in partition_paths:
+            with open(partition_path, 'r') as fin:
+                fin.readline()
+                for lines in iter_batches(fin, 100000):
+                    for record, _ in append_relative_engagement(lines):
+                        fout.write(record)
+
+
 if __name__ == '__main__':
     # == == == == == == == == Part 1: Set up experiment parameters == == == == == == == == #
     # setting parameters
@@ -66,24 +103,42 @@ if __name__ == '__main__':
     # load engagement map
     engagement_map = pickle.load(open(engagement_map_path, 'rb'))
     split_keys = engagement_map['duration']
+    lookup_matrix = get_lookup_matrix(engagement_map, split_keys)
 
     parser = argparse.ArgumentParser()
     parser.add_argument('-i', '--input', help='input file dir of formatted TWEETED VIDEOS dataset', required=True)
     parser.add_argument('-o', '--output', help='output file dir of train/test split', required=True)
+    parser.add_argument('-p', '--partitioned', help='input is partitioned by publish date and category',
+                        action='store_true')
+    parser.add_argument('-s', '--split', help='first publish date of test dataset, default 2016-08-21',
+                        default='2016-08-21')
     args = parser.parse_args()
 
     input_dir = args.input
     output_dir = args.output
+    split_date = args.split
 
     if not os.path.exists(os.path.join(output_dir, 'train_data')):
         os.makedirs(os.path.join(output_dir, 'train_data'))
         os.makedirs(os.path.join(output_dir, 'test_data'))
 
     # == == == == == == == == Part 3: Construct dataset == == == == == == == == #
-    for subdir, _, files in os.walk(input_dir):
-        for f in files:
-            print('>>> Start to extract file {0}...'.format(os.path.join(subdir, f)))
-            extract_info(os.path.join(subdir, f), output_dir)
+    if args.partitioned:
+        # train and test partitions are selected by their dir names, grouped by the formatted file they come from
+        for split_name, partition_paths in [('train_data', select_partitions(input_dir, end=split_date)),
+                                            ('test_data', select_partitions(input_dir, start=split_date))]:
+            paths_by_name = defaultdict(list)
+            for partition_path in partition_paths:
+                paths_by_name[os.path.basename(partition_path)].append(partition_path)
+            for name, paths in sorted(paths_by_name.items()):
+                print('>>> Start to extract {0} partitions of file {1} into {2}...'
+                      .format(len(paths), name, split_name))
+                extract_partitions(paths, os.path.join(output_dir, split_name, name))
+    else:
+        for subdir, _, files in os.walk(input_dir):
+            for f in files:
+                print('>>> Start to extract file {0}...'.format(os.path.join(subdir, f)))
+                extract_info(os.path.join(subdir, f), output_dir)
     print('>>> Finish extracting all files!')
 
     timer.stop()